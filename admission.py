@@ -0,0 +1,77 @@
+"""Per-client rate limits and load shedding.
+
+Every request belongs to a route class (search, stream, playlist, ...).
+RateLimiter keeps a token bucket per (route class, client): a bucket holds up
+to `burst` tokens, refills at `rate` tokens per second and each request takes
+one, so a client can burst briefly but not sustain more than `rate`.
+
+Gate counts work in progress (busy request threads, open proxied streams)
+against a limit; acquire() never waits, so a full gate turns into an
+immediate 503 instead of a queue that holds every thread of the worker.
+
+Both are per process: with N gunicorn workers a client can get up to N times
+the configured rate, and each worker sheds load on its own threads.
+"""
+from collections import OrderedDict
+import math
+import threading
+import time
+
+
+def parse_rate(value):
+    """(rate per second, burst) from a 'rate/burst' (or 'rate') setting; None if disabled"""
+    rate, _, burst = str(value).partition('/')
+    rate = float(rate or 0)
+    if rate <= 0:
+        return None
+    return rate, max(1.0, float(burst) if burst else rate)
+
+
+class RateLimiter:
+    def __init__(self, limits, max_clients=10000):
+        self.limits = {route_class: limit for route_class, limit in limits.items() if limit}
+        self.max_clients = max_clients  # least recently seen clients are forgotten beyond this
+        self._buckets = OrderedDict()   # (route class, client) -> (tokens, last refill)
+        self._lock = threading.Lock()
+
+    def hit(self, route_class, client):
+        """Take a token; 0 if allowed, otherwise the seconds until one is available"""
+        limit = self.limits.get(route_class)
+        if limit is None:
+            return 0
+        rate, burst = limit
+        key = (route_class, client)
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else max(1, math.ceil((1 - tokens) / rate))
+
+
+class Gate:
+    """Non-blocking counter of work in progress; limit 0 means unlimited"""
+
+    def __init__(self, limit):
+        if limit < 0:
+            raise ValueError(f"gate limit must be 0 (unlimited) or positive, not {limit}")
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, force=False):
+        """Take a slot; False (and no slot) if the gate is full, unless force"""
+        with self._lock:
+            if self.limit and self.active >= self.limit and not force:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, jsonify, send_from_directory, request
+from flask import Flask, render_template, jsonify, send_from_directory, request, g
 from flask_cors import CORS
 import os
 import urllib.parse
@@ -8,30 +8,148 @@ from mutagen.mp3 import MP3
 from mutagen.id3 import ID3, TIT2, TPE1, TALB, TDRC, TYER, ID3NoHeaderError
 import sqlite3
 import jwt
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 from functools import wraps
+from song_store import SongStore
+from logging_config import setup_logging, SAMPLED
+import logging
+import metrics
+import profiling
+import artwork
+import waveform
+import loudness
+import dedupe
+import hls
+import gapless
+from passwords import PasswordHasher, PasswordHasherBusy
+import play_events
+import popularity
+import radio
+import admission
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import gzip
+import uuid
+import hashlib
+import fcntl
+import mimetypes
+import re
+import shutil
+import hmac
+import atexit
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is used instead
+    brotli = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Serialize responses with orjson when it is installed"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, option=option).decode('utf-8')
+        except TypeError:
+            # Types orjson does not know (sets, dates...) go through Flask's encoder
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+logger = setup_logging(on_drop=metrics.LOG_RECORDS_DROPPED.inc)
 CORS(app)  # Enable CORS for React frontend
 
 # Configuration
-SONGS_FOLDER = 'static/songs'
+SONGS_FOLDER = os.environ.get('SONGS_FOLDER') or os.path.join(app.static_folder, 'songs')
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'ogg'}
+MAX_BATCH_IDS = 200  # ids accepted by /api/songs/batch
+
+# Response compression
+COMPRESS_MIN_SIZE = 1024  # bytes; smaller bodies are sent as-is
+COMPRESS_MIMETYPES = {'application/json'}
+RESPONSE_CACHE_SIZE = 64  # serialized + compressed bodies kept per worker
 
 
 # JioSaavn API endpoint (unofficial public API)
-JIOSAAVN_API_BASE = 'https://saavn.dev/api'
+JIOSAAVN_API_BASE = os.environ.get('JIOSAAVN_API_BASE', 'https://saavn.dev/api')
 
 # JWT secret key (should be in env in production)
 JWT_SECRET = 'supersecretkey'
 JWT_ALGO = 'HS256'
 JWT_EXP_DELTA_SECONDS = 7 * 24 * 3600  # 7 days
-
-DB_PATH = 'music_app.db'
+AUTH_CACHE_SIZE = 10000  # verified tokens remembered per worker
+# How long a verified token is trusted without re-checking it; also the
+# longest a revocation takes to reach the other workers
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 60))
+
+DB_PATH = os.environ.get('DB_PATH', 'music_app.db')
+
+# Password hashing runs on a bounded pool (see passwords.py). Changing the
+# method upgrades existing hashes transparently on each user's next login.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # concurrent hashes per process
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))  # waiting beyond this gets a 503
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 30))  # seconds; longer waits get a 503
+
+# Failed logins allowed per window, per account and per client IP
+LOGIN_THROTTLE_WINDOW = int(os.environ.get('LOGIN_THROTTLE_WINDOW', 300))  # seconds
+LOGIN_ACCOUNT_LIMIT = int(os.environ.get('LOGIN_ACCOUNT_LIMIT', 5))
+LOGIN_IP_LIMIT = int(os.environ.get('LOGIN_IP_LIMIT', 20))
+
+# Play/skip events are buffered per process and written in bulk (see
+# play_events.py); a crash loses at most EVENTS_FLUSH_INTERVAL seconds of them
+EVENTS_FLUSH_INTERVAL = float(os.environ.get('EVENTS_FLUSH_INTERVAL', 2))
+EVENTS_FLUSH_SIZE = int(os.environ.get('EVENTS_FLUSH_SIZE', 1000))  # flush early once this many wait
+EVENTS_MAX_BATCH = 500  # events accepted per /api/events request
+EVENTS_MAX_AGE = 7 * 24 * 3600  # older client timestamps are replaced by the arrival time
+EVENTS_MAX_POSITION = 24 * 3600  # seconds; larger playback positions are rejected
+
+# Popular-song rankings (see popularity.py) are recomputed in the background
+# this often, per process; requests only ever read the precomputed lists
+POPULAR_REFRESH_INTERVAL = int(os.environ.get('POPULAR_REFRESH_INTERVAL', 60))  # seconds
+POPULAR_TOP_N = 200  # songs kept per window
+POPULAR_UNRESOLVED_TTL = 600  # seconds before a ranked id that did not resolve is looked up again
+# Playlist co-occurrence neighbors for /api/songs/<id>/radio (see radio.py)
+RADIO_REFRESH_INTERVAL = int(os.environ.get('RADIO_REFRESH_INTERVAL', 60))  # seconds
+
+# Per-client token buckets by route class (see admission.py): RATE_LIMIT_<CLASS>
+# is 'rate/burst' in requests per second, 0 disables a class, RATE_LIMITS=0 all
+RATE_LIMITS_ENABLED = os.environ.get('RATE_LIMITS', '1') != '0'
+RATE_LIMIT_DEFAULTS = {
+    'stream': '10/60',  # HLS players fetch segments ahead in bursts
+    'search': '5/20',
+    'events': '2/10',
+    'playlist': '10/50',
+    'auth': '5/20',
+    'default': '20/100',
+}
+RATE_LIMIT_CLIENTS = 10000  # buckets kept per worker
+# Once this many threads of a worker are busy, requests other than auth and
+# playlist ones are turned away with a 503 (0 disables); the spare threads
+# keep logins and playlists responsive while streams and searches pile up
+ADMISSION_LIMIT = int(os.environ.get('ADMISSION_LIMIT', max(1, int(os.environ.get('GUNICORN_THREADS', 8)) - 2)))
+MAX_PROXY_STREAMS = int(os.environ.get('MAX_PROXY_STREAMS', 4))  # concurrent /proxy/audio per worker, 0 = unlimited
+SHED_RETRY_AFTER = 1  # seconds, for 503s
+
+# Admin endpoints (profiling) are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
 
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=metrics.TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -45,6 +163,10 @@ def init_db():
         user_id TEXT NOT NULL UNIQUE,
         password TEXT NOT NULL
     )''')
+    # Bumped to revoke every token issued to the user (see revoke_tokens)
+    columns = [row['name'] for row in c.execute('PRAGMA table_info(user)')]
+    if 'token_version' not in columns:
+        c.execute('ALTER TABLE user ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0')
     # Playlist table
     c.execute('''CREATE TABLE IF NOT EXISTS playlist (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -60,25 +182,118 @@ def init_db():
         song_title TEXT NOT NULL,
         FOREIGN KEY(playlist_id) REFERENCES playlist(id)
     )''')
+    # When the song was added (ms), for the popular-songs ranking; NULL for older rows
+    columns = [row['name'] for row in c.execute('PRAGMA table_info(playlistsong)')]
+    if 'added_at' not in columns:
+        c.execute('ALTER TABLE playlistsong ADD COLUMN added_at INTEGER')
+    c.execute('CREATE INDEX IF NOT EXISTS playlistsong_added_at ON playlistsong (added_at)')
+    # Playback history, plus per-track and per-day rollups kept up to date by
+    # each flush of the event buffer
+    c.execute('''CREATE TABLE IF NOT EXISTS play_event (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        song_id TEXT NOT NULL,
+        event TEXT NOT NULL,
+        position_ms INTEGER,
+        played_at INTEGER NOT NULL
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS play_event_played_at ON play_event (played_at)')
+    c.execute('''CREATE TABLE IF NOT EXISTS track_stats (
+        song_id TEXT PRIMARY KEY,
+        plays INTEGER NOT NULL,
+        skips INTEGER NOT NULL,
+        last_played INTEGER NOT NULL
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS track_daily (
+        song_id TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        plays INTEGER NOT NULL,
+        skips INTEGER NOT NULL,
+        PRIMARY KEY (song_id, day)
+    )''')
+    # Failed-login counters, shared by all workers (see throttle_retry_after)
+    c.execute('''CREATE TABLE IF NOT EXISTS auth_throttle (
+        key TEXT PRIMARY KEY,
+        failures INTEGER NOT NULL,
+        window_start REAL NOT NULL
+    )''')
     conn.commit()
     conn.close()
 
 init_db()
 
 # --- JWT Auth Helpers ---
-def create_jwt(user_id):
+# Tokens carry the internal user row id (uid), the default playlist id (pid)
+# and the user's token version (tv), so authenticated requests need neither a
+# user lookup nor a playlist join. Verified tokens are kept in a small LRU,
+# which also skips signature verification on repeat requests.
+def create_jwt(user_id, user_db_id, playlist_id, token_version=0):
     payload = {
         'user_id': user_id,
+        'uid': user_db_id,
+        'pid': playlist_id,
+        'tv': token_version,
         'exp': datetime.utcnow() + timedelta(seconds=JWT_EXP_DELTA_SECONDS)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGO)
 
-def decode_jwt(token):
+_auth_cache = OrderedDict()
+_auth_cache_lock = threading.Lock()
+
+def _verify_jwt(token):
+    """Check signature, expiry and token version; returns the claims or None"""
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGO])
-        return payload['user_id']
-    except Exception:
+    except jwt.InvalidTokenError:
+        return None
+    conn = get_db()
+    try:
+        if 'uid' in payload:
+            row = conn.execute('SELECT id, token_version FROM user WHERE id = ?', (payload['uid'],)).fetchone()
+            playlist_id = payload.get('pid')
+        else:
+            # Token issued before uid/pid claims existed
+            row = conn.execute('SELECT id, token_version FROM user WHERE user_id = ?',
+                               (payload.get('user_id'),)).fetchone()
+            playlist = row and conn.execute('SELECT id FROM playlist WHERE user_id = ? LIMIT 1',
+                                            (row['id'],)).fetchone()
+            playlist_id = playlist['id'] if playlist else None
+    finally:
+        conn.close()
+    if not row or row['token_version'] != payload.get('tv', 0):
         return None
+    return {'user_id': payload['user_id'], 'uid': row['id'], 'pid': playlist_id, 'exp': payload['exp']}
+
+def decode_jwt(token):
+    """Claims of a valid token ({'user_id', 'uid', 'pid', 'exp'}) or None"""
+    now = time.time()
+    with _auth_cache_lock:
+        entry = _auth_cache.get(token)
+        if entry is not None and entry[0] > now:
+            _auth_cache.move_to_end(token)
+        else:
+            entry = None
+    metrics.cache_lookup('auth_tokens', entry is not None)
+    if entry is not None:
+        return entry[1]
+    claims = _verify_jwt(token)
+    if claims is not None:
+        with _auth_cache_lock:
+            _auth_cache[token] = (min(claims['exp'], now + AUTH_CACHE_TTL), claims)
+            while len(_auth_cache) > AUTH_CACHE_SIZE:
+                _auth_cache.popitem(last=False)
+    return claims
+
+def revoke_tokens(user_db_id):
+    """Invalidate every token issued to a user so far"""
+    conn = get_db()
+    conn.execute('UPDATE user SET token_version = token_version + 1 WHERE id = ?', (user_db_id,))
+    conn.commit()
+    conn.close()
+    # Immediate in this worker; other workers notice within AUTH_CACHE_TTL
+    with _auth_cache_lock:
+        for token in [t for t, (_, claims) in _auth_cache.items() if claims['uid'] == user_db_id]:
+            del _auth_cache[token]
 
 def login_required(f):
     @wraps(f)
@@ -87,13 +302,70 @@ def login_required(f):
         if not auth or not auth.startswith('Bearer '):
             return jsonify({'error': 'Missing or invalid token'}), 401
         token = auth.split(' ')[1]
-        user_id = decode_jwt(token)
-        if not user_id:
+        claims = decode_jwt(token)
+        if not claims:
             return jsonify({'error': 'Invalid or expired token'}), 401
-        request.user_id = user_id
+        request.user_id = claims['user_id']
+        request.user_db_id = claims['uid']
+        request.playlist_id = claims['pid']
         return f(*args, **kwargs)
     return decorated
 
+def is_admin_request():
+    token = request.headers.get('X-Admin-Token')
+    return bool(ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN))
+
+def admin_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin endpoints are disabled'}), 404
+        if not is_admin_request():
+            return jsonify({'error': 'Missing or invalid admin token'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+# --- Password hashing and login throttling ---
+password_hasher = PasswordHasher(PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS,
+                                 queue_size=PASSWORD_HASH_QUEUE, timeout=PASSWORD_HASH_TIMEOUT)
+
+def hasher_busy_response():
+    response = jsonify({'error': 'Server busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def throttle_keys(user_id):
+    return [(f"account:{user_id}", LOGIN_ACCOUNT_LIMIT), (f"ip:{request.remote_addr}", LOGIN_IP_LIMIT)]
+
+def throttle_retry_after(conn, keys):
+    """Seconds until a login may be attempted again (0 if not throttled)"""
+    now = time.time()
+    retry_after = 0
+    for key, limit in keys:
+        row = conn.execute('SELECT failures, window_start FROM auth_throttle WHERE key = ?', (key,)).fetchone()
+        if row and row['failures'] >= limit and now - row['window_start'] < LOGIN_THROTTLE_WINDOW:
+            retry_after = max(retry_after, int(row['window_start'] + LOGIN_THROTTLE_WINDOW - now) + 1)
+    return retry_after
+
+def record_login_failure(conn, keys):
+    now = time.time()
+    for key, _ in keys:
+        # Start a new window when the previous one has expired
+        conn.execute('''INSERT INTO auth_throttle (key, failures, window_start) VALUES (?, 1, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                failures = CASE WHEN ? - window_start >= ? THEN 1 ELSE failures + 1 END,
+                window_start = CASE WHEN ? - window_start >= ? THEN ? ELSE window_start END''',
+            (key, now, now, LOGIN_THROTTLE_WINDOW, now, LOGIN_THROTTLE_WINDOW, now))
+    conn.execute('DELETE FROM auth_throttle WHERE window_start < ?', (now - LOGIN_THROTTLE_WINDOW,))
+    conn.commit()
+
+def throttled_response(retry_after):
+    response = jsonify({'error': 'Too many failed attempts, try again later'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
 # --- User Endpoints ---
 @app.route('/register', methods=['POST'])
 def register():
@@ -107,9 +379,19 @@ def register():
     c = conn.cursor()
     c.execute('SELECT id FROM user WHERE user_id = ?', (user_id,))
     if c.fetchone():
+        conn.close()
+        return jsonify({'error': 'User ID already exists'}), 400
+    try:
+        hashed = password_hasher.hash(password)
+    except PasswordHasherBusy:
+        conn.close()
+        return hasher_busy_response()
+    try:
+        c.execute('INSERT INTO user (username, user_id, password) VALUES (?, ?, ?)', (username, user_id, hashed))
+    except sqlite3.IntegrityError:
+        # Registered by a concurrent request while we were hashing
+        conn.close()
         return jsonify({'error': 'User ID already exists'}), 400
-    hashed = generate_password_hash(password)
-    c.execute('INSERT INTO user (username, user_id, password) VALUES (?, ?, ?)', (username, user_id, hashed))
     user_db_id = c.lastrowid
     # Create default playlist for user
     default_playlist_name = f"{username} - playlist"
@@ -126,21 +408,47 @@ def login():
     if not user_id or not password:
         return jsonify({'error': 'Missing fields'}), 400
     conn = get_db()
+    keys = throttle_keys(user_id)
+    retry_after = throttle_retry_after(conn, keys)
+    if retry_after:
+        conn.close()
+        return throttled_response(retry_after)
     c = conn.cursor()
-    c.execute('SELECT id, password FROM user WHERE user_id = ?', (user_id,))
+    c.execute('SELECT id, password, token_version FROM user WHERE user_id = ?', (user_id,))
     row = c.fetchone()
-    if not row or not check_password_hash(row['password'], password):
+    try:
+        valid, upgraded_hash = password_hasher.verify(row['password'], password) if row else (False, None)
+    except PasswordHasherBusy:
+        conn.close()
+        return hasher_busy_response()
+    if not valid:
+        record_login_failure(conn, keys)
+        conn.close()
         return jsonify({'error': 'Invalid credentials'}), 401
-    token = create_jwt(user_id)
+    if upgraded_hash:
+        c.execute('UPDATE user SET password = ? WHERE id = ?', (upgraded_hash, row['id']))
+        conn.commit()
+    c.execute('SELECT id FROM playlist WHERE user_id = ? LIMIT 1', (row['id'],))
+    playlist = c.fetchone()
+    conn.close()
+    token = create_jwt(user_id, row['id'], playlist['id'] if playlist else None, row['token_version'])
     return jsonify({'token': token})
 
+@app.route('/logout', methods=['POST'])
+@login_required
+def logout():
+    """Revoke all of the user's tokens (every device)"""
+    revoke_tokens(request.user_db_id)
+    return jsonify({'message': 'Logged out'})
+
 @app.route('/me', methods=['GET'])
 @login_required
 def me():
     conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT id, username, user_id FROM user WHERE user_id = ?', (request.user_id,))
+    c.execute('SELECT id, username, user_id FROM user WHERE id = ?', (request.user_db_id,))
     row = c.fetchone()
+    conn.close()
     if not row:
         return jsonify({'error': 'User not found'}), 404
     return jsonify({'id': row['id'], 'username': row['username'], 'user_id': row['user_id']})
@@ -154,15 +462,12 @@ def create_playlist():
 @app.route('/playlists', methods=['GET'])
 @login_required
 def get_playlists():
+    if request.playlist_id is None:
+        return jsonify({'playlists': []})
     conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT id FROM user WHERE user_id = ?', (request.user_id,))
-    user_row = c.fetchone()
-    if not user_row:
-        return jsonify({'error': 'User not found'}), 404
-    user_db_id = user_row['id']
     # Only return the default playlist
-    c.execute('SELECT id, name FROM playlist WHERE user_id = ? LIMIT 1', (user_db_id,))
+    c.execute('SELECT id, name FROM playlist WHERE id = ?', (request.playlist_id,))
     row = c.fetchone()
     playlists = [{'id': row['id'], 'name': row['name']}] if row else []
     conn.close()
@@ -176,15 +481,14 @@ def add_song_to_playlist(playlist_id):
     song_title = data.get('song_title')
     if not song_id or not song_title:
         return jsonify({'error': 'Missing song_id or song_title'}), 400
+    # The user's default playlist, from the token
+    playlist_id = request.playlist_id
+    if playlist_id is None:
+        return jsonify({'error': 'Default playlist not found for user'}), 404
     conn = get_db()
     c = conn.cursor()
-    # Find user's default playlist
-    c.execute('SELECT p.id FROM playlist p JOIN user u ON p.user_id = u.id WHERE u.user_id = ? LIMIT 1', (request.user_id,))
-    row = c.fetchone()
-    if not row:
-        return jsonify({'error': 'Default playlist not found for user'}), 404
-    playlist_id = row['id']
-    c.execute('INSERT INTO playlistsong (playlist_id, song_id, song_title) VALUES (?, ?, ?)', (playlist_id, song_id, song_title))
+    c.execute('INSERT INTO playlistsong (playlist_id, song_id, song_title, added_at) VALUES (?, ?, ?, ?)',
+              (playlist_id, song_id, song_title, int(time.time() * 1000)))
     conn.commit()
     conn.close()
     return jsonify({'message': 'Song added'})
@@ -192,14 +496,12 @@ def add_song_to_playlist(playlist_id):
 @app.route('/playlists/<int:playlist_id>/songs', methods=['GET'])
 @login_required
 def get_playlist_songs(playlist_id):
+    # The user's default playlist, from the token
+    playlist_id = request.playlist_id
+    if playlist_id is None:
+        return jsonify({'error': 'Default playlist not found for user'}), 404
     conn = get_db()
     c = conn.cursor()
-    # Find user's default playlist
-    c.execute('SELECT p.id FROM playlist p JOIN user u ON p.user_id = u.id WHERE u.user_id = ? LIMIT 1', (request.user_id,))
-    row = c.fetchone()
-    if not row:
-        return jsonify({'error': 'Default playlist not found for user'}), 404
-    playlist_id = row['id']
     c.execute('SELECT id, song_id, song_title FROM playlistsong WHERE playlist_id = ?', (playlist_id,))
     songs = [{'id': row['id'], 'song_id': row['song_id'], 'song_title': row['song_title']} for row in c.fetchall()]
     conn.close()
@@ -208,122 +510,495 @@ def get_playlist_songs(playlist_id):
 @app.route('/playlists/<int:playlist_id>/songs/<int:song_db_id>', methods=['DELETE'])
 @login_required
 def remove_song_from_playlist(playlist_id, song_db_id):
+    # The user's default playlist, from the token
+    playlist_id = request.playlist_id
+    if playlist_id is None:
+        return jsonify({'error': 'Default playlist not found for user'}), 404
     conn = get_db()
     c = conn.cursor()
-    # Find user's default playlist
-    c.execute('SELECT p.id FROM playlist p JOIN user u ON p.user_id = u.id WHERE u.user_id = ? LIMIT 1', (request.user_id,))
-    row = c.fetchone()
-    if not row:
-        return jsonify({'error': 'Default playlist not found for user'}), 404
-    playlist_id = row['id']
     c.execute('DELETE FROM playlistsong WHERE id = ? AND playlist_id = ?', (song_db_id, playlist_id))
     conn.commit()
     conn.close()
     return jsonify({'message': 'Song removed'})
 
+# --- Play events ---
+event_buffer = play_events.EventBuffer(get_db, flush_size=EVENTS_FLUSH_SIZE)
+_events = {'pid': None}
+_events_lock = threading.Lock()
+
+def flush_events():
+    try:
+        written, dropped = event_buffer.flush()
+        metrics.PLAY_EVENTS.labels('written').inc(written)
+        if dropped:
+            metrics.PLAY_EVENTS.labels('dropped').inc(dropped)
+            logger.warning("Dropped play events that could not be stored", extra={'dropped': dropped})
+    except play_events.DroppedEvents as e:
+        metrics.PLAY_EVENTS.labels('dropped').inc(e.args[0])
+        logger.exception("Could not write play events", extra={'dropped': e.args[0]})
+    except Exception:
+        logger.exception("Could not write play events", extra={'pending': len(event_buffer)})
+
+def _events_loop():
+    while True:
+        time.sleep(EVENTS_FLUSH_INTERVAL)
+        flush_events()
+
+def start_event_flusher():
+    # Threads do not survive fork, so each (gunicorn worker) process starts its own
+    if _events['pid'] == os.getpid():
+        return
+    with _events_lock:
+        if _events['pid'] != os.getpid():
+            _events['pid'] = os.getpid()
+            threading.Thread(target=_events_loop, name='play-events', daemon=True).start()
+
+atexit.register(flush_events)  # gunicorn.conf.py also flushes in worker_exit
+
+REMOTE_SONG_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')  # JioSaavn song ids
+
+def known_song_id(store, song_id):
+    """Whether song_id can name a song: an indexed or demo song, a cached
+    JioSaavn result, or a well-formed JioSaavn id"""
+    if song_id.startswith('static-'):
+        return store.row_of(song_id) is not None
+    if song_id.startswith('demo-'):
+        return song_id in DEMO_SONGS_BY_ID
+    if song_id.startswith('jiosaavn-'):
+        return get_cached_jiosaavn_song(song_id) is not None
+    return bool(REMOTE_SONG_ID.match(song_id))
+
+def parse_event(item, user_db_id, now_ms, store):
+    """Event tuple for one posted event, or None if it is malformed"""
+    if not isinstance(item, dict):
+        return None
+    song_id, event = item.get('song_id'), item.get('type')
+    if not isinstance(song_id, str) or not known_song_id(store, song_id) or event not in play_events.EVENT_TYPES:
+        return None
+    position = item.get('position')
+    if position is not None and (not isinstance(position, (int, float)) or isinstance(position, bool)
+                                 or not 0 <= position <= EVENTS_MAX_POSITION):
+        return None
+    played_at = item.get('timestamp')
+    if not isinstance(played_at, int) or not now_ms - EVENTS_MAX_AGE * 1000 <= played_at <= now_ms + 60000:
+        played_at = now_ms
+    return (user_db_id, song_id, event, None if position is None else int(position * 1000), played_at)
+
+@app.route('/api/events', methods=['POST'])
+def post_events():
+    """Record a batch of play/skip events (written to the database in bulk)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        items = data.get('events')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'events must be a non-empty list'}), 400
+        if len(items) > EVENTS_MAX_BATCH:
+            return jsonify({'error': f'At most {EVENTS_MAX_BATCH} events per request'}), 400
+        # Signed-in clients get the events attributed to them
+        user_db_id = None
+        auth = request.headers.get('Authorization', '')
+        if auth.startswith('Bearer '):
+            claims = decode_jwt(auth.split(' ')[1])
+            if not claims:
+                return jsonify({'error': 'Invalid or expired token'}), 401
+            user_db_id = claims['uid']
+
+        now_ms = int(time.time() * 1000)
+        store = get_static_songs()
+        events = [e for e in (parse_event(item, user_db_id, now_ms, store) for item in items) if e]
+        start_event_flusher()
+        if event_buffer.add(events):
+            flush_events()
+        metrics.PLAY_EVENTS.labels('accepted').inc(len(events))
+        metrics.PLAY_EVENTS.labels('rejected').inc(len(items) - len(events))
+        response = jsonify({'accepted': len(events), 'rejected': len(items) - len(events)})
+        response.status_code = 202
+        return response
+    except Exception as e:
+        logger.exception("Error recording events")
+        return jsonify({'error': 'Failed to record events'}), 500
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_static_songs():
-    """Get list of static/local MP3 files with enhanced metadata"""
-    songs = []
-    songs_path = os.path.join(app.static_folder, 'songs')
+# --- Local library index ---
+# Scanning static/songs and opening every MP3 is expensive, so the scan result is
+# kept in memory and only files whose mtime/size changed are read again. The
+# index is also written to a snapshot file that processes map read-only, so
+# gunicorn workers share one copy and restarts skip the warm-up scan. Scans
+# run under a file lock and start from the newest snapshot, so song ids are
+# assigned by one process at a time and every worker hands out the same ones.
+LIBRARY_RESCAN_INTERVAL = 10  # seconds between directory checks
+CACHE_DIR = os.environ.get('CACHE_DIR', 'cache')
+LIBRARY_SNAPSHOT = os.path.join(CACHE_DIR, 'library.snapshot')
+LIBRARY_LOCK = os.path.join(CACHE_DIR, 'library.lock')
+# Bump when read_song_metadata starts extracting something new, so files
+# indexed by an older version are read again (2: embedded artwork,
+# 3: audio fingerprints for duplicate detection, 4: gapless encoder info,
+# 5: no tag-only duplicates without a known artist)
+LIBRARY_INDEX_VERSION = 5
+
+# Embedded cover art, resized and stored by content hash (see artwork.py)
+ARTWORK_DIR = os.path.join(CACHE_DIR, 'artwork')
+ARTWORK_THUMBNAIL_SIZE = 500  # size used for a song's `thumbnail` URL
+ARTWORK_MAX_AGE = 365 * 24 * 3600  # URLs are content-addressed, so never stale
+
+_library_lock = threading.Lock()  # guards reads and swaps of the state below
+_scan_lock = threading.Lock()     # held by the one thread rescanning the folder
+_library = {
+    'store': SongStore(),    # columnar song list in filename order (read-only)
+    'next_id': 1,
+    'checked_at': None,
+    'snapshot_id': None,  # (inode, mtime) of the snapshot file the store came from
+    # Catalog versioning for delta sync. Versions are millisecond change stamps
+    # taken from the filesystem, so every worker scanning the same folder agrees.
+    'version': 0,
+    'base_version': 0,  # changes before this are unknown to this process
+    'removed': {},      # song id -> version at which it disappeared
+    'index_version': LIBRARY_INDEX_VERSION,
+    'analysis_stamp': 0,  # newest loudness result applied to the index
+}
+
+def read_song_metadata(file_path, filename):
+    """Read tags and technical info for one local file.
+
+    Returns (song, tech) where tech holds bitrate/sample_rate read from the
+    MPEG header, so requests never have to open the file again.
+    """
+    title = None
+    artist = None
+    album = None
+    duration = None
+    year = None
+    tech = {'bitrate': None, 'sample_rate': None}
+    thumbnail = None
 
-    if not os.path.exists(songs_path):
-        os.makedirs(songs_path)
-        return songs
+    try:
+        # Load MP3 and extract duration and metadata
+        audio = MP3(file_path)
+        duration = round(audio.info.length) if audio.info.length else None
+        tech['bitrate'] = getattr(audio.info, 'bitrate', None)
+        tech['sample_rate'] = getattr(audio.info, 'sample_rate', None)
+
+        # Try to extract ID3 tags (title, artist, album, year)
+        try:
+            tags = ID3(file_path)
+            title = tags.get("TIT2")
+            artist = tags.get("TPE1") 
+            album = tags.get("TALB")
+            year_tag = tags.get("TDRC") or tags.get("TYER")
+
+            def extract_text(tag):
+                if tag is None:
+                    return None
+                val = tag.text[0] if hasattr(tag, 'text') and tag.text else tag
+                if isinstance(val, bytes):
+                    try:
+                        return val.decode('utf-8', errors='ignore')
+                    except Exception:
+                        return str(val)
+                return str(val)
+
+            title = extract_text(title)
+            artist = extract_text(artist)
+            album = extract_text(album)
+            year = extract_text(year_tag)
+            if year:
+                year = ''.join(filter(str.isdigit, year))[:4]
+                year = int(year) if year.isdigit() else None
+            else:
+                year = None
+
+            cover = artwork.extract(tags)
+            if cover:
+                try:
+                    key = artwork.store(ARTWORK_DIR, cover)
+                    thumbnail = f"/api/artwork/{key}/{ARTWORK_THUMBNAIL_SIZE}"
+                except Exception as e:
+                    logger.warning("Could not process artwork", extra={'file': filename, 'error': str(e)})
+        except ID3NoHeaderError:
+            # File doesn't have ID3 tags, that's fine
+            pass
+
+    except Exception as e:
+        logger.warning("Could not read metadata", extra={'file': filename, 'error': str(e)})
 
-    print(f"Scanning for songs in: {songs_path}")
+    try:
+        tech['fingerprint'] = dedupe.audio_fingerprint(file_path)
+    except OSError as e:
+        logger.warning("Could not fingerprint audio", extra={'file': filename, 'error': str(e)})
+
+    gapless_info = None
+    if filename.lower().endswith('.mp3'):
+        try:
+            gapless_info = gapless.read(file_path)
+        except OSError as e:
+            logger.warning("Could not read encoder header", extra={'file': filename, 'error': str(e)})
+
+    # Fall back to filename parsing if tags are missing
+    base_name = os.path.splitext(filename)[0]
     
-    for i, filename in enumerate(os.listdir(songs_path), start=1):
-        if allowed_file(filename):
-            file_path = os.path.join(songs_path, filename)
-            title = None
-            artist = None
-            album = None
-            duration = None
-            year = None
+    # Try to parse artist and title from filename patterns
+    if not title or not artist:
+        # Common patterns: "Artist - Title", "Artist_Title", etc.
+        if ' - ' in base_name:
+            parts = base_name.split(' - ', 1)
+            if not artist:
+                artist = parts[0].strip()
+            if not title:
+                title = parts[1].strip()
+        elif '_' in base_name and not title:
+            title = base_name.replace('_', ' ').replace('-', ' ').title()
+        else:
+            title = base_name.replace('_', ' ').replace('-', ' ').title()
+
+    # Final fallbacks
+    pretty_title = title or base_name.replace('_', ' ').replace('-', ' ').title()
+    pretty_artist = artist or "Unknown Artist"
+    pretty_album = album or "Unknown Album"
+
+    encoded_filename = urllib.parse.quote(filename)
+
+    song = {
+        "id": None,
+        "title": pretty_title,
+        "artist": pretty_artist,
+        "album": pretty_album,
+        "year": year,
+        "duration": duration,
+        "url": f"/songs/{encoded_filename}",
+        "source": "static",
+        "filename": filename,
+        "thumbnail": thumbnail,
+        "gain_db": None,  # filled in by background loudness analysis
+        "peak": None,
+        "gapless": gapless_info
+    }
+    return song, tech
 
-            try:
-                # Load MP3 and extract duration and metadata
-                audio = MP3(file_path)
-                duration = round(audio.info.length) if audio.info.length else None
-                
-                # Try to extract ID3 tags (title, artist, album, year)
-                try:
-                    tags = ID3(file_path)
-                    title = tags.get("TIT2")
-                    artist = tags.get("TPE1") 
-                    album = tags.get("TALB")
-                    year_tag = tags.get("TDRC") or tags.get("TYER")
-
-                    def extract_text(tag):
-                        if tag is None:
-                            return None
-                        val = tag.text[0] if hasattr(tag, 'text') and tag.text else tag
-                        if isinstance(val, bytes):
-                            try:
-                                return val.decode('utf-8', errors='ignore')
-                            except Exception:
-                                return str(val)
-                        return str(val)
+def _change_stamp(st):
+    """Millisecond change stamp for a stat result (ctime also catches copies that keep an old mtime)"""
+    return int(max(st.st_mtime, st.st_ctime) * 1000)
 
-                    title = extract_text(title)
-                    artist = extract_text(artist)
-                    album = extract_text(album)
-                    year = extract_text(year_tag)
-                    if year:
-                        year = ''.join(filter(str.isdigit, year))[:4]
-                        year = int(year) if year.isdigit() else None
-                    else:
-                        year = None
-                except ID3NoHeaderError:
-                    # File doesn't have ID3 tags, that's fine
-                    pass
-
-            except Exception as e:
-                print(f"Warning: Could not read metadata from {filename}: {e}")
-
-            # Fall back to filename parsing if tags are missing
-            base_name = os.path.splitext(filename)[0]
-            
-            # Try to parse artist and title from filename patterns
-            if not title or not artist:
-                # Common patterns: "Artist - Title", "Artist_Title", etc.
-                if ' - ' in base_name:
-                    parts = base_name.split(' - ', 1)
-                    if not artist:
-                        artist = parts[0].strip()
-                    if not title:
-                        title = parts[1].strip()
-                elif '_' in base_name and not title:
-                    title = base_name.replace('_', ' ').replace('-', ' ').title()
-                else:
-                    title = base_name.replace('_', ' ').replace('-', ' ').title()
-
-            # Final fallbacks
-            pretty_title = title or base_name.replace('_', ' ').replace('-', ' ').title()
-            pretty_artist = artist or "Unknown Artist"
-            pretty_album = album or "Unknown Album"
-
-            encoded_filename = urllib.parse.quote(filename)
-
-            songs.append({
-                "id": f"static-{i}",
-                "title": pretty_title,
-                "artist": pretty_artist,
-                "album": pretty_album,
-                "year": year,
-                "duration": duration,
-                "url": f"/songs/{encoded_filename}",
-                "source": "static",
-                "filename": filename,
-                "thumbnail": None
-            })
+def _library_meta():
+    return {key: _library[key] for key in ('next_id', 'version', 'base_version', 'removed',
+                                           'index_version', 'analysis_stamp')}
+
+def _snapshot_id():
+    try:
+        st = os.stat(LIBRARY_SNAPSHOT)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+def _load_library_snapshot():
+    """Adopt the on-disk snapshot if it is not the one already in use
+    (caller holds _scan_lock)"""
+    snapshot_id = _snapshot_id()
+    if snapshot_id is None or snapshot_id == _library['snapshot_id']:
+        return False
+    try:
+        store, meta = SongStore.load(LIBRARY_SNAPSHOT)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.warning("Ignoring library snapshot", extra={'path': LIBRARY_SNAPSHOT, 'error': str(e)})
+        return False
+    with _library_lock:
+        _library['store'] = store
+        _library['snapshot_id'] = snapshot_id
+        _library['index_version'] = 1  # snapshots from before index versioning
+        _library.update(meta)
+    return True
+
+def _save_library_snapshot():
+    """Write the index to disk and switch to the mapped copy (caller holds _scan_lock)"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _library['store'].save(LIBRARY_SNAPSHOT, meta=_library_meta())
+        _load_library_snapshot()
+    except Exception as e:
+        logger.warning("Could not write library snapshot", extra={'path': LIBRARY_SNAPSHOT, 'error': str(e)})
+
+def _scan_library(songs_path):
+    """Bring the library index up to date (caller holds _scan_lock).
+
+    Request threads keep reading the current index meanwhile; the new one is
+    published under _library_lock at the end.
+    """
+    store = _library['store']
+    removed = dict(_library['removed'])
+    known = store.filename_rows()
+    kept = {}   # filename -> row in the current store
+    fresh = {}  # filename -> song record for files read this scan
+    dir_stamp = _change_stamp(os.stat(songs_path))
+    # After an index format change every file is read again; songs whose
+    # metadata changed because of it (or that became or stopped being a
+    # duplicate) get a version just past the current one
+    reindex = _library['index_version'] != LIBRARY_INDEX_VERSION
+    bump_version = _library['version'] + 1
+
+    for filename in sorted(os.listdir(songs_path)):
+        if not allowed_file(filename):
+            continue
+        file_path = os.path.join(songs_path, filename)
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            continue
+
+        row = known.pop(filename, None)
+        unchanged = False
+        if row is not None:
+            unchanged = (store.stat(row)['mtime'] == st.st_mtime
+                         and store.tech(row)['file_size'] == st.st_size)
+            if unchanged and not reindex:
+                kept[filename] = row
+                continue
+            # Keep ids stable for files that were already indexed
+            song_id = store.song_id(row)
+            created = store.stat(row)['created']
+        else:
+            song_id = f"static-{_library['next_id']}"
+            _library['next_id'] += 1
+            created = None
+
+        song, tech = read_song_metadata(file_path, filename)
+        stamp = _change_stamp(st)
+        version = stamp
+        if unchanged:
+            old = store.record(row)
+            same = (song['thumbnail'], song['gapless']) == (old['thumbnail'], old['gapless'])
+            version = old['version'] if same else bump_version
+        song.update(tech, id=song_id, file_size=st.st_size, mtime=st.st_mtime,
+                    version=version, created=created or stamp)
+        fresh[filename] = song
+        removed.pop(song_id, None)
+
+    # Whatever is left in `known` has disappeared from disk
+    for row in known.values():
+        removed[store.song_id(row)] = dir_stamp
+
+    # Loudness results: any already known for files read now, plus everything
+    # measured since the last scan for the rest. A changed gain bumps the
+    # song's version (to the measurement's stamp, so all workers agree).
+    latest = loudness_db.latest()
+    since = _library['analysis_stamp'] if latest != _library['analysis_stamp'] else None
+    if fresh or since is not None:
+        results = loudness_db.results(
+            keys=[file_audio_key(s['id'], s['mtime'], s['file_size']) for s in fresh.values()], since=since)
+        for song in fresh.values():
+            result = results.get(file_audio_key(song['id'], song['mtime'], song['file_size']))
+            if result:
+                song.update(gain_db=result[0], peak=result[1], version=max(song['version'], result[2]))
+        if since is not None:
+            for filename, row in list(kept.items()):
+                result = results.get(local_audio_key(store, row))
+                song = store.row(row)
+                if result and (song['gain_db'], song['peak']) != result[:2]:
+                    song = store.record(row)
+                    song.update(gain_db=result[0], peak=result[1], version=max(song['version'], result[2]))
+                    fresh[filename] = song
+                    del kept[filename]
+        _library['analysis_stamp'] = latest
+
+    _library['index_version'] = LIBRARY_INDEX_VERSION
+    if fresh or known:
+        entries = [store.dedupe_entry(row) for row in kept.values()]
+        entries += [(s['id'], dedupe.tag_hash(s['title'], s['artist']), s['duration'], s.get('fingerprint'),
+                     s.get('bitrate'), s['file_size']) for s in fresh.values()]
+        duplicates = dedupe.find_duplicates(entries)
+        for filename, row in list(kept.items()):
+            if store.duplicate_of(row) != duplicates.get(store.song_id(row)):
+                fresh[filename] = store.record(row)
+                fresh[filename]['version'] = bump_version
+                del kept[filename]
+        for song in fresh.values():
+            duplicate_of = duplicates.get(song['id'])
+            old_row = store.row_of(song['id'])
+            if old_row is not None and store.duplicate_of(old_row) != duplicate_of:
+                song['version'] = max(song['version'], bump_version)
+            song['duplicate_of'] = duplicate_of
+
+        def records():
+            for name in sorted(list(kept) + list(fresh)):
+                yield fresh[name] if name in fresh else store.record(kept[name])
+
+        new_store = SongStore(records())
+        versions = [new_store.stat(i)['version'] for i in range(len(new_store))]
+        with _library_lock:
+            _library.update(store=new_store, version=max([dir_stamp] + versions), removed=removed)
+            if _library['checked_at'] is None and not _library['base_version']:
+                _library['base_version'] = _library['version']
+        logger.info("Library indexed", extra={'songs': len(new_store), 'read': len(fresh), 'removed': len(known),
+                                              'duplicates': len(duplicates)})
+        _save_library_snapshot()
+    elif _library['checked_at'] is None and not _library['base_version']:
+        with _library_lock:
+            _library['version'] = _library['base_version'] = dir_stamp
+
+def get_static_songs():
+    """Get static/local songs with enhanced metadata.
 
-    print(f"Found {len(songs)} static songs")
-    return songs
+    Returns the library's SongStore: a read-only sequence of song dicts backed
+    by compact columns, with search helpers for the hot filters.
+    """
+    songs_path = SONGS_FOLDER
+
+    if not os.path.exists(songs_path):
+        os.makedirs(songs_path)
+
+    now = time.time()
+    checked_at = _library['checked_at']
+    if checked_at is None or now - checked_at >= LIBRARY_RESCAN_INTERVAL:
+        # One thread rescans while the others keep serving the current index;
+        # only before the first scan is there nothing to serve, so wait then
+        if _scan_lock.acquire(blocking=checked_at is None):
+            try:
+                if _library['checked_at'] == checked_at:
+                    _refresh_library(songs_path)
+                    _library['checked_at'] = now
+            finally:
+                _scan_lock.release()
+    with _library_lock:
+        return _library['store']
+
+def _refresh_library(songs_path):
+    """Rescan under the cross-process library lock (caller holds _scan_lock).
+
+    If the lock file cannot be used (e.g. CACHE_DIR is not writable) the scan
+    still runs, just without coordinating ids with the other workers.
+    """
+    lock_file = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        lock_file = open(LIBRARY_LOCK, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    except OSError as e:
+        logger.warning("Scanning library without the cross-process lock",
+                       extra={'path': LIBRARY_LOCK, 'error': str(e)})
+        if lock_file is not None:
+            lock_file.close()
+        lock_file = None
+    try:
+        if lock_file is not None:
+            # Another process may have indexed (and numbered) new files
+            # since our last look: continue from its snapshot
+            _load_library_snapshot()
+        _scan_library(songs_path)
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+
+def warm_library():
+    """Build (or map) the library index up front, e.g. in the gunicorn master
+    before workers fork, so no worker pays for the first scan."""
+    store = get_static_songs()
+    logger.info("Library ready", extra={'songs': len(store), 'catalog_version': _library['version']})
+    return store
 
 def upgrade_url(url):
     """Force any http:// URL to https:// for security (prevents mixed content)"""
@@ -332,220 +1007,821 @@ def upgrade_url(url):
     return url
 
 # --- JioSaavn API search ---
+def parse_jiosaavn_item(item, fallback_id=None):
+    """Normalize one JioSaavn API result into our song dict (None if unplayable)"""
+    # Extract title with fallbacks
+    title = item.get('name') or item.get('title') or 'Unknown Title'
+
+    # Enhanced artist extraction with multiple fallbacks
+    artist = None
+    # ...existing code for artist extraction...
+    if item.get('artists') and isinstance(item['artists'], dict) and 'primary' in item['artists']:
+        primary_artists = item['artists']['primary']
+        if isinstance(primary_artists, list) and primary_artists:
+            artist_names = [a['name'] for a in primary_artists if isinstance(a, dict) and a.get('name')]
+            if artist_names:
+                artist = ', '.join(artist_names)
+    if not artist and item.get('primaryArtists'):
+        if isinstance(item['primaryArtists'], str):
+            artist = item['primaryArtists']
+    if not artist and item.get('artists'):
+        if isinstance(item['artists'], str):
+            artist = item['artists']
+    if not artist:
+        artist = item.get('artist')
+    if not artist and item.get('artistMap') and item['artistMap'].get('primary_artists'):
+        pa = item['artistMap']['primary_artists']
+        if isinstance(pa, list) and pa and isinstance(pa[0], dict):
+            artist = pa[0].get('name')
+    if isinstance(artist, str):
+        artist = artist.strip()
+        if not artist or artist.lower() in ['unknown', 'unknown artist', '']:
+            artist = 'Unknown Artist'
+
+    # Enhanced album extraction
+    album = None
+    if item.get('album'):
+        if isinstance(item['album'], dict):
+            album = item['album'].get('name') or item['album'].get('title')
+        elif isinstance(item['album'], str):
+            album = item['album']
+    if not album:
+        album = item.get('albumMap', {}).get('name') or item.get('albumName')
+
+    # Enhanced thumbnail extraction with multiple sizes
+    thumbnail = None
+    if item.get('image'):
+        if isinstance(item['image'], list) and item['image']:
+            thumbnail = item['image'][-1]
+            if isinstance(thumbnail, dict):
+                thumbnail = thumbnail.get('link') or thumbnail.get('url')
+        elif isinstance(item['image'], str):
+            thumbnail = item['image']
+    if not thumbnail:
+        for img_field in ['imageUrl', 'image_url', 'artwork', 'cover']:
+            if item.get(img_field):
+                thumbnail = item[img_field]
+                break
+    if thumbnail and isinstance(thumbnail, str):
+        if '150x150' in thumbnail:
+            thumbnail = thumbnail.replace('150x150', '500x500')
+        elif '50x50' in thumbnail:
+            thumbnail = thumbnail.replace('50x50', '500x500')
+        thumbnail = upgrade_url(thumbnail)
+
+    # Enhanced year extraction
+    year = None
+    year_fields = ['year', 'releaseYear', 'release_year', 'albumYear']
+    for field in year_fields:
+        if item.get(field):
+            try:
+                year_val = str(item[field])
+                if year_val.isdigit() and len(year_val) == 4:
+                    year = int(year_val)
+                    break
+            except:
+                continue
+
+    # Enhanced duration extraction (convert to seconds if needed)
+    duration = None
+    if item.get('duration'):
+        try:
+            duration_val = item['duration']
+            if isinstance(duration_val, str):
+                if ':' in duration_val:
+                    parts = duration_val.split(':')
+                    if len(parts) == 2:
+                        minutes, seconds = int(parts[0]), int(parts[1])
+                        duration = minutes * 60 + seconds
+                else:
+                    duration = int(duration_val)
+            else:
+                duration = int(duration_val)
+        except:
+            pass
+
+    # Use the best available audio URL or fallback to JioSaavn web link
+    audio_url = None
+    if 'downloadUrl' in item and item['downloadUrl']:
+        download_urls = item['downloadUrl']
+        if isinstance(download_urls, list):
+            for quality in ['320kbps', '160kbps', '96kbps', '48kbps']:
+                for d in download_urls:
+                    if isinstance(d, dict) and d.get('quality') == quality and d.get('url'):
+                        audio_url = d['url']
+                        break
+                if audio_url:
+                    break
+            if not audio_url:
+                for d in download_urls:
+                    if isinstance(d, dict) and d.get('url'):
+                        audio_url = d['url']
+                        break
+    if not audio_url:
+        url_fields = ['permaUrl', 'url', 'playUrl', 'streamUrl']
+        for field in url_fields:
+            if item.get(field):
+                audio_url = item[field]
+                break
+    if audio_url:
+        audio_url = upgrade_url(audio_url)
+
+    # Only add if we have a valid url and basic metadata
+    if audio_url and title:
+        song_data = {
+            'id': item.get('id') or fallback_id,
+            'title': title,
+            'artist': artist,
+            'album': album,
+            'year': year,
+            'duration': duration,
+            'url': audio_url,
+            'source': 'jiosaavn',
+            'thumbnail': thumbnail,
+            'gain_db': None,  # filled in once the audio has been analysed
+            'peak': None,
+            'gapless': None
+        }
+        return song_data
+    return None
+
 def search_jiosaavn(query, page=1, per_page=20):
     """Search for songs using the JioSaavn public API (unofficial)"""
 
     try:
-        print(f"Searching JioSaavn for: '{query}' (page={page}, per_page={per_page})")
         params = {
             'query': query,
             'page': page
         }
         url = f"{JIOSAAVN_API_BASE}/search/songs"
-        response = requests.get(url, params=params, timeout=10)
-        print(f"JioSaavn API status: {response.status_code}")
+        with metrics.track_upstream('jiosaavn', 'search'):
+            response = requests.get(url, params=params, timeout=10)
+        logger.debug("JioSaavn search", extra={'query': query, 'page': page, 'per_page': per_page,
+                                               'status': response.status_code, **SAMPLED})
+        if response.status_code != 200:
+            metrics.upstream_status_error('jiosaavn', 'search', response.status_code)
         if response.status_code == 200:
             data = response.json()
-            print('JioSaavn API raw response keys:', list(data.keys()))  # DEBUG: print response structure
             songs = []
             # JioSaavn API returns results in data['results']
             results = data.get('data', {}).get('results', [])
 
             for item in results[:per_page]:
-                # Enhanced metadata extraction
-
-                # Extract title with fallbacks
-                title = item.get('name') or item.get('title') or 'Unknown Title'
-
-                # Enhanced artist extraction with multiple fallbacks
-                artist = None
-                # ...existing code for artist extraction...
-                if item.get('artists') and isinstance(item['artists'], dict) and 'primary' in item['artists']:
-                    primary_artists = item['artists']['primary']
-                    if isinstance(primary_artists, list) and primary_artists:
-                        artist_names = [a['name'] for a in primary_artists if isinstance(a, dict) and a.get('name')]
-                        if artist_names:
-                            artist = ', '.join(artist_names)
-                if not artist and item.get('primaryArtists'):
-                    if isinstance(item['primaryArtists'], str):
-                        artist = item['primaryArtists']
-                if not artist and item.get('artists'):
-                    if isinstance(item['artists'], str):
-                        artist = item['artists']
-                if not artist:
-                    artist = item.get('artist')
-                if not artist and item.get('artistMap') and item['artistMap'].get('primary_artists'):
-                    pa = item['artistMap']['primary_artists']
-                    if isinstance(pa, list) and pa and isinstance(pa[0], dict):
-                        artist = pa[0].get('name')
-                if isinstance(artist, str):
-                    artist = artist.strip()
-                    if not artist or artist.lower() in ['unknown', 'unknown artist', '']:
-                        artist = 'Unknown Artist'
-
-                # Enhanced album extraction
-                album = None
-                if item.get('album'):
-                    if isinstance(item['album'], dict):
-                        album = item['album'].get('name') or item['album'].get('title')
-                    elif isinstance(item['album'], str):
-                        album = item['album']
-                if not album:
-                    album = item.get('albumMap', {}).get('name') or item.get('albumName')
-
-                # Enhanced thumbnail extraction with multiple sizes
-                thumbnail = None
-                if item.get('image'):
-                    if isinstance(item['image'], list) and item['image']:
-                        thumbnail = item['image'][-1]
-                        if isinstance(thumbnail, dict):
-                            thumbnail = thumbnail.get('link') or thumbnail.get('url')
-                    elif isinstance(item['image'], str):
-                        thumbnail = item['image']
-                if not thumbnail:
-                    for img_field in ['imageUrl', 'image_url', 'artwork', 'cover']:
-                        if item.get(img_field):
-                            thumbnail = item[img_field]
-                            break
-                if thumbnail and isinstance(thumbnail, str):
-                    if '150x150' in thumbnail:
-                        thumbnail = thumbnail.replace('150x150', '500x500')
-                    elif '50x50' in thumbnail:
-                        thumbnail = thumbnail.replace('50x50', '500x500')
-                    thumbnail = upgrade_url(thumbnail)
-
-                # Enhanced year extraction
-                year = None
-                year_fields = ['year', 'releaseYear', 'release_year', 'albumYear']
-                for field in year_fields:
-                    if item.get(field):
-                        try:
-                            year_val = str(item[field])
-                            if year_val.isdigit() and len(year_val) == 4:
-                                year = int(year_val)
-                                break
-                        except:
-                            continue
-
-                # Enhanced duration extraction (convert to seconds if needed)
-                duration = None
-                if item.get('duration'):
-                    try:
-                        duration_val = item['duration']
-                        if isinstance(duration_val, str):
-                            if ':' in duration_val:
-                                parts = duration_val.split(':')
-                                if len(parts) == 2:
-                                    minutes, seconds = int(parts[0]), int(parts[1])
-                                    duration = minutes * 60 + seconds
-                            else:
-                                duration = int(duration_val)
-                        else:
-                            duration = int(duration_val)
-                    except:
-                        pass
-
-                # Use the best available audio URL or fallback to JioSaavn web link
-                audio_url = None
-                if 'downloadUrl' in item and item['downloadUrl']:
-                    download_urls = item['downloadUrl']
-                    if isinstance(download_urls, list):
-                        for quality in ['320kbps', '160kbps', '96kbps', '48kbps']:
-                            for d in download_urls:
-                                if isinstance(d, dict) and d.get('quality') == quality and d.get('url'):
-                                    audio_url = d['url']
-                                    break
-                            if audio_url:
-                                break
-                        if not audio_url:
-                            for d in download_urls:
-                                if isinstance(d, dict) and d.get('url'):
-                                    audio_url = d['url']
-                                    break
-                if not audio_url:
-                    url_fields = ['permaUrl', 'url', 'playUrl', 'streamUrl']
-                    for field in url_fields:
-                        if item.get(field):
-                            audio_url = item[field]
-                            break
-                if audio_url:
-                    audio_url = upgrade_url(audio_url)
-
-                # Only add if we have a valid url and basic metadata
-                if audio_url and title:
-                    song_data = {
-                        'id': item.get('id') or f"jiosaavn-{len(songs)}",
-                        'title': title,
-                        'artist': artist,
-                        'album': album,
-                        'year': year,
-                        'duration': duration,
-                        'url': audio_url,
-                        'source': 'jiosaavn',
-                        'thumbnail': thumbnail
-                    }
+                song_data = parse_jiosaavn_item(item, f"jiosaavn-{len(songs)}")
+                if song_data:
                     songs.append(song_data)
-            print(f"Returning {len(songs)} JioSaavn songs")
+                    cache_jiosaavn_song(song_data)
             return songs, len(results)
         else:
-            print(f"JioSaavn API error: {response.status_code} - {response.text[:200]}")
+            logger.warning("JioSaavn API error", extra={'status': response.status_code, 'body': response.text[:200]})
     except Exception as e:
-        print(f"Error searching JioSaavn: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error searching JioSaavn", extra={'query': query})
     return [], 0
 
-def get_popular_songs(limit=10):
-    """Get popular songs from Internet Archive"""
+# --- JioSaavn song cache ---
+# Songs seen in search results are remembered so clients can look them up by id
+# (queues, playlists) without another search round-trip.
+JIOSAAVN_CACHE_SIZE = 5000
+
+_jiosaavn_cache = OrderedDict()
+_jiosaavn_cache_lock = threading.Lock()
+
+def cache_jiosaavn_song(song):
+    """Remember a parsed JioSaavn song (LRU, bounded by JIOSAAVN_CACHE_SIZE)"""
+    song_id = song.get('id')
+    if not song_id or song_id.startswith('jiosaavn-'):
+        # Positional fallback ids are not unique across searches
+        return
+    with _jiosaavn_cache_lock:
+        _jiosaavn_cache[song_id] = song
+        _jiosaavn_cache.move_to_end(song_id)
+        while len(_jiosaavn_cache) > JIOSAAVN_CACHE_SIZE:
+            _jiosaavn_cache.popitem(last=False)
+
+def get_cached_jiosaavn_song(song_id):
+    with _jiosaavn_cache_lock:
+        song = _jiosaavn_cache.get(song_id)
+        if song is not None:
+            _jiosaavn_cache.move_to_end(song_id)
+    metrics.cache_lookup('jiosaavn_songs', song is not None)
+    return song
+
+def fetch_jiosaavn_songs(song_ids):
+    """Look up several JioSaavn songs by id with a single API call"""
+    if not song_ids:
+        return []
     try:
-        print(f"Fetching {limit} popular songs...")
-        
-        # Add some demo popular songs to ensure users have content
-        demo_popular_songs = [
-            {
-                "id": "demo-popular-1",
-                "title": "Demo Song 1 (Sample Audio)",
-                "artist": "Demo Artist",
-                "url": "https://www.soundhelix.com/examples/mp3/SoundHelix-Song-4.mp3",
-                "source": "api",
-                "album": "Demo Album",
-                "year": 2023,
-                "thumbnail": None
-            },
-            {
-                "id": "demo-popular-2", 
-                "title": "Demo Song 2 (Sample Audio)",
-                "artist": "Demo Artist 2",
-                "url": "https://www.soundhelix.com/examples/mp3/SoundHelix-Song-5.mp3",
-                "source": "api",
-                "album": "Demo Album",
-                "year": 2023,
-                "thumbnail": None
-            }
-        ]
-        
-        print(f"Providing {len(demo_popular_songs)} demo popular songs")
-        return demo_popular_songs
-        
+        url = f"{JIOSAAVN_API_BASE}/songs"
+        with metrics.track_upstream('jiosaavn', 'lookup'):
+            response = requests.get(url, params={'ids': ','.join(song_ids)}, timeout=10)
+        if response.status_code != 200:
+            metrics.upstream_status_error('jiosaavn', 'lookup', response.status_code)
+            logger.warning("JioSaavn lookup error", extra={'status': response.status_code, 'body': response.text[:200]})
+            return []
+        data = response.json().get('data') or []
+        if isinstance(data, dict):
+            data = data.get('results', [])
+        songs = []
+        for item in data:
+            if not isinstance(item, dict) or not item.get('id'):
+                continue
+            song_data = parse_jiosaavn_item(item)
+            if song_data:
+                songs.append(song_data)
+                cache_jiosaavn_song(song_data)
+        return songs
     except Exception as e:
-        print(f"Error fetching popular songs: {e}")
+        logger.warning("Error looking up JioSaavn songs", extra={'ids': len(song_ids), 'error': str(e)})
         return []
 
+# --- Background refreshes ---
+# Precomputed data (rankings, recommendations) is rebuilt off the request
+# path: readers ask for a refresh and carry on with what is there.
+_refreshes = {}  # name -> {'pid', 'refreshed_at', 'running'}
+_refreshes_lock = threading.Lock()
+
+def schedule_refresh(name, interval, fn):
+    """Run fn in a background thread unless it ran (or is running) within interval seconds"""
+    with _refreshes_lock:
+        state = _refreshes.setdefault(name, {'pid': None})
+        if state['pid'] != os.getpid():
+            # Nothing carries over a fork (gunicorn workers)
+            state.update(pid=os.getpid(), refreshed_at=0, running=False)
+        if state['running'] or time.time() - state['refreshed_at'] < interval:
+            return
+        state['running'] = True
+
+    def run():
+        try:
+            fn()
+        except Exception:
+            logger.exception("Background refresh failed", extra={'refresh': name})
+        finally:
+            with _refreshes_lock:
+                state.update(refreshed_at=time.time(), running=False)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+
+# --- Popular songs ---
+# Demo tracks, served until there is any playback history to rank
+DEMO_SONGS = [
+    {
+        "id": "demo-popular-1",
+        "title": "Demo Song 1 (Sample Audio)",
+        "artist": "Demo Artist",
+        "url": "https://www.soundhelix.com/examples/mp3/SoundHelix-Song-4.mp3",
+        "source": "api",
+        "album": "Demo Album",
+        "year": 2023,
+        "thumbnail": None
+    },
+    {
+        "id": "demo-popular-2",
+        "title": "Demo Song 2 (Sample Audio)",
+        "artist": "Demo Artist 2",
+        "url": "https://www.soundhelix.com/examples/mp3/SoundHelix-Song-5.mp3",
+        "source": "api",
+        "album": "Demo Album",
+        "year": 2023,
+        "thumbnail": None
+    }
+]
+DEMO_SONGS_BY_ID = {song['id']: song for song in DEMO_SONGS}
+
+# window -> {'songs': [...], 'remote': [...], 'scores': {id: score}}; replaced
+# wholesale by each refresh, so readers never need the lock
+_popular = {'rankings': {}, 'version': 0, 'unresolved': {}}  # unresolved: id -> next lookup time
+_popular_lock = threading.Lock()
+
+def refresh_popular():
+    """Recompute every window's ranking (runs in the background)"""
+    now_ms = int(time.time() * 1000)
+    conn = get_db()
+    try:
+        ranked = {window: popularity.rank(conn, window, now_ms, POPULAR_TOP_N) for window in popularity.WINDOWS}
+    finally:
+        conn.close()
+    # Ids that did not resolve last time (e.g. junk posted to /api/events) are
+    # not looked up again upstream until POPULAR_UNRESOLVED_TTL has passed
+    now = time.time()
+    unresolved = {song_id: until for song_id, until in _popular['unresolved'].items() if until > now}
+    song_ids = [song_id for song_id in dict.fromkeys(song_id for r in ranked.values() for song_id, _ in r)
+                if song_id not in unresolved]
+    found = resolve_songs(song_ids)
+    unresolved.update((song_id, now + POPULAR_UNRESOLVED_TTL) for song_id in song_ids if song_id not in found)
+    _popular['unresolved'] = unresolved
+    rankings = {}
+    for window, ranking in ranked.items():
+        # Songs that no longer resolve (deleted files, copies folded into
+        # another song) drop out
+        songs = [found[song_id] for song_id, _ in ranking
+                 if song_id in found and not found[song_id].get('duplicate_of')]
+        rankings[window] = {
+            'songs': songs,
+            'remote': [song for song in songs if song.get('source') != 'static'],
+            'scores': {song_id: round(score, 3) for song_id, score in ranking},
+        }
+    changed = ({w: [s['id'] for s in r['songs']] for w, r in rankings.items()}
+               != {w: [s['id'] for s in r['songs']] for w, r in _popular['rankings'].items()})
+    with _popular_lock:
+        _popular['rankings'] = rankings
+        if changed:
+            _popular['version'] += 1
+
+def _schedule_popular_refresh():
+    schedule_refresh('popular-songs', POPULAR_REFRESH_INTERVAL, refresh_popular)
+
+def popular_version():
+    """Changes whenever a ranking does (for response cache keys)"""
+    _schedule_popular_refresh()
+    return _popular['version']
+
+def get_popular_songs(limit=10, window='week', remote_only=False):
+    """Top songs of a window ('day', 'week' or 'all'), as copies.
+
+    remote_only leaves out local songs, for lists that already include the
+    whole library. Falls back to the demo tracks while nothing ranks.
+    """
+    _schedule_popular_refresh()
+    ranking = _popular['rankings'].get(window)
+    songs = (ranking['remote'] if remote_only else ranking['songs']) if ranking else []
+    if not songs and not any(r['songs'] for r in _popular['rankings'].values()):
+        songs = DEMO_SONGS
+    return [dict(song) for song in songs[:limit]]
+
+# --- Radio recommendations ---
+radio_index = radio.CooccurrenceIndex()
+
+def refresh_radio():
+    conn = get_db()
+    try:
+        started = time.perf_counter()
+        recomputed = radio_index.refresh(conn)
+    finally:
+        conn.close()
+    if recomputed:
+        logger.info("Radio index refreshed", extra={'songs': recomputed, 'indexed': len(radio_index),
+                                                    'duration_ms': round((time.perf_counter() - started) * 1000)})
+
+def get_radio_songs(song_id, limit):
+    """Songs most often kept alongside song_id, as (song, score) pairs"""
+    schedule_refresh('radio', RADIO_REFRESH_INTERVAL, refresh_radio)
+    # A few spare neighbors make up for ids that no longer resolve
+    neighbors = radio_index.neighbors(song_id, limit + 10)
+    found = resolve_songs([other for other, _ in neighbors])
+    songs = [(found[other], score) for other, score in neighbors
+             if other in found and not found[other].get('duplicate_of')]
+    return songs[:limit]
+
+def get_catalog_changes(since):
+    """Return (version, changes) for the local catalog since a client version.
+
+    changes is None when this process cannot answer incrementally (the version
+    predates what this worker has seen, or is from the future), meaning the
+    client has to resync from /api/catalog.
+    """
+    get_static_songs()  # make sure the index is fresh
+    with _library_lock:
+        version = _library['version']
+        if since < _library['base_version'] or since > version:
+            return version, None
+        store = _library['store']
+        added = []
+        updated = []
+        removed = [song_id for song_id, v in _library['removed'].items() if v > since]
+        for row in store.changed_since(since):
+            if store.duplicate_of(row):
+                removed.append(store.song_id(row))  # collapsed into another copy
+            else:
+                (added if store.stat(row)['created'] > since else updated).append(store.row(row))
+        return version, {'added': added, 'updated': updated, 'removed': removed}
+
+def catalog_version():
+    get_static_songs()  # make sure the index is fresh
+    with _library_lock:
+        return _library['version']
+
+def catalog_etag(*parts):
+    return 'catalog-' + '-'.join(str(p) for p in parts)
+
+def not_modified(etag):
+    """True if the client's If-None-Match already matches etag"""
+    return request.if_none_match.contains_weak(etag)
+
+def not_modified_response(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def select_fields(songs):
+    """Project song dicts onto ?fields=a,b,c (id is always kept)"""
+    fields = request.args.get('fields')
+    if not fields:
+        return songs
+    keys = ['id'] + [f for f in (f.strip() for f in fields.split(',')) if f and f != 'id']
+    return [{k: song[k] for k in keys if k in song} for song in songs]
+
+def negotiate_encoding():
+    """Pick the best compression the client accepts (None for identity)"""
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+def compress_body(body, encoding, best=False):
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if best else 5)
+    return gzip.compress(body, compresslevel=9 if best else 6)
+
+# Serialized (and compressed) bodies of versioned payloads, so unchanged
+# catalogs are neither re-encoded nor re-compressed on every request
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def cached_json_response(cache_key, build, etag=None):
+    """Serve build()'s JSON payload from a cache keyed by cache_key.
+
+    cache_key must change whenever the payload would (include the catalog
+    version); the ?fields selection is added to the key automatically.
+    """
+    fields = request.args.get('fields')
+    key = (request.path, cache_key, fields)
+    with _response_cache_lock:
+        entry = _response_cache.get(key)
+        if entry is not None:
+            _response_cache.move_to_end(key)
+    metrics.cache_lookup('response_bodies', entry is not None)
+    if entry is None:
+        body = app.json.dumps(build()).encode('utf-8')
+        if etag and fields:
+            etag += '-' + hashlib.sha1(fields.encode('utf-8')).hexdigest()[:8]
+        entry = {
+            'etag': etag or hashlib.sha1(body).hexdigest(),
+            'identity': body,
+        }
+        with _response_cache_lock:
+            _response_cache[key] = entry
+            while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                _response_cache.popitem(last=False)
+
+    if not_modified(entry['etag']):
+        return not_modified_response(entry['etag'])
+
+    body = entry['identity']
+    encoding = negotiate_encoding() if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding:
+        if encoding not in entry:
+            # Computed once per version, so spend more CPU for a smaller body
+            entry[encoding] = compress_body(body, encoding, best=True)
+        body = entry[encoding]
+
+    response = app.response_class(body, mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(entry['etag'], weak=bool(encoding))
+    return response
+
+# --- Request profiling ---
+# A request is profiled when an admin sends `X-Profile: 1` with X-Admin-Token,
+# or at random with probability PROFILE_SAMPLE_RATE. The hooks are registered
+# before the metrics ones so the profile also covers response compression.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))  # most recent profiles kept
+PROFILE_DIR = os.path.join(CACHE_DIR, 'profiles')
+
+def should_profile():
+    if request.path.startswith('/admin/') or request.path == '/metrics':
+        return False
+    if request.headers.get('X-Profile') and is_admin_request():
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+@app.before_request
+def start_profiling():
+    if not should_profile():
+        return
+    profiler = profiling.start()
+    if profiler is None:
+        return  # another request in this process is being profiled
+    g.profiler = profiler
+    g.profile_started_at = time.time()
+    g.profile_start = time.perf_counter()
+    metrics.begin_spans()
+
+@app.after_request
+def finish_profiling(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    elapsed = time.perf_counter() - g.profile_start
+    try:
+        profile_id = profiling.save(PROFILE_DIR, PROFILE_KEEP, profiler, metrics.end_spans(), {
+            'route': request.url_rule.rule if request.url_rule else 'unmatched',
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'started_at': g.profile_started_at,
+            'duration_ms': round(elapsed * 1000, 3),
+        })
+    except OSError:
+        logger.exception("Error saving request profile")
+        return response
+    response.headers['X-Profile-Id'] = profile_id
+    logger.info("Request profiled", extra={'profile_id': profile_id, 'path': request.path,
+                                           'duration_ms': round(elapsed * 1000, 2)})
+    return response
+
+@app.teardown_request
+def abort_profiling(exc):
+    # Only still set when the request failed before after_request ran
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        metrics.end_spans()
+
+@app.route('/admin/profiles')
+@admin_required
+def admin_profiles():
+    """Recent request profiles, newest first"""
+    return jsonify({'profiles': profiling.list_summaries(PROFILE_DIR)})
+
+@app.route('/admin/profiles/<profile_id>')
+@admin_required
+def admin_profile(profile_id):
+    """Summary of one profile: timing breakdown and top functions"""
+    summary = profiling.load_summary(PROFILE_DIR, profile_id)
+    if summary is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return jsonify(summary)
+
+@app.route('/admin/profiles/<profile_id>/download')
+@admin_required
+def admin_profile_download(profile_id):
+    """Raw cProfile data, for `python -m pstats` or snakeviz"""
+    path = profiling.stats_path(PROFILE_DIR, profile_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_from_directory(os.path.abspath(PROFILE_DIR), os.path.basename(path),
+                               as_attachment=True, mimetype='application/octet-stream')
+
+# --- Request metrics and logging ---
+@app.before_request
+def start_request_metrics():
+    # Honour an id set by a proxy in front of us so logs can be correlated
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    metrics.REQUESTS_IN_FLIGHT.labels(g.metrics_route).inc()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics_start' in g:
+        elapsed = time.perf_counter() - g.metrics_start
+        metrics.REQUEST_LATENCY.labels(
+            g.metrics_route, request.method, str(response.status_code)
+        ).observe(elapsed)
+        logger.info("Request", extra={'method': request.method, 'route': g.metrics_route,
+                                      'status': response.status_code,
+                                      'duration_ms': round(elapsed * 1000, 2), **SAMPLED})
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if 'metrics_route' in g:
+        metrics.REQUESTS_IN_FLIGHT.labels(g.metrics_route).dec()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics (aggregated across gunicorn workers)"""
+    body, content_type = metrics.render()
+    return app.response_class(body, content_type=content_type)
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli-compress JSON responses that were not precompressed"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    encoding = negotiate_encoding()
+    if not encoding:
+        return response
+    response.set_data(compress_body(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        # Same entity, different bytes: the validator can only be weak now
+        response.set_etag(etag, weak=True)
+    return response
+
+# --- Rate limiting and admission control ---
+ROUTE_CLASSES = {
+    'proxy_audio': 'stream',
+    'serve_song': 'stream',
+    'hls_playlist': 'stream',
+    'hls_segment': 'stream',
+    'api_search': 'search',
+    'post_events': 'events',
+    'create_playlist': 'playlist',
+    'get_playlists': 'playlist',
+    'add_song_to_playlist': 'playlist',
+    'get_playlist_songs': 'playlist',
+    'remove_song_from_playlist': 'playlist',
+    'register': 'auth',
+    'login': 'auth',
+    'logout': 'auth',
+    'me': 'auth',
+    'metrics_endpoint': 'exempt',
+    'health_check': 'exempt',
+}
+PRIORITY_CLASSES = {'auth', 'playlist', 'exempt'}  # never shed
+
+rate_limiter = admission.RateLimiter(
+    {route_class: admission.parse_rate(os.environ.get(f"RATE_LIMIT_{route_class.upper()}", default))
+     for route_class, default in RATE_LIMIT_DEFAULTS.items()} if RATE_LIMITS_ENABLED else {},
+    max_clients=RATE_LIMIT_CLIENTS)
+busy_threads = admission.Gate(ADMISSION_LIMIT)
+proxy_streams = admission.Gate(MAX_PROXY_STREAMS)
+
+def request_route_class():
+    return ROUTE_CLASSES.get(request.endpoint, 'default')
+
+def client_key():
+    """Signed-in user, or the client IP for anonymous requests"""
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        claims = decode_jwt(auth.split(' ')[1])
+        if claims:
+            return f"user:{claims['uid']}"
+    return f"ip:{request.remote_addr}"
+
+def rejected_response(route_class, reason, retry_after):
+    metrics.REJECTED_REQUESTS.labels(route_class, reason).inc()
+    if reason == 'rate_limited':
+        response = jsonify({'error': 'Too many requests, slow down'})
+        response.status_code = 429
+    else:
+        response = jsonify({'error': 'Server busy, please retry'})
+        response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+@app.before_request
+def admit_request():
+    if request.method == 'OPTIONS':
+        return None
+    route_class = request_route_class()
+    if route_class == 'exempt':
+        return None
+    retry_after = rate_limiter.hit(route_class, client_key())
+    if retry_after:
+        return rejected_response(route_class, 'rate_limited', retry_after)
+    if not busy_threads.acquire(force=route_class in PRIORITY_CLASSES):
+        return rejected_response(route_class, 'overloaded', SHED_RETRY_AFTER)
+    g.admitted = True
+
+def release_when_sent(response, release):
+    """Call release once the body has been sent: a generator keeps its thread
+    busy after the view returns. Files (direct passthrough) bypass the close
+    callbacks and are sent quickly, so their slot is freed right away."""
+    if response.is_streamed and not response.direct_passthrough:
+        response.call_on_close(release)
+    else:
+        release()
+
+@app.after_request
+def release_admission(response):
+    if g.pop('admitted', False):
+        release_when_sent(response, busy_threads.release)
+    return response
+
+@app.teardown_request
+def release_admission_on_error(exc):
+    if g.pop('admitted', False):
+        busy_threads.release()
+
+def limit_proxy_streams(f):
+    """Cap concurrent proxied streams; the slot is held until the body is sent"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not proxy_streams.acquire():
+            return rejected_response('stream', 'stream_limit', SHED_RETRY_AFTER)
+        metrics.PROXY_STREAMS.inc()
+        def release():
+            metrics.PROXY_STREAMS.dec()
+            proxy_streams.release()
+        try:
+            response = app.make_response(f(*args, **kwargs))
+        except BaseException:
+            release()
+            raise
+        release_when_sent(response, release)
+        return response
+    return decorated
+
+def attach_remote_analysis(songs):
+    """Add gain_db/peak and gapless info to JioSaavn songs whose audio has
+    been analysed (after passing through the proxy cache); modifies the dicts
+    in place"""
+    remote = {}
+    for song in songs:
+        if song.get('source') == 'jiosaavn' and song.get('url'):
+            remote.setdefault(proxy_audio_key(song['url']), []).append(song)
+    if not remote:
+        return
+    for audio_key, (gain, peak, _) in loudness_db.results(keys=remote).items():
+        for song in remote[audio_key]:
+            song.update(gain_db=gain, peak=peak)
+    for audio_key, info in gapless_db.results(remote).items():
+        for song in remote[audio_key]:
+            song['gapless'] = dict(info)
+
+def remove_known_songs(store, songs):
+    """Drop remote songs that match a local song (or an earlier one in the
+    list) by normalized tags and duration"""
+    kept = []
+    seen = {}  # tag hash -> durations already kept
+    for song in songs:
+        tags = dedupe.tag_hash(song.get('title'), song.get('artist'))
+        duration = song.get('duration')
+        if tags:
+            if store.rows_matching_tags(tags, duration) or any(
+                    dedupe.same_duration(duration, d) for d in seen.get(tags, ())):
+                continue
+            seen.setdefault(tags, []).append(duration)
+        kept.append(song)
+    return kept
+
+def resolve_songs(song_ids):
+    """Resolve song ids to song dicts in one pass.
+
+    Local ids come from the library index (with precomputed bitrate, sample rate
+    and file size), demo ids from the popular list and JioSaavn ids from the
+    search cache; whatever is left is fetched from JioSaavn in a single request.
+    Returns a dict of id -> song copy; unknown ids are simply absent.
+    """
+    get_static_songs()  # make sure the index is fresh
+    found = {}
+    remote = []
+
+    with _library_lock:
+        store = _library['store']
+    for song_id in song_ids:
+        row = store.row_of(song_id)
+        if row is not None:
+            found[song_id] = store.full_row(row)
+    for song_id in song_ids:
+        if song_id in found:
+            continue
+        if song_id in DEMO_SONGS_BY_ID:
+            found[song_id] = dict(DEMO_SONGS_BY_ID[song_id])
+            continue
+        cached = get_cached_jiosaavn_song(song_id)
+        if cached:
+            found[song_id] = dict(cached)
+        elif not song_id.startswith(('static-', 'demo-', 'jiosaavn-')):
+            remote.append(song_id)
+
+    for song in fetch_jiosaavn_songs(remote):
+        if song['id'] in remote:
+            found[song['id']] = dict(song)
+
+    # Ensure HTTPS for external URLs
+    for song in found.values():
+        if song.get('source') == 'jiosaavn':
+            song['url'] = upgrade_url(song.get('url'))
+            if song.get('thumbnail'):
+                song['thumbnail'] = upgrade_url(song.get('thumbnail'))
+    attach_remote_analysis(found.values())
+    return found
+
 # API Routes
 @app.route('/api/songs')
 def api_songs():
     """Get combined list of static and popular API songs"""
     try:
         static_songs = get_static_songs()
-        print(f"Found {len(static_songs)} static songs")
+        static_rows = static_songs.canonical()  # one entry per song, copies left out
         
         # Get fewer popular songs to reduce load time
-        popular_songs = get_popular_songs(5)
-        print(f"Found {len(popular_songs)} popular songs")
+        popular_songs = remove_known_songs(static_songs, get_popular_songs(5, remote_only=True))
         
-        all_songs = static_songs + popular_songs
-        # Shuffle the song list for randomness on every request
-        random.shuffle(all_songs)
+        total = len(static_rows) + len(popular_songs)
+        # Shuffle positions for randomness on every request; only the page is materialized
+        order = list(range(total))
+        random.shuffle(order)
 
         # Pagination
         page = request.args.get('page', 1, type=int)
@@ -553,19 +1829,21 @@ def api_songs():
 
         start_idx = (page - 1) * per_page
         end_idx = start_idx + per_page
-        paginated_songs = all_songs[start_idx:end_idx]
+        n_static = len(static_rows)
+        paginated_songs = [
+            static_songs.row(static_rows[i]) if i < n_static else popular_songs[i - n_static]
+            for i in order[start_idx:end_idx]
+        ]
 
         return jsonify({
-            'songs': paginated_songs,
-            'total': len(all_songs),
+            'songs': select_fields(paginated_songs),
+            'total': total,
             'page': page,
             'per_page': per_page,
-            'total_pages': (len(all_songs) + per_page - 1) // per_page
+            'total_pages': (total + per_page - 1) // per_page
         })
     except Exception as e:
-        print(f"Error in api_songs: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in api_songs")
         return jsonify({'error': 'Failed to fetch songs'}), 500
 
 @app.route('/api/search')
@@ -575,19 +1853,14 @@ def api_search():
         query = request.args.get('q', '')
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
-        print(f"Search request: query='{query}', page={page}, per_page={per_page}")
         if not query:
             return jsonify({'error': 'Query parameter required'}), 400
         # Search static songs first
         static_songs = get_static_songs()
-        matching_static = [
-            song for song in static_songs 
-            if query.lower() in song['title'].lower() or query.lower() in song['artist'].lower()
-        ]
-        print(f"Found {len(matching_static)} matching static songs")
-        # Search JioSaavn API
+        matching_static = static_songs.rows(static_songs.collapse(static_songs.search(query)))
+        # Search JioSaavn API, leaving out songs we already have
         jiosaavn_songs, total_found = search_jiosaavn(query, page, per_page)
-        print(f"Found {len(jiosaavn_songs)} JioSaavn songs")
+        jiosaavn_songs = remove_known_songs(static_songs, jiosaavn_songs)
         # Combine results (static songs first)
         # Ensure all external URLs are HTTPS in the response
         def secure_song(song):
@@ -599,8 +1872,9 @@ def api_search():
             return song
 
         all_results = [secure_song(song) for song in matching_static + jiosaavn_songs]
+        attach_remote_analysis(all_results)
         response_data = {
-            'songs': all_results,
+            'songs': select_fields(all_results),
             'total': len(matching_static) + total_found,
             'page': page,
             'per_page': per_page,
@@ -608,12 +1882,11 @@ def api_search():
             'static_matches': len(matching_static),
             'api_matches': len(jiosaavn_songs)
         }
-        print(f"Returning {len(all_results)} total songs")
+        logger.debug("Search", extra={'query': query, 'page': page, 'static_matches': len(matching_static),
+                                      'api_matches': len(jiosaavn_songs), **SAMPLED})
         return jsonify(response_data)
     except Exception as e:
-        print(f"Error in api_search: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in api_search")
         return jsonify({'error': 'Search failed'}), 500
 
 @app.route('/api/random')
@@ -621,10 +1894,11 @@ def api_random():
     """Get a random song for default selection"""
     try:
         static_songs = get_static_songs()
+        static_rows = static_songs.canonical()
         
-        if static_songs:
+        if static_rows:
             # Prefer static songs for random selection
-            return jsonify(static_songs[random.randrange(len(static_songs))])
+            return jsonify(static_songs.row(random.choice(static_rows)))
         else:
             # Fallback to popular songs
             popular_songs = get_popular_songs(5)
@@ -636,23 +1910,154 @@ def api_random():
                 return jsonify(song)
         return jsonify({'error': 'No songs available'}), 404
     except Exception as e:
-        print(f"Error in api_random: {e}")
+        logger.exception("Error in api_random")
         return jsonify({'error': 'Failed to get random song'}), 500
 
 @app.route('/songs/<filename>')
 def serve_song(filename):
     """Serve static audio files"""
-    return send_from_directory(os.path.join(app.static_folder, 'songs'), filename)
+    return send_from_directory(SONGS_FOLDER, filename)
+
+@app.route('/api/artwork/<key>/<int:size>')
+def serve_artwork(key, size):
+    """Embedded cover art of local tracks, at the nearest standard size"""
+    found = artwork.path(ARTWORK_DIR, key, size)
+    if found is None:
+        return jsonify({'error': 'Artwork not found'}), 404
+    path, mimetype = found
+    response = send_from_directory(os.path.abspath(os.path.dirname(path)), os.path.basename(path),
+                                   mimetype=mimetype, max_age=ARTWORK_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# --- HLS delivery ---
+# Local MP3s are also offered as HLS: a playlist per song and small segments
+# that are cut on first request and cached under cache/hls/<stream key>/.
+# The stream key names the exact file contents, so segment URLs never change
+# meaning and can be cached anywhere for good.
+HLS_DIR = os.path.join(CACHE_DIR, 'hls')
+HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', hls.SEGMENT_SECONDS))
+HLS_SEGMENT_MAX_AGE = 365 * 24 * 3600
+HLS_STREAM_KEY = re.compile(r'^(static-\d+)-\d+-\d+-\d+$')
+
+def hls_stream(store, row):
+    """(stream key, cache directory, source file) of a local song's HLS rendition"""
+    stream_key = f"{local_audio_key(store, row)}-{HLS_SEGMENT_SECONDS}"
+    return stream_key, os.path.join(HLS_DIR, stream_key), os.path.join(SONGS_FOLDER, store.filename(row))
+
+def hls_index(store, row):
+    stream_key, directory, source = hls_stream(store, row)
+    if not os.path.exists(directory) and os.path.isdir(HLS_DIR):
+        # Renditions of earlier versions of the file can no longer be requested
+        prefix = f"{store.song_id(row)}-"
+        for name in os.listdir(HLS_DIR):
+            if name.startswith(prefix):
+                shutil.rmtree(os.path.join(HLS_DIR, name), ignore_errors=True)
+    return hls.load_index(directory, source, HLS_SEGMENT_SECONDS)
+
+@app.route('/api/songs/<song_id>/playlist.m3u8')
+def hls_playlist(song_id):
+    """HLS media playlist of a local MP3"""
+    try:
+        store = get_static_songs()
+        row = store.row_of(song_id)
+        if row is None:
+            return jsonify({'error': 'Song not found'}), 404
+        if not store.filename(row).lower().endswith('.mp3'):
+            return jsonify({'error': 'HLS is only available for MP3 files'}), 415
+        stream_key = hls_stream(store, row)[0]
+        if not_modified(stream_key):
+            return not_modified_response(stream_key)
+        body = hls.playlist(hls_index(store, row), lambda n: f"/api/hls/{stream_key}/{n}.mp3")
+        response = app.response_class(body, mimetype='application/vnd.apple.mpegurl')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.set_etag(stream_key)
+        return response
+    except hls.UnsupportedFormat:
+        return jsonify({'error': 'No MPEG audio found in file'}), 415
+    except Exception as e:
+        logger.exception("Error building HLS playlist")
+        return jsonify({'error': 'Failed to build playlist'}), 500
+
+@app.route('/api/hls/<stream_key>/<int:segment>.mp3')
+def hls_segment(stream_key, segment):
+    """One HLS segment (immutable: a changed file gets a new stream key)"""
+    try:
+        store = get_static_songs()
+        match = HLS_STREAM_KEY.match(stream_key)
+        row = store.row_of(match.group(1)) if match else None
+        if row is None or hls_stream(store, row)[0] != stream_key:
+            return jsonify({'error': 'Segment not found'}), 404
+        index = hls_index(store, row)
+        if not 0 <= segment < len(index['segments']):
+            return jsonify({'error': 'Segment not found'}), 404
+        _, directory, source = hls_stream(store, row)
+        path = hls.segment_path(directory, source, index, segment)
+        response = send_from_directory(os.path.abspath(directory), os.path.basename(path),
+                                       mimetype='audio/mpeg', max_age=HLS_SEGMENT_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+    except Exception as e:
+        logger.exception("Error serving HLS segment")
+        return jsonify({'error': 'Failed to get segment'}), 500
+
+# --- Proxied audio cache ---
+# Complete proxied files are kept on disk (least recently used evicted first),
+# so replays skip the CDN and background analysis can read them.
+PROXY_CACHE_DIR = os.path.join(CACHE_DIR, 'audio')
+PROXY_CACHE_MAX_BYTES = int(os.environ.get('PROXY_CACHE_MAX_BYTES', 2 * 1024 ** 3))  # 0 disables
+PROXY_CACHE_MAX_FILE = 50 * 1024 ** 2  # larger responses are streamed but not kept
+
+def proxy_cache_key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:24]
+
+def proxy_cache_path(url):
+    return os.path.join(PROXY_CACHE_DIR, f"{proxy_cache_key(url)}.audio")
+
+def prune_proxy_cache():
+    try:
+        entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(PROXY_CACHE_DIR)
+                   if e.name.endswith('.audio')]
+    except FileNotFoundError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= PROXY_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+PROXY_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET',
+    'Access-Control-Allow-Headers': 'Range',
+}
 
 @app.route('/proxy/audio/<path:audio_url>')
+@limit_proxy_streams
 def proxy_audio(audio_url):
     """Proxy audio files from external sources to bypass CORS"""
     try:
         # Decode the URL
         decoded_url = urllib.parse.unquote(audio_url)
-        
-        print(f"Proxying audio from: {decoded_url}")
-        
+
+        cache_path = proxy_cache_path(decoded_url)
+        if PROXY_CACHE_MAX_BYTES:
+            cached = os.path.exists(cache_path)
+            metrics.cache_lookup('proxy_audio', cached)
+            if cached:
+                os.utime(cache_path)  # recently used, evicted last
+                response = send_from_directory(os.path.abspath(PROXY_CACHE_DIR), os.path.basename(cache_path),
+                                               mimetype=mimetypes.guess_type(decoded_url)[0] or 'audio/mpeg',
+                                               max_age=3600, conditional=True)
+                response.headers.update(PROXY_CORS_HEADERS)
+                return response
+
         # Add headers to mimic a real browser request
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -667,17 +2072,43 @@ def proxy_audio(audio_url):
             del headers['Range']
         
         # Stream the audio file
-        response = requests.get(decoded_url, stream=True, timeout=30, headers=headers)
+        with metrics.track_upstream('cdn', 'audio'):
+            response = requests.get(decoded_url, stream=True, timeout=30, headers=headers)
         
-        print(f"Remote response status: {response.status_code}")
-        print(f"Remote response headers: {dict(response.headers)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Proxying audio", extra={'url': decoded_url, 'status': response.status_code,
+                                                  'headers': dict(response.headers), **SAMPLED})
         
         if response.status_code in [200, 206]:
+            content_length = int(response.headers.get('Content-Length') or 0)
+            keep = (PROXY_CACHE_MAX_BYTES and response.status_code == 200
+                    and 0 < content_length <= PROXY_CACHE_MAX_FILE)
+
             # Forward the audio stream with proper headers
             def generate():
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        yield chunk
+                tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                out = None
+                if keep:
+                    os.makedirs(PROXY_CACHE_DIR, exist_ok=True)
+                    out = open(tmp_path, 'wb')
+                try:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            metrics.PROXY_BYTES.inc(len(chunk))
+                            if out:
+                                out.write(chunk)
+                            yield chunk
+                    if out:
+                        out.close()
+                        if os.path.getsize(tmp_path) == content_length:
+                            os.replace(tmp_path, cache_path)
+                            prune_proxy_cache()
+                finally:
+                    # Client went away (or the upstream broke off): drop the partial copy
+                    if out:
+                        out.close()
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
             
             # Get content type from original response
             content_type = response.headers.get('content-type', 'audio/mpeg')
@@ -685,9 +2116,7 @@ def proxy_audio(audio_url):
             proxy_headers = {
                 'Accept-Ranges': 'bytes',
                 'Cache-Control': 'public, max-age=3600',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET',
-                'Access-Control-Allow-Headers': 'Range',
+                **PROXY_CORS_HEADERS,
             }
             if response.headers.get('Content-Length'):
                 proxy_headers['Content-Length'] = response.headers['Content-Length']
@@ -702,16 +2131,144 @@ def proxy_audio(audio_url):
             )
             return flask_response
         else:
-            print(f"Failed to fetch audio: {response.status_code}")
-            print(f"Response text: {response.text[:200]}")
+            metrics.upstream_status_error('cdn', 'audio', response.status_code)
+            logger.warning("Failed to fetch audio", extra={'url': decoded_url, 'status': response.status_code})
             return jsonify({'error': f'Failed to fetch audio: {response.status_code}'}), response.status_code
             
     except Exception as e:
-        print(f"Error proxying audio: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error proxying audio")
         return jsonify({'error': 'Failed to proxy audio'}), 500
 
+# --- Background audio analysis ---
+# Decoding audio is slow, so local tracks and cached proxy audio are analysed
+# by a background thread and the results stored under cache/. Every worker
+# runs the thread, but an exclusive file lock lets only one of them work
+# through a pass at a time; the others find the results on disk.
+ANALYSIS_ENABLED = os.environ.get('ANALYSIS_ENABLED', '1') != '0'
+ANALYSIS_INTERVAL = 60  # seconds between passes
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', os.cpu_count() or 1))  # ffmpeg processes at once
+ANALYSIS_LOCK = os.path.join(CACHE_DIR, 'analysis.lock')
+WAVEFORM_DIR = os.path.join(CACHE_DIR, 'waveforms')
+loudness_db = loudness.LoudnessDB(os.path.join(CACHE_DIR, 'analysis.db'))
+gapless_db = gapless.GaplessDB(loudness_db.path)  # cached proxy audio only, see gapless.py
+
+_analysis = {'pid': None, 'failed': set(), 'warned': False}
+_analysis_lock = threading.Lock()
+
+def file_audio_key(song_id, mtime, file_size):
+    # Identifies the file's contents: results survive re-indexing, not edits
+    return f"{song_id}-{int(mtime * 1000)}-{file_size}"
+
+def local_audio_key(store, row):
+    return file_audio_key(store.song_id(row), store.stat(row)['mtime'], store.tech(row)['file_size'])
+
+def proxy_audio_key(url):
+    return f"proxy-{proxy_cache_key(url)}"
+
+def waveform_path(audio_key):
+    return os.path.join(WAVEFORM_DIR, f"{audio_key}.peaks")
+
+def cached_proxy_sources():
+    """(audio key, file path) of every complete file in the proxy cache"""
+    if os.path.isdir(PROXY_CACHE_DIR):
+        for entry in os.scandir(PROXY_CACHE_DIR):
+            if entry.name.endswith('.audio'):
+                yield f"proxy-{entry.name[:-len('.audio')]}", entry.path
+
+def analysis_sources():
+    """(audio key, file path) of every track that can be analysed"""
+    store = get_static_songs()
+    for row in range(len(store)):
+        yield local_audio_key(store, row), os.path.join(SONGS_FOLDER, store.row(row)['filename'])
+    yield from cached_proxy_sources()
+
+def record_proxy_gapless():
+    """Parse the encoder header of cached proxy audio not seen before (local
+    tracks get theirs at index time)"""
+    known = gapless_db.known_keys()
+    results = {}
+    for audio_key, path in cached_proxy_sources():
+        if audio_key not in known:
+            try:
+                results[audio_key] = gapless.read(path)
+            except OSError:
+                continue  # evicted meanwhile
+    if results:
+        gapless_db.record(results)
+
+def analyse_track(audio_key, path, stages):
+    """Run the missing analysis stages for one track"""
+    if 'waveform' in stages:
+        try:
+            duration_ms, levels = waveform.compute(path)
+            waveform.save(waveform_path(audio_key), duration_ms, levels)
+        except Exception as e:
+            _analysis['failed'].add(audio_key)
+            logger.warning("Could not compute waveform", extra={'file': path, 'error': str(e)})
+    if 'loudness' in stages:
+        try:
+            integrated, peak = loudness.measure(path)
+        except Exception as e:
+            # Recorded anyway, so a broken file is not measured again every pass
+            integrated = peak = None
+            logger.warning("Could not measure loudness", extra={'file': path, 'error': str(e)})
+        loudness_db.record(audio_key, integrated, peak)
+
+def run_analysis_pass():
+    """Analyse whatever has no results yet (no-op if another worker is at it).
+
+    Results are written per track as they complete, so an interrupted pass
+    resumes where it stopped; tracks are analysed ANALYSIS_WORKERS at a time.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(ANALYSIS_LOCK, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        record_proxy_gapless()  # header parsing, needs no decoder
+        if not waveform.ffmpeg_path():
+            if not _analysis['warned']:
+                logger.warning("ffmpeg not found, audio analysis disabled")
+                _analysis['warned'] = True
+            return
+        measured = loudness_db.known_keys()
+        jobs = []
+        for audio_key, path in analysis_sources():
+            stages = []
+            if audio_key not in _analysis['failed'] and not os.path.exists(waveform_path(audio_key)):
+                stages.append('waveform')
+            if audio_key not in measured:
+                stages.append('loudness')
+            if stages:
+                jobs.append((audio_key, path, stages))
+        if not jobs:
+            return
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix='audio-analysis') as pool:
+            for job in jobs:
+                pool.submit(analyse_track, *job)
+        logger.info("Audio analysis pass", extra={'tracks': len(jobs),
+                                                  'duration_ms': round((time.perf_counter() - started) * 1000)})
+
+def _analysis_loop():
+    while True:
+        try:
+            run_analysis_pass()
+        except Exception:
+            logger.exception("Error in audio analysis")
+        time.sleep(ANALYSIS_INTERVAL)
+
+@app.before_request
+def start_background_analysis():
+    # Threads do not survive fork, so each (gunicorn worker) process starts its own
+    if not ANALYSIS_ENABLED or _analysis['pid'] == os.getpid():
+        return
+    with _analysis_lock:
+        if _analysis['pid'] != os.getpid():
+            _analysis['pid'] = os.getpid()
+            threading.Thread(target=_analysis_loop, name='audio-analysis', daemon=True).start()
+
 # Serve React static files
 # @app.route('/', defaults={'path': ''})
 # @app.route('/<path:path>')
@@ -751,9 +2308,7 @@ def debug_search(query):
             'songs': songs
         })
     except Exception as e:
-        import traceback
-        print(f"Debug search error: {e}")
-        traceback.print_exc()
+        logger.exception("Debug search error")
         return jsonify({'error': str(e)}), 500
 
 # Raw API test endpoint
@@ -946,7 +2501,7 @@ def test_all():
     results['app_info'] = {
         'status': 'success',
         'static_folder': app.static_folder,
-        'songs_folder_exists': os.path.exists(os.path.join(app.static_folder, 'songs')),
+        'songs_folder_exists': os.path.exists(SONGS_FOLDER),
         'available_routes': [
             '/api/songs',
             '/api/search',
@@ -970,187 +2525,361 @@ def api_songs_shuffle():
     """Get a shuffled list of all songs"""
     try:
         static_songs = get_static_songs()
-        popular_songs = get_popular_songs(10)
-        all_songs = static_songs + popular_songs
-        
-        import random
-        shuffled = all_songs.copy()
+        popular_songs = remove_known_songs(static_songs, get_popular_songs(10, remote_only=True))
+        shuffled = static_songs.rows(static_songs.canonical()) + popular_songs
         random.shuffle(shuffled)
         
         return jsonify({
-            'songs': shuffled,
+            'songs': select_fields(shuffled),
             'total': len(shuffled),
             'shuffled': True
         })
     except Exception as e:
-        print(f"Error in shuffle: {e}")
+        logger.exception("Error in shuffle")
         return jsonify({'error': 'Failed to shuffle songs'}), 500
 
+@app.route('/api/catalog')
+def api_catalog():
+    """Full local catalog snapshot with its version (for offline clients)"""
+    try:
+        version = catalog_version()
+
+        def build():
+            store = get_static_songs()
+            songs = select_fields(store.rows(store.canonical()))
+            return {'version': version, 'songs': songs, 'total': len(songs)}
+
+        return cached_json_response(version, build, etag=catalog_etag(version))
+    except Exception as e:
+        logger.exception("Error in api_catalog")
+        return jsonify({'error': 'Failed to get catalog'}), 500
+
+@app.route('/api/catalog/changes')
+def api_catalog_changes():
+    """Songs added, updated or removed since ?since=<version>"""
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({'error': 'since parameter required'}), 400
+        version = catalog_version()
+
+        def build():
+            current, changes = get_catalog_changes(since)
+            if changes is None:
+                # Client must re-download /api/catalog
+                return {'version': current, 'since': since, 'reset': True}
+            return {
+                'version': current,
+                'since': since,
+                'reset': False,
+                'added': select_fields(changes['added']),
+                'updated': select_fields(changes['updated']),
+                'removed': changes['removed']
+            }
+
+        return cached_json_response((since, version), build, etag=catalog_etag(since, version))
+    except Exception as e:
+        logger.exception("Error in api_catalog_changes")
+        return jsonify({'error': 'Failed to get catalog changes'}), 500
+
+@app.route('/api/songs/popular')
+def api_songs_popular():
+    """Most played songs of a window (?window=day|week|all, default week)"""
+    try:
+        window = request.args.get('window', 'week')
+        if window not in popularity.WINDOWS:
+            return jsonify({'error': f"window must be one of {', '.join(popularity.WINDOWS)}"}), 400
+        limit = min(max(request.args.get('limit', 20, type=int), 1), POPULAR_TOP_N)
+        songs = get_popular_songs(limit, window)
+        scores = _popular['rankings'].get(window, {}).get('scores', {})
+        for song in songs:
+            song['score'] = scores.get(song['id'])
+        return jsonify({
+            'window': window,
+            'songs': select_fields(songs),
+            'total': len(songs)
+        })
+    except Exception as e:
+        logger.exception("Error getting popular songs")
+        return jsonify({'error': 'Failed to get popular songs'}), 500
+
+@app.route('/api/songs/<song_id>/radio')
+def api_song_radio(song_id):
+    """Songs to play after a seed song, from playlists that contain it"""
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), radio.TOP_K)
+        songs = []
+        for song, score in get_radio_songs(song_id, limit):
+            song['score'] = score
+            songs.append(song)
+        fallback = not songs
+        if fallback:
+            # Nobody has kept this song with others yet: play what is popular
+            songs = [s for s in get_popular_songs(limit + 1) if s['id'] != song_id][:limit]
+        return jsonify({
+            'seed': song_id,
+            'songs': select_fields(songs),
+            'total': len(songs),
+            'fallback': fallback
+        })
+    except Exception as e:
+        logger.exception("Error getting radio")
+        return jsonify({'error': 'Failed to get radio'}), 500
+
+@app.route('/api/songs/batch', methods=['GET', 'POST'])
+def api_songs_batch():
+    """Get information about many songs at once (local and JioSaavn ids)"""
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            if not isinstance(data, dict):
+                return jsonify({'error': 'Request body must be a JSON object'}), 400
+            song_ids = data.get('ids') or []
+        else:
+            song_ids = request.args.get('ids', '').split(',')
+        if not isinstance(song_ids, list):
+            return jsonify({'error': 'ids must be a list'}), 400
+
+        # De-duplicate while keeping the caller's order
+        song_ids = list(dict.fromkeys(str(s).strip() for s in song_ids if str(s).strip()))
+        if not song_ids:
+            return jsonify({'error': 'ids parameter required'}), 400
+        if len(song_ids) > MAX_BATCH_IDS:
+            return jsonify({'error': f'At most {MAX_BATCH_IDS} ids per request'}), 400
+
+        found = resolve_songs(song_ids)
+        return jsonify({
+            'songs': select_fields([found[s] for s in song_ids if s in found]),
+            'missing': [s for s in song_ids if s not in found],
+            'total': len(found)
+        })
+    except Exception as e:
+        logger.exception("Error in batch song lookup")
+        return jsonify({'error': 'Failed to get songs'}), 500
+
 @app.route('/api/songs/<song_id>/info')
 def api_song_info(song_id):
     """Get detailed information about a specific song"""
     try:
-        static_songs = get_static_songs()
-        popular_songs = get_popular_songs(20)
-        all_songs = static_songs + popular_songs
-
-        song = next((s for s in all_songs if s['id'] == song_id), None)
+        song = resolve_songs([song_id]).get(song_id)
 
         if not song:
             return jsonify({'error': 'Song not found'}), 404
 
-        # Add extra metadata if it's a static song
-        if song['source'] == 'static':
-            file_path = os.path.join(app.static_folder, 'songs', song.get('filename', ''))
-            if os.path.exists(file_path):
-                try:
-                    audio = MP3(file_path)
-                    song['bitrate'] = audio.info.bitrate if hasattr(audio.info, 'bitrate') else None
-                    song['sample_rate'] = audio.info.sample_rate if hasattr(audio.info, 'sample_rate') else None
-                    song['file_size'] = os.path.getsize(file_path)
-                except:
-                    pass
-        # Ensure HTTPS for external URLs
-        if song.get('source') == 'jiosaavn':
-            song['url'] = upgrade_url(song.get('url'))
-            if song.get('thumbnail'):
-                song['thumbnail'] = upgrade_url(song.get('thumbnail'))
-
         return jsonify(song)
     except Exception as e:
-        print(f"Error getting song info: {e}")
+        logger.exception("Error getting song info")
         return jsonify({'error': 'Failed to get song info'}), 500
 
+@app.route('/api/songs/<song_id>/waveform')
+def api_song_waveform(song_id):
+    """Waveform peaks for the seek bar (binary, see waveform.py for the layout)"""
+    try:
+        buckets = request.args.get('buckets', 1024, type=int)
+        store = get_static_songs()
+        row = store.row_of(song_id)
+        if row is not None:
+            audio_key = local_audio_key(store, row)
+        else:
+            song = resolve_songs([song_id]).get(song_id)
+            if not song:
+                return jsonify({'error': 'Song not found'}), 404
+            if not os.path.exists(proxy_cache_path(song['url'])):
+                # Remote audio is only analysed once it has been played through the proxy
+                return jsonify({'error': 'Waveform not available for this song'}), 404
+            audio_key = proxy_audio_key(song['url'])
+
+        body = waveform.load_level(waveform_path(audio_key), buckets)
+        if body is None and not (ANALYSIS_ENABLED and waveform.ffmpeg_path()):
+            return jsonify({'error': 'Waveform analysis is not available'}), 404
+        if body is None:
+            response = jsonify({'status': 'pending'})
+            response.status_code = 202
+            response.headers['Retry-After'] = str(ANALYSIS_INTERVAL)
+            return response
+
+        etag = f"waveform-{audio_key}-{len(body)}"
+        if not_modified(etag):
+            return not_modified_response(etag)
+        response = app.response_class(body, mimetype='application/octet-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        logger.exception("Error getting waveform")
+        return jsonify({'error': 'Failed to get waveform'}), 500
+
 @app.route('/api/songs/by-artist/<artist_name>')
 def api_songs_by_artist(artist_name):
     """Get all songs by a specific artist"""
     try:
         static_songs = get_static_songs()
-        popular_songs = get_popular_songs(20)
-        all_songs = static_songs + popular_songs
+        popular_songs = remove_known_songs(static_songs, get_popular_songs(20, remote_only=True))
         
-        artist_songs = [
-            song for song in all_songs 
+        artist_songs = static_songs.rows(static_songs.collapse(static_songs.rows_by_artist(artist_name))) + [
+            song for song in popular_songs 
             if artist_name.lower() in song['artist'].lower()
         ]
         
         return jsonify({
             'artist': artist_name,
-            'songs': artist_songs,
+            'songs': select_fields(artist_songs),
             'total': len(artist_songs)
         })
     except Exception as e:
-        print(f"Error getting songs by artist: {e}")
+        logger.exception("Error getting songs by artist")
         return jsonify({'error': 'Failed to get songs by artist'}), 500
 
 @app.route('/api/artists')
 def api_artists():
     """Get list of all artists"""
     try:
-        static_songs = get_static_songs()
-        popular_songs = get_popular_songs(20)
-        all_songs = static_songs + popular_songs
-        
-        artists = {}
-        for song in all_songs:
-            artist = song['artist']
-            if artist not in artists:
-                artists[artist] = {
-                    'name': artist,
-                    'song_count': 0,
-                    'albums': set()
-                }
-            artists[artist]['song_count'] += 1
-            if song.get('album'):
-                artists[artist]['albums'].add(song['album'])
-        
-        # Convert sets to lists for JSON serialization
-        for artist in artists.values():
-            artist['albums'] = list(artist['albums'])
-            artist['album_count'] = len(artist['albums'])
-        
-        return jsonify({
-            'artists': list(artists.values()),
-            'total': len(artists)
-        })
+        def build():
+            static_songs = get_static_songs()
+            popular_songs = remove_known_songs(static_songs, get_popular_songs(20, remote_only=True))
+            all_songs = static_songs.rows(static_songs.canonical()) + popular_songs
+            
+            artists = {}
+            for song in all_songs:
+                artist = song['artist']
+                if artist not in artists:
+                    artists[artist] = {
+                        'name': artist,
+                        'song_count': 0,
+                        'albums': set()
+                    }
+                artists[artist]['song_count'] += 1
+                if song.get('album'):
+                    artists[artist]['albums'].add(song['album'])
+            
+            # Convert sets to lists for JSON serialization
+            for artist in artists.values():
+                artist['albums'] = list(artist['albums'])
+                artist['album_count'] = len(artist['albums'])
+            
+            return {
+                'artists': list(artists.values()),
+                'total': len(artists)
+            }
+
+        return cached_json_response((catalog_version(), popular_version()), build)
     except Exception as e:
-        print(f"Error getting artists: {e}")
+        logger.exception("Error getting artists")
         return jsonify({'error': 'Failed to get artists'}), 500
 
 @app.route('/api/albums')
 def api_albums():
     """Get list of all albums"""
     try:
-        static_songs = get_static_songs()
-        popular_songs = get_popular_songs(20)
-        all_songs = static_songs + popular_songs
-        
-        albums = {}
-        for song in all_songs:
-            album = song.get('album') or 'Unknown Album'
-            if album not in albums:
-                albums[album] = {
-                    'name': album,
-                    'artist': song['artist'],
-                    'year': song.get('year'),
-                    'songs': [],
-                    'duration': 0
-                }
-            albums[album]['songs'].append(song)
-            if song.get('duration'):
-                albums[album]['duration'] += song['duration']
-        
-        # Convert to list and add metadata
-        album_list = []
-        for album_name, album_data in albums.items():
-            album_data['song_count'] = len(album_data['songs'])
-            album_data['id'] = f"album-{len(album_list)}"
-            album_list.append(album_data)
-        
-        return jsonify({
-            'albums': album_list,
-            'total': len(album_list)
-        })
+        def build():
+            static_songs = get_static_songs()
+            popular_songs = remove_known_songs(static_songs, get_popular_songs(20, remote_only=True))
+            all_songs = static_songs.rows(static_songs.canonical()) + popular_songs
+            
+            albums = {}
+            for song in all_songs:
+                album = song.get('album') or 'Unknown Album'
+                if album not in albums:
+                    albums[album] = {
+                        'name': album,
+                        'artist': song.get('artist'),
+                        'year': song.get('year'),
+                        'songs': [],
+                        'duration': 0
+                    }
+                albums[album]['songs'].append(song)
+                if song.get('duration'):
+                    albums[album]['duration'] += song['duration']
+            
+            # Convert to list and add metadata
+            album_list = []
+            for album_name, album_data in albums.items():
+                # Grouped on full rows; ?fields= only trims the listed songs
+                album_data['songs'] = select_fields(album_data['songs'])
+                album_data['song_count'] = len(album_data['songs'])
+                album_data['id'] = f"album-{len(album_list)}"
+                album_list.append(album_data)
+            
+            return {
+                'albums': album_list,
+                'total': len(album_list)
+            }
+
+        return cached_json_response((catalog_version(), popular_version()), build)
     except Exception as e:
-        print(f"Error getting albums: {e}")
+        logger.exception("Error getting albums")
         return jsonify({'error': 'Failed to get albums'}), 500
 
+@app.route('/api/duplicates')
+def api_duplicates():
+    """Local songs stored more than once, and the space removing the copies frees"""
+    try:
+        def build():
+            store = get_static_songs()
+            groups = []
+            for canonical, rows in store.duplicate_groups().items():
+                copies = [dict(store.tech(row), id=store.song_id(row), filename=store.filename(row))
+                          for row in rows]
+                groups.append({
+                    'song': store.full_row(canonical),
+                    'copies': copies,
+                    'reclaimable_bytes': sum(c['file_size'] for c in copies)
+                })
+            groups.sort(key=lambda g: g['reclaimable_bytes'], reverse=True)
+            return {
+                'groups': groups,
+                'total': len(groups),
+                'duplicate_songs': sum(len(g['copies']) for g in groups),
+                'reclaimable_bytes': sum(g['reclaimable_bytes'] for g in groups)
+            }
+
+        return cached_json_response(catalog_version(), build)
+    except Exception as e:
+        logger.exception("Error getting duplicates")
+        return jsonify({'error': 'Failed to get duplicates'}), 500
+
 @app.route('/api/stats')
 def api_stats():
     """Get music library statistics"""
     try:
-        static_songs = get_static_songs()
-        popular_songs = get_popular_songs(20)
-        
-        total_duration = sum(song.get('duration', 0) for song in static_songs if song.get('duration'))
-        
-        artists = set(song['artist'] for song in static_songs)
-        albums = set(song.get('album') for song in static_songs if song.get('album'))
-        
-        years = [song.get('year') for song in static_songs if song.get('year')]
-        year_range = f"{min(years)}-{max(years)}" if years else "Unknown"
-        
-        return jsonify({
-            'total_songs': len(static_songs),
-            'demo_songs': len(popular_songs),
-            'total_artists': len(artists),
-            'total_albums': len(albums),
-            'total_duration': total_duration,
-            'total_duration_formatted': f"{total_duration // 3600}h {(total_duration % 3600) // 60}m",
-            'year_range': year_range,
-            'formats_supported': list(ALLOWED_EXTENSIONS),
-            'library_size_mb': sum(
-                os.path.getsize(os.path.join(app.static_folder, 'songs', song['filename'])) 
-                for song in static_songs 
-                if song.get('filename') and os.path.exists(os.path.join(app.static_folder, 'songs', song['filename']))
-            ) / (1024 * 1024)
-        })
+        def build():
+            static_songs = get_static_songs()
+            popular_songs = get_popular_songs(20, remote_only=True)
+            library_bytes = static_songs.total_file_size()
+            
+            total_duration = static_songs.total_duration()
+            
+            artists = static_songs.artist_names()
+            albums = static_songs.album_names()
+            
+            years = static_songs.years()
+            year_range = f"{min(years)}-{max(years)}" if years else "Unknown"
+
+            copies = [row for rows in static_songs.duplicate_groups().values() for row in rows]
+            reclaimable = sum(static_songs.tech(row)['file_size'] for row in copies)
+            
+            return {
+                'total_songs': len(static_songs.canonical()),  # copies count in reclaimable_mb
+                'demo_songs': len(popular_songs),
+                'total_artists': len(artists),
+                'total_albums': len(albums),
+                'total_duration': total_duration,
+                'total_duration_formatted': f"{total_duration // 3600}h {(total_duration % 3600) // 60}m",
+                'year_range': year_range,
+                'formats_supported': list(ALLOWED_EXTENSIONS),
+                'library_size_mb': library_bytes / (1024 * 1024),
+                'duplicate_songs': len(copies),
+                'reclaimable_mb': reclaimable / (1024 * 1024)
+            }
+
+        return cached_json_response((catalog_version(), popular_version()), build)
     except Exception as e:
-        print(f"Error getting stats: {e}")
+        logger.exception("Error getting stats")
         return jsonify({'error': 'Failed to get stats'}), 500
 
 
 # --- Production Note ---
 # For production, run this app with a WSGI server such as gunicorn:
-#   gunicorn -w 4 -b 0.0.0.0:5600 app:app
+#   gunicorn -c gunicorn.conf.py app:app
+# (4 workers sharing one preloaded library index; see gunicorn.conf.py)
 # Do NOT use Flask's built-in server in production.
\ No newline at end of file
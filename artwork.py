@@ -0,0 +1,97 @@
+"""Embedded cover art for local tracks.
+
+Artwork is read from a file's ID3 APIC frames while the library is indexed,
+scaled down to a few standard sizes and written to disk under a name derived
+from the image bytes. Tracks that share a cover (an album) share the files,
+each image is only processed once, and the URLs never change meaning, so
+they can be cached by clients indefinitely.
+
+Resizing needs Pillow; without it the embedded image is stored and served
+unchanged for every size.
+"""
+import hashlib
+import io
+import os
+import re
+
+try:
+    from PIL import Image
+except ImportError:  # optional, artwork is served at its original size
+    Image = None
+
+SIZES = (64, 200, 500)  # pixels, longest side
+JPEG_QUALITY = 85
+
+_KEY = re.compile(r'^[0-9a-f]{24}$')
+_PICTURE_FRONT_COVER = 3
+
+
+def extract(tags):
+    """Image bytes of the front cover (or else the first picture), or None"""
+    pictures = tags.getall('APIC') if tags is not None else []
+    pictures = [p for p in pictures if p.data]
+    if not pictures:
+        return None
+    front = [p for p in pictures if p.type == _PICTURE_FRONT_COVER]
+    return (front or pictures)[0].data
+
+
+def _path(artwork_dir, key, size):
+    return os.path.join(artwork_dir, key[:2], f"{key}-{size}.jpg")
+
+
+def _original_path(artwork_dir, key):
+    return os.path.join(artwork_dir, key[:2], f"{key}-original")
+
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def store(artwork_dir, data):
+    """Write the standard sizes of an image (if not there yet); returns its key"""
+    key = hashlib.sha1(data).hexdigest()[:24]
+    os.makedirs(os.path.join(artwork_dir, key[:2]), exist_ok=True)
+
+    if Image is None:
+        if not os.path.exists(_original_path(artwork_dir, key)):
+            _write(_original_path(artwork_dir, key), data)
+        return key
+
+    if all(os.path.exists(_path(artwork_dir, key, size)) for size in SIZES):
+        return key
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert('RGB')
+        for size in SIZES:
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)  # never upscales
+            out = io.BytesIO()
+            resized.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            _write(_path(artwork_dir, key, size), out.getvalue())
+    return key
+
+
+def fit_size(size):
+    """The smallest standard size that covers `size` (the largest if none)"""
+    for standard in SIZES:
+        if standard >= size:
+            return standard
+    return SIZES[-1]
+
+
+def path(artwork_dir, key, size):
+    """(file path, mimetype) of a stored image, or None"""
+    if not _KEY.match(key):
+        return None
+    resized = _path(artwork_dir, key, fit_size(size))
+    if os.path.exists(resized):
+        return resized, 'image/jpeg'
+    original = _original_path(artwork_dir, key)
+    if os.path.exists(original):
+        with open(original, 'rb') as f:
+            head = f.read(8)
+        return original, 'image/png' if head.startswith(b'\x89PNG') else 'image/jpeg'
+    return None
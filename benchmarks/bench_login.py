@@ -0,0 +1,109 @@
+"""Login throughput, and its effect on other traffic, under mixed load.
+
+Runs three phases against the same app instance: background traffic alone
+(search, song pages, proxied audio), logins alone, then both at once. The
+interesting numbers are login req/s and how far background p95 moves while
+logins are hashing passwords.
+
+Usage (from the repository root):
+    python benchmarks/bench_login.py --login-clients 16 --background-clients 16
+    PASSWORD_HASH_WORKERS=1 python benchmarks/bench_login.py   # app settings come from the environment
+"""
+import argparse
+import os
+import shutil
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstream import start_in_thread  # noqa: E402
+from load_test import REPO_ROOT, Client, run_scenario, start_app  # noqa: E402
+from synth_library import generate_library  # noqa: E402
+
+
+def run_together(groups, duration, warmup):
+    """run_scenario for several (clients, scenario) groups at the same time"""
+    results = [None] * len(groups)
+
+    def run(i, clients, scenario):
+        results[i] = run_scenario(clients, scenario, duration, warmup)
+
+    threads = [threading.Thread(target=run, args=(i, clients, scenario))
+               for i, (clients, scenario) in enumerate(groups)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--songs', type=int, default=2000)
+    parser.add_argument('--work-dir', default=os.path.join(REPO_ROOT, 'cache', 'bench'))
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--port', type=int, default=5601)
+    parser.add_argument('--upstream-latency', type=float, default=50)
+    parser.add_argument('--login-clients', type=int, default=16)
+    parser.add_argument('--background-clients', type=int, default=16)
+    parser.add_argument('--background', default='mixed', help='load_test scenario used as background traffic')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args()
+
+    work_dir = os.path.abspath(args.work_dir)
+    library_dir = os.path.join(work_dir, 'songs')
+    for name in ('bench.db', 'cache', 'metrics'):
+        path = os.path.join(work_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    generate_library(library_dir, args.songs)
+
+    upstream = start_in_thread(latency=args.upstream_latency, jitter=args.upstream_latency / 5)
+    process, base_url = start_app(args, work_dir, library_dir, upstream)
+    clients = []
+    try:
+        page = requests.get(f"{base_url}/api/songs", params={'per_page': 500, 'fields': 'id'}).json()
+        song_ids = [s['id'] for s in page['songs']] or ['static-1']
+        run_id = f"{int(time.time())}"
+        total = args.login_clients + args.background_clients
+        clients = [Client(base_url, upstream.base_url, i, song_ids) for i in range(total)]
+        for client in clients:
+            client.setup(run_id)
+        logins, background = clients[:args.login_clients], clients[args.login_clients:]
+
+        phases = [
+            ('background only', [(background, args.background)]),
+            ('logins only', [(logins, 'login')]),
+            ('logins + background', [(logins, 'login'), (background, args.background)]),
+        ]
+        print(f"server={args.server} workers={args.workers} threads={args.threads} "
+              f"login_clients={args.login_clients} background_clients={args.background_clients}")
+        print(f"{'phase':<22}{'traffic':<12}{'requests':>10}{'errors':>8}{'req/s':>10}"
+              f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for phase, groups in phases:
+            for (_, scenario), r in zip(groups, run_together(groups, args.duration, args.warmup)):
+                print(f"{phase:<22}{scenario:<12}{r['requests']:>10}{r['errors']:>8}{r['rps']:>10}"
+                      f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+    finally:
+        # Idle keep-alive connections would hold up gunicorn's graceful shutdown
+        for client in clients:
+            client.session.close()
+        process.terminate()
+        process.wait(timeout=30)
+        upstream.shutdown()
+
+
+if __name__ == '__main__':
+    main()
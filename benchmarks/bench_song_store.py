@@ -0,0 +1,115 @@
+"""Memory and throughput of SongStore versus a plain list of song dicts.
+
+Usage (from the repository root):
+    python benchmarks/bench_song_store.py --songs 1000000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from song_store import SongStore  # noqa: E402
+
+WORDS = ['love', 'night', 'dance', 'river', 'fire', 'dream', 'rain', 'heart',
+         'city', 'light', 'gold', 'summer', 'shadow', 'ocean', 'road', 'star']
+
+
+def make_songs(count, artists, albums, seed=1):
+    """Synthetic songs shaped like the library scan output"""
+    rng = random.Random(seed)
+    artist_names = [f"Artist {i} {rng.choice(WORDS).title()}" for i in range(artists)]
+    album_names = [f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}" for i in range(albums)]
+    songs = []
+    for i in range(1, count + 1):
+        title = ' '.join(rng.choice(WORDS) for _ in range(3)).title() + f" {i}"
+        filename = f"{i:07d} {title}.mp3"
+        songs.append({
+            "id": f"static-{i}",
+            "title": title,
+            "artist": rng.choice(artist_names),
+            "album": rng.choice(album_names),
+            "year": rng.randint(1960, 2024),
+            "duration": rng.randint(90, 420),
+            "url": f"/songs/{filename.replace(' ', '%20')}",
+            "source": "static",
+            "filename": filename,
+            "thumbnail": None,
+            "bitrate": 320000,
+            "sample_rate": 44100,
+            "file_size": rng.randint(2_000_000, 12_000_000),
+        })
+    return songs
+
+
+def measure(build):
+    """(object, bytes allocated by build)"""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--songs', type=int, default=200_000)
+    parser.add_argument('--artists', type=int, default=5_000)
+    parser.add_argument('--albums', type=int, default=20_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # Build the dict list twice: once to measure it, once as the store's input,
+    # so string sharing between the two does not flatter either side.
+    dicts, dict_bytes = measure(lambda: make_songs(args.songs, args.artists, args.albums))
+    source = make_songs(args.songs, args.artists, args.albums)
+    store, store_bytes = measure(lambda: SongStore(source))
+    del source
+
+    query = 'river'
+    selective = dicts[len(dicts) // 3]['title'].lower()[-12:]
+    artist = dicts[len(dicts) // 2]['artist'].split()[1]
+    target_id = dicts[-1]['id']
+
+    def dict_search(q):
+        return [s for s in dicts if q in s['title'].lower() or q in s['artist'].lower()]
+
+    cases = [
+        ('search, common term', lambda: dict_search(query), lambda: store.search(query)),
+        ('search, selective', lambda: dict_search(selective), lambda: store.search(selective)),
+        ('filter by artist', lambda: [s for s in dicts if artist.lower() in s['artist'].lower()],
+         lambda: store.rows_by_artist(artist)),
+        ('lookup by id', lambda: next(s for s in dicts if s['id'] == target_id),
+         lambda: store.row(store.row_of(target_id))),
+        ('total duration', lambda: sum(s['duration'] for s in dicts if s.get('duration')),
+         lambda: store.total_duration()),
+        ('materialize 100 rows', lambda: [dict(s) for s in dicts[:100]],
+         lambda: store[:100]),
+    ]
+
+    print(f"songs={args.songs} artists={args.artists} albums={args.albums}")
+    print(f"{'memory':<24}{'dicts':>14}{'store':>14}{'ratio':>8}")
+    print(f"{'total MiB':<24}{dict_bytes / 2**20:>14.1f}{store_bytes / 2**20:>14.1f}{dict_bytes / store_bytes:>8.1f}")
+    print(f"{'bytes/song':<24}{dict_bytes / args.songs:>14.0f}{store_bytes / args.songs:>14.0f}")
+    print()
+    print(f"{'operation (ms)':<24}{'dicts':>14}{'store':>14}{'speedup':>8}")
+    for name, with_dicts, with_store in cases:
+        dict_time, _ = timed(with_dicts, args.repeat)
+        store_time, _ = timed(with_store, args.repeat)
+        print(f"{name:<24}{dict_time * 1000:>14.2f}{store_time * 1000:>14.2f}{dict_time / store_time:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
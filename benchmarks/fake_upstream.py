@@ -0,0 +1,177 @@
+"""Local stand-in for the JioSaavn API (saavn.dev) and its audio CDN.
+
+Serves the endpoints the app calls, with a deterministic catalog and a
+configurable response delay, so benchmarks do not depend on (or hammer) the
+real services:
+
+    GET /api/search/songs?query=&page=   search results
+    GET /api/songs?ids=a,b,c             lookup by id
+    GET /cdn/<id>.mp3                    audio, with Range support
+
+Point the app at it with JIOSAAVN_API_BASE=http://127.0.0.1:<port>/api.
+
+Usage (from the repository root):
+    python benchmarks/fake_upstream.py --port 5700 --latency 80 --jitter 20
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synth_library import MP3_FRAME, WORDS
+
+RESULTS_PER_PAGE = 20
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+class FakeCatalog:
+    def __init__(self, size=5000, seed=1):
+        self.size = size
+        self.seed = seed
+
+    def item(self, n, base_url):
+        """A song in the JioSaavn API shape; the same n always yields the same song"""
+        rng = random.Random(self.seed * 1_000_003 + n)
+        song_id = f"fake{n:06d}"
+        image = f"{base_url}/img/{song_id}"
+        return {
+            'id': song_id,
+            'name': ' '.join(rng.choice(WORDS) for _ in range(3)).title(),
+            'year': str(rng.randint(1970, 2024)),
+            'duration': rng.randint(120, 360),
+            'album': {'name': f"{rng.choice(WORDS).title()} Sessions"},
+            'artists': {'primary': [{'name': f"Singer {rng.randint(1, 300)}"}]},
+            'image': [{'quality': q, 'url': f"{image}-{q}.jpg"} for q in ('50x50', '150x150', '500x500')],
+            'downloadUrl': [{'quality': q, 'url': f"{base_url}/cdn/{song_id}.mp3"}
+                            for q in ('96kbps', '160kbps', '320kbps')],
+        }
+
+    def search(self, query, page, base_url):
+        # Results depend only on (query, page), like a real search index would
+        digest = hashlib.sha1(f"{query.lower()}:{page}".encode()).digest()
+        start = int.from_bytes(digest[:4], 'big') % self.size
+        return [self.item((start + i * 7919) % self.size, base_url) for i in range(RESULTS_PER_PAGE)]
+
+    def lookup(self, ids, base_url):
+        items = []
+        for song_id in ids:
+            if song_id.startswith('fake') and song_id[4:].isdigit() and int(song_id[4:]) < self.size:
+                items.append(self.item(int(song_id[4:]), base_url))
+        return items
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output readable
+
+    def _delay(self):
+        server = self.server
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.server.stats_lock:
+            self.server.requests += 1
+        self._delay()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        base_url = f"http://{self.headers.get('Host', '127.0.0.1')}"
+        catalog = self.server.catalog
+
+        if url.path == '/api/search/songs':
+            page = int(query.get('page', ['1'])[0] or 1)
+            results = catalog.search(query.get('query', [''])[0], page, base_url)
+            self._send_json({'success': True, 'data': {'total': catalog.size, 'start': (page - 1) * RESULTS_PER_PAGE,
+                                                       'results': results}})
+        elif url.path == '/api/songs':
+            ids = [i for i in query.get('ids', [''])[0].split(',') if i]
+            self._send_json({'success': True, 'data': catalog.lookup(ids, base_url)})
+        elif url.path.startswith('/cdn/') and url.path.endswith('.mp3'):
+            self._send_audio()
+        else:
+            self._send_json({'success': False, 'message': 'not found'}, status=404)
+
+    def _send_audio(self):
+        audio = self.server.audio
+        start, end = 0, len(audio) - 1
+        match = _RANGE.match(self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+            else:
+                start = max(0, len(audio) - int(match.group(2)))
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(audio)}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        view = memoryview(audio)[start:end + 1]
+        for offset in range(0, len(view), 64 * 1024):
+            self.wfile.write(view[offset:offset + 64 * 1024])
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=50, jitter=0, catalog_size=5000, audio_kb=512, seed=1):
+        super().__init__(address, FakeUpstreamHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.catalog = FakeCatalog(catalog_size, seed)
+        self.audio = MP3_FRAME * max(1, audio_kb * 1024 // len(MP3_FRAME))
+        self.requests = 0
+        self.stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_in_thread(host='127.0.0.1', port=0, **options):
+    """Start a server on a background thread (port 0 picks a free port)"""
+    server = FakeUpstreamServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5700)
+    parser.add_argument('--latency', type=float, default=50, help='mean response delay in ms')
+    parser.add_argument('--jitter', type=float, default=0, help='+/- ms added to the delay')
+    parser.add_argument('--catalog-size', type=int, default=5000)
+    parser.add_argument('--audio-kb', type=int, default=512, help='size of every audio file')
+    args = parser.parse_args()
+    server = FakeUpstreamServer((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                                catalog_size=args.catalog_size, audio_kb=args.audio_kb)
+    print(f"Fake JioSaavn API at {server.base_url}/api, CDN at {server.base_url}/cdn/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""Load test the API against a synthetic library and a fake JioSaavn/CDN.
+
+Generates a tagged-MP3 library, starts benchmarks/fake_upstream.py in-process,
+launches the app (gunicorn with gunicorn.conf.py, or Flask's dev server) with
+its own database, cache and library, then drives each scenario with
+concurrent clients and reports throughput and latency percentiles.
+
+Save a run with --json and compare later runs against it with --baseline; the
+exit status is 1 when a scenario's p95 latency or throughput regressed by more
+than --max-regression.
+
+Usage (from the repository root):
+    python benchmarks/load_test.py --songs 5000 --concurrency 32 --duration 15
+    python benchmarks/load_test.py --json baseline.json
+    python benchmarks/load_test.py --baseline baseline.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_upstream import start_in_thread  # noqa: E402
+from synth_library import WORDS, generate_library  # noqa: E402
+
+SCENARIOS = ['songs', 'search', 'random', 'playlists', 'proxy', 'login', 'mixed']
+
+
+class Client:
+    """One simulated user: its own HTTP session, account and playlist"""
+
+    def __init__(self, base_url, upstream_url, index, song_ids):
+        self.base_url = base_url
+        self.upstream_url = upstream_url
+        self.session = requests.Session()
+        self.rng = random.Random(index)
+        self.song_ids = song_ids
+        self.playlist_id = None
+        self.index = index
+        self.user_id = None
+
+    def setup(self, run_id):
+        self.user_id = f"bench-{run_id}-{self.index}"
+        self.session.post(f"{self.base_url}/register",
+                          json={'username': self.user_id, 'user_id': self.user_id, 'password': 'bench-password'})
+        token = self.login().json()['token']
+        self.session.headers['Authorization'] = f"Bearer {token}"
+        playlists = self.session.get(f"{self.base_url}/playlists").json()['playlists']
+        self.playlist_id = playlists[0]['id']
+
+    # Each scenario issues one request and returns the response
+    def songs(self):
+        return self.session.get(f"{self.base_url}/api/songs",
+                                params={'page': self.rng.randint(1, 50), 'per_page': 20})
+
+    def search(self):
+        return self.session.get(f"{self.base_url}/api/search", params={'q': self.rng.choice(WORDS)})
+
+    def random(self):
+        return self.session.get(f"{self.base_url}/api/random")
+
+    def playlists(self):
+        url = f"{self.base_url}/playlists/{self.playlist_id}/songs"
+        if self.rng.random() < 0.3:
+            song_id = self.rng.choice(self.song_ids)
+            return self.session.post(url, json={'song_id': song_id, 'song_title': song_id})
+        return self.session.get(url)
+
+    def proxy(self):
+        audio_url = f"{self.upstream_url}/cdn/fake{self.rng.randrange(5000):06d}.mp3"
+        headers = {'Range': 'bytes=0-131071'} if self.rng.random() < 0.5 else {}
+        return self.session.get(f"{self.base_url}/proxy/audio/{urllib.parse.quote(audio_url, safe='')}",
+                                headers=headers)
+
+    def login(self):
+        return self.session.post(f"{self.base_url}/login",
+                                 json={'user_id': self.user_id, 'password': 'bench-password'})
+
+    def mixed(self):
+        scenario = self.rng.choices(['songs', 'search', 'random', 'playlists', 'proxy'],
+                                    weights=[30, 30, 15, 20, 5])[0]
+        return getattr(self, scenario)()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(clients, scenario, duration, warmup):
+    """Drive one scenario with every client concurrently for `duration` seconds"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def worker(client):
+        action = getattr(client, scenario)
+        local, failed = [], 0
+        while True:
+            began = time.perf_counter()
+            if began >= stop_at:
+                break
+            try:
+                response = action()
+                response.content  # read the whole body, as a client would
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            finished = time.perf_counter()
+            if began >= start_at:
+                local.append(finished - began)
+                failed += not ok
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def start_app(args, work_dir, library_dir, upstream):
+    env = dict(os.environ,
+               SONGS_FOLDER=os.path.abspath(library_dir),
+               DB_PATH=os.path.join(work_dir, 'bench.db'),
+               CACHE_DIR=os.path.join(work_dir, 'cache'),
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(work_dir, 'metrics'),
+               JIOSAAVN_API_BASE=f"{upstream.base_url}/api",
+               LOG_LEVEL=args.log_level,
+               # Every simulated client shares one IP and the point is to
+               # saturate the server, so rate limits and shedding stay off
+               RATE_LIMITS='0', ADMISSION_LIMIT='0', MAX_PROXY_STREAMS='0')
+    bind = f"127.0.0.1:{args.port}"
+    if args.server == 'gunicorn':
+        command = ['gunicorn', '-c', 'gunicorn.conf.py', '-b', bind, '-w', str(args.workers),
+                   '--threads', str(args.threads), 'app:app']
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run',
+                   '--host', '127.0.0.1', '--port', str(args.port), '--with-threads']
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env,
+                               stdout=subprocess.DEVNULL if args.quiet else None)
+    base_url = f"http://{bind}"
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"app exited during startup with status {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/api/health", timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    sys.exit(f"app did not become healthy within {args.startup_timeout}s")
+
+
+def compare(results, baseline, max_regression):
+    """Scenario regressions (as messages) relative to a saved run"""
+    problems = []
+    for scenario, current in results.items():
+        before = baseline.get('results', {}).get(scenario)
+        if not before:
+            continue
+        if before['p95_ms'] and current['p95_ms'] > before['p95_ms'] * (1 + max_regression):
+            problems.append(f"{scenario}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms")
+        if before['rps'] and current['rps'] < before['rps'] * (1 - max_regression):
+            problems.append(f"{scenario}: throughput {before['rps']} -> {current['rps']} req/s")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--songs', type=int, default=2000, help='synthetic library size')
+    parser.add_argument('--library', default=None,
+                        help='library folder (default: <work-dir>/songs; static/songs to use the real one)')
+    parser.add_argument('--work-dir', default=os.path.join(REPO_ROOT, 'cache', 'bench'))
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--port', type=int, default=5601)
+    parser.add_argument('--upstream-latency', type=float, default=50, help='fake JioSaavn/CDN delay in ms')
+    parser.add_argument('--upstream-jitter', type=float, default=10)
+    parser.add_argument('--scenarios', default=','.join(s for s in SCENARIOS if s != 'login'))
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10, help='seconds measured per scenario')
+    parser.add_argument('--warmup', type=float, default=2, help='unmeasured seconds before each scenario')
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--quiet', action='store_true', help="hide the app's output")
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25)
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    work_dir = os.path.abspath(args.work_dir)
+    library_dir = args.library or os.path.join(work_dir, 'songs')
+    # Fresh database and index per run; the generated library is reused
+    for name in ('bench.db', 'cache', 'metrics'):
+        path = os.path.join(work_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    os.makedirs(work_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    written = generate_library(library_dir, args.songs)
+    if written:
+        print(f"generated {written} songs in {library_dir} ({time.perf_counter() - started:.1f}s)")
+
+    upstream = start_in_thread(latency=args.upstream_latency, jitter=args.upstream_jitter)
+    process, base_url = start_app(args, work_dir, library_dir, upstream)
+    clients = []
+    try:
+        page = requests.get(f"{base_url}/api/songs", params={'per_page': 500, 'fields': 'id'}).json()
+        song_ids = [s['id'] for s in page['songs']] or ['static-1']
+        run_id = f"{int(time.time())}"
+        clients = [Client(base_url, upstream.base_url, i, song_ids) for i in range(args.concurrency)]
+        for client in clients:
+            client.setup(run_id)
+
+        results = {}
+        print(f"server={args.server} workers={args.workers if args.server == 'gunicorn' else 1} "
+              f"songs={page['total']} concurrency={args.concurrency} duration={args.duration}s "
+              f"upstream_latency={args.upstream_latency}ms")
+        print(f"{'scenario':<12}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for scenario in scenarios:
+            r = run_scenario(clients, scenario, args.duration, args.warmup)
+            results[scenario] = r
+            print(f"{scenario:<12}{r['requests']:>10}{r['errors']:>8}{r['rps']:>10}"
+                  f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+    finally:
+        # Idle keep-alive connections would hold up gunicorn's graceful shutdown
+        for client in clients:
+            client.session.close()
+        process.terminate()
+        process.wait(timeout=30)
+        upstream.shutdown()
+
+    report = {
+        'config': {k: getattr(args, k) for k in ('songs', 'server', 'workers', 'threads', 'concurrency', 'duration',
+                                                 'upstream_latency', 'upstream_jitter')},
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.max_regression)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
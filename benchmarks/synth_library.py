@@ -0,0 +1,89 @@
+"""Generate a reproducible synthetic music library of tagged MP3 files.
+
+Every file is a short but valid MPEG-1 Layer III stream (silent 128 kbps
+frames at 44.1 kHz) with ID3 title/artist/album/year tags, so the app's
+library scan reads it exactly like a real track. The song number is written
+into each frame's ancillary bytes, so no two files share their audio (the
+app would otherwise collapse them as duplicates).
+
+Usage (from the repository root; point SONGS_FOLDER at the output to serve it):
+    python benchmarks/synth_library.py --songs 2000 --out cache/bench/songs
+"""
+import argparse
+import json
+import os
+import random
+
+from mutagen.id3 import ID3, TALB, TDRC, TIT2, TPE1
+
+WORDS = ['love', 'night', 'dance', 'river', 'fire', 'dream', 'rain', 'heart',
+         'city', 'light', 'gold', 'summer', 'shadow', 'ocean', 'road', 'star']
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 417 bytes, 1152 samples
+MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+FRAMES_PER_SECOND = 44100 / 1152
+
+MARKER = '.synth-library.json'
+FORMAT = 2  # bump when the generated files change, to regenerate old libraries
+
+
+def generate_library(out_dir, songs, artists=200, albums=800, seconds=2, seed=1):
+    """Write `songs` tagged MP3s to out_dir; returns the number written.
+
+    A marker file records the parameters, so calling this again with the same
+    arguments is a no-op and benchmark runs stay comparable.
+    """
+    params = {'songs': songs, 'artists': artists, 'albums': albums,
+              'seconds': seconds, 'seed': seed, 'format': FORMAT}
+    marker = os.path.join(out_dir, MARKER)
+    try:
+        with open(marker) as f:
+            if json.load(f) == params:
+                return 0
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(out_dir, exist_ok=True)
+    for entry in os.scandir(out_dir):
+        if entry.name.startswith('synth-') and entry.name.endswith('.mp3'):
+            os.remove(entry.path)
+
+    rng = random.Random(seed)
+    artist_names = [f"Artist {i} {rng.choice(WORDS).title()}" for i in range(artists)]
+    album_names = [f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}" for i in range(albums)]
+    frames = max(1, int(seconds * FRAMES_PER_SECOND))
+
+    for i in range(1, songs + 1):
+        title = ' '.join(rng.choice(WORDS) for _ in range(3)).title() + f" {i}"
+        path = os.path.join(out_dir, f"synth-{i:07d}.mp3")
+        with open(path, 'wb') as f:
+            f.write((MP3_FRAME[:-4] + i.to_bytes(4, 'little')) * frames)
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text=title))
+        tags.add(TPE1(encoding=3, text=rng.choice(artist_names)))
+        tags.add(TALB(encoding=3, text=rng.choice(album_names)))
+        tags.add(TDRC(encoding=3, text=str(rng.randint(1960, 2024))))
+        tags.save(path)
+
+    with open(marker, 'w') as f:
+        json.dump(params, f)
+    return songs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--songs', type=int, default=2000)
+    parser.add_argument('--artists', type=int, default=200)
+    parser.add_argument('--albums', type=int, default=800)
+    parser.add_argument('--seconds', type=float, default=2, help='audio length per file')
+    parser.add_argument('--seed', type=int, default=1)
+    # Never the real library by default: the files would mix with real songs
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                      'cache', 'bench', 'songs'))
+    args = parser.parse_args()
+    written = generate_library(args.out, args.songs, args.artists, args.albums, args.seconds, args.seed)
+    print(f"{written or 'no'} files written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
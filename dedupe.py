@@ -0,0 +1,153 @@
+"""Duplicate-track detection.
+
+Two copies count as the same track when either
+  - their audio payload is byte-identical (same file under another name or
+    with different tags), found with a cheap fingerprint: a hash of a few
+    windows of the audio data with the ID3 tags left out, or
+  - their normalized title/artist keys match and their durations agree
+    within DURATION_TOLERANCE seconds (re-encodes, "Official Audio" copies,
+    the same song from JioSaavn). Tags alone are only trusted when both the
+    artist and the durations are known: untagged tracks called "Intro" or
+    "Track 1" are different songs unless their audio matches.
+
+Both keys are 64-bit integers computed once at index time, so grouping a
+library is a couple of dict passes and no file is opened twice.
+"""
+from hashlib import blake2b
+import re
+import unicodedata
+
+DURATION_TOLERANCE = 3  # seconds
+FINGERPRINT_WINDOWS = 3
+FINGERPRINT_WINDOW_SIZE = 8192  # bytes
+
+# Bracketed decorations that do not make a different recording
+_NOISE = re.compile(r'\s*[(\[][^)\]]*\b(official|audio|video|lyrics?|hd|hq|remaster(ed)?|explicit|visuali[sz]er)\b'
+                    r'[^)\]]*[)\]]', re.IGNORECASE)
+_FEATURING = re.compile(r'\s+(feat\.?|ft\.?|featuring)\s.*$', re.IGNORECASE)
+_TRACK_NUMBER = re.compile(r'^\d{1,3}\s*[-._)]\s*')
+_ARTIST_SEPARATORS = re.compile(r'\s*(?:[,;/&]|\band\b)\s*', re.IGNORECASE)
+
+
+def normalize(text):
+    """Lowercase words of text without accents, punctuation or decorations"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = _FEATURING.sub('', _NOISE.sub('', text))
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def tag_key(title, artist):
+    """Normalized "artist / title" key, or None without a usable title and artist"""
+    title = normalize(_TRACK_NUMBER.sub('', title or ''))
+    if not title:
+        return None
+    # Only the primary artist: sources disagree on how guests are listed
+    artist = normalize(_ARTIST_SEPARATORS.split(artist or '', maxsplit=1)[0])
+    if not artist or artist in ('unknown', 'unknown artist'):
+        return None
+    return f"{artist}\x1f{title}"
+
+
+def _hash(data):
+    # 0 is reserved for "no key"
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), 'little') or 1
+
+
+def tag_hash(title, artist):
+    key = tag_key(title, artist)
+    return _hash(key.encode('utf-8')) if key else 0
+
+
+def audio_span(f):
+    """(start, end) of the audio data, skipping an ID3v2 header and ID3v1 trailer"""
+    head = f.read(10)
+    start = 0
+    if len(head) == 10 and head[:3] == b'ID3':
+        size = (head[6] & 0x7f) << 21 | (head[7] & 0x7f) << 14 | (head[8] & 0x7f) << 7 | (head[9] & 0x7f)
+        start = 10 + size + (10 if head[5] & 0x10 else 0)  # footer flag
+    end = f.seek(0, 2)
+    if end - 128 >= start:
+        f.seek(end - 128)
+        if f.read(3) == b'TAG':
+            end -= 128
+    return start, end
+
+
+def audio_fingerprint(path):
+    """64-bit fingerprint of a file's audio payload (0 if it has none)"""
+    with open(path, 'rb') as f:
+        start, end = audio_span(f)
+        length = end - start
+        if length <= 0:
+            return 0
+        digest = blake2b(length.to_bytes(8, 'little'), digest_size=8)
+        size = min(FINGERPRINT_WINDOW_SIZE, length)
+        for i in range(1, FINGERPRINT_WINDOWS + 1):
+            f.seek(start + (length - size) * i // (FINGERPRINT_WINDOWS + 1))
+            digest.update(f.read(size))
+    return int.from_bytes(digest.digest(), 'little') or 1
+
+
+def same_duration(a, b):
+    """True if both durations are known and within DURATION_TOLERANCE"""
+    return a is not None and b is not None and abs(a - b) <= DURATION_TOLERANCE
+
+
+def find_duplicates(entries):
+    """Group copies of the same track.
+
+    entries are (song_id, tag_hash, duration, fingerprint, bitrate, file_size)
+    tuples. Returns {song_id: canonical song_id} for every song that is a
+    copy of another; the canonical copy of a group is the best quality one
+    (bitrate, then file size), the oldest id on a tie.
+    """
+    entries = list(entries)
+    parent = list(range(len(entries)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        parent[find(i)] = find(j)
+
+    by_fingerprint = {}
+    by_tag = {}
+    for i, (_, tags, duration, fingerprint, _, _) in enumerate(entries):
+        if fingerprint:
+            if fingerprint in by_fingerprint:
+                union(i, by_fingerprint[fingerprint])
+            else:
+                by_fingerprint[fingerprint] = i
+        if tags and duration is not None:
+            by_tag.setdefault(tags, []).append(i)
+
+    for rows in by_tag.values():
+        if len(rows) < 2:
+            continue
+        # Chain together while neighbours are within the tolerance
+        rows.sort(key=lambda i: entries[i][2])
+        for prev, i in zip(rows, rows[1:]):
+            if same_duration(entries[prev][2], entries[i][2]):
+                union(i, prev)
+
+    groups = {}
+    for i in range(len(entries)):
+        groups.setdefault(find(i), []).append(i)
+
+    def preference(i):
+        song_id, _, _, _, bitrate, file_size = entries[i]
+        return -(bitrate or 0), -(file_size or 0), len(song_id), song_id
+
+    duplicates = {}
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        canonical = entries[min(members, key=preference)][0]
+        for i in members:
+            if entries[i][0] != canonical:
+                duplicates[entries[i][0]] = canonical
+    return duplicates
@@ -7,13 +7,56 @@ const urlsToCache = [
   // Add more static assets if needed
 ];
 
+// Offline song catalog, kept current with small delta requests
+const CATALOG_CACHE = 'dhoonhub-catalog';
+const CATALOG_URL = '/api/catalog';
+
+function applyCatalogChanges(catalog, delta) {
+  const byId = new Map(catalog.songs.map(song => [song.id, song]));
+  delta.removed.forEach(id => byId.delete(id));
+  delta.added.concat(delta.updated).forEach(song => byId.set(song.id, song));
+  const songs = Array.from(byId.values())
+    .sort((a, b) => (a.filename || '').localeCompare(b.filename || ''));
+  return { version: delta.version, songs, total: songs.length };
+}
+
+async function syncCatalog() {
+  const cache = await caches.open(CATALOG_CACHE);
+  const cached = await cache.match(CATALOG_URL);
+  let catalog = cached ? await cached.json() : null;
+  try {
+    if (catalog) {
+      const response = await fetch(`/api/catalog/changes?since=${catalog.version}`);
+      if (response.ok) {
+        const delta = await response.json();
+        catalog = delta.reset ? null : applyCatalogChanges(catalog, delta);
+      }
+    }
+    if (!catalog) {
+      const response = await fetch(CATALOG_URL);
+      if (response.ok) {
+        catalog = await response.json();
+      }
+    }
+    if (catalog) {
+      await cache.put(CATALOG_URL, new Response(JSON.stringify(catalog), {
+        headers: { 'Content-Type': 'application/json' }
+      }));
+    }
+  } catch (error) {
+    // Offline: serve whatever we synced last
+    console.log('Catalog sync failed, using offline copy:', error);
+  }
+  return catalog;
+}
+
 // Clean up old caches
 self.addEventListener('activate', event => {
   event.waitUntil(
     caches.keys().then(cacheNames => {
       return Promise.all(
         cacheNames.map(cacheName => {
-          if (cacheName !== CACHE_NAME) {
+          if (cacheName !== CACHE_NAME && cacheName !== CATALOG_CACHE) {
             console.log('Deleting old cache:', cacheName);
             return caches.delete(cacheName);
           }
@@ -31,6 +74,17 @@ self.addEventListener('install', event => {
 });
 
 self.addEventListener('fetch', event => {
+  // Serve the catalog from the offline copy, syncing only the changes
+  if (event.request.method === 'GET' &&
+      new URL(event.request.url).pathname === CATALOG_URL) {
+    event.respondWith(
+      syncCatalog().then(catalog => catalog
+        ? new Response(JSON.stringify(catalog), { headers: { 'Content-Type': 'application/json' } })
+        : fetch(event.request))
+    );
+    return;
+  }
+
   // Skip caching for API requests and dynamic content
   if (event.request.url.includes('/api/') || 
       event.request.url.includes('/static/songs/') ||
@@ -0,0 +1,130 @@
+"""Gapless playback metadata from MP3 encoder headers.
+
+An MP3 encoder starts every track with `delay` samples of its own (encoder
+delay) and pads the last frame with `padding` more, so decoded tracks are
+slightly longer than the audio that went in and a gap is heard between
+consecutive tracks. LAME (and ffmpeg, which writes the same tag) records
+both values and the exact frame count in the Xing/Info header that takes the
+place of the first audio frame.
+
+Only that first frame is read, so parsing is cheap enough to do at index
+time. Decoders add DECODER_DELAY samples of their own on top of the encoder
+delay; a player trims delay + DECODER_DELAY samples at the start and keeps
+`samples` from there.
+
+Results for cached proxy audio live in the analysis database next to the
+loudness measurements (local tracks keep theirs in the library index).
+"""
+import os
+import sqlite3
+import time
+
+from dedupe import audio_span
+from hls import parse_frame
+
+DECODER_DELAY = 529  # samples
+SEARCH_BYTES = 64 * 1024  # how far into the audio the first frame is looked for
+FIELDS = ('delay', 'padding', 'samples', 'sample_rate')
+_ENCODER_TAGS = (b'LAME', b'Lavf', b'Lavc')  # writers of the LAME extension
+_XING_FRAMES, _XING_BYTES, _XING_TOC, _XING_QUALITY = 1, 2, 4, 8
+
+
+def _first_frame(data):
+    """(offset, frame) of the first MPEG frame that another one follows, or None"""
+    for pos in range(len(data) - 4):
+        frame = parse_frame(data, pos)
+        if frame is not None and (pos + frame[0] + 4 > len(data) or parse_frame(data, pos + frame[0])):
+            return pos, frame
+    return None
+
+
+def parse(data):
+    """{'delay', 'padding', 'samples', 'sample_rate'} from the start of MPEG
+    audio data, or None without a LAME tag (delay and padding would be guesses)"""
+    found = _first_frame(data)
+    if found is None:
+        return None
+    pos, (_, frame_samples, sample_rate) = found
+    mpeg1 = (data[pos + 1] >> 3) & 3 == 3
+    mono = data[pos + 3] >> 6 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    tag = pos + 4 + side_info
+    if data[tag:tag + 4] not in (b'Xing', b'Info') or len(data) < tag + 8:
+        return None
+    flags = int.from_bytes(data[tag + 4:tag + 8], 'big')
+    if not flags & _XING_FRAMES:
+        return None
+    frames = int.from_bytes(data[tag + 8:tag + 12], 'big')
+    lame = tag + 12
+    lame += (4 if flags & _XING_BYTES else 0) + (100 if flags & _XING_TOC else 0) + (4 if flags & _XING_QUALITY else 0)
+    if data[lame:lame + 4] not in _ENCODER_TAGS or len(data) < lame + 24:
+        return None
+    # 12 bits each, after the 9-byte encoder version and 12 bytes of other fields
+    packed = int.from_bytes(data[lame + 21:lame + 24], 'big')
+    delay, padding = packed >> 12, packed & 0xfff
+    samples = frames * frame_samples - delay - padding
+    if samples <= 0:
+        return None  # old LAME versions wrote bogus values for very short files
+    return {'delay': delay, 'padding': padding, 'samples': samples, 'sample_rate': sample_rate}
+
+
+def read(path):
+    """Gapless info of an MP3 file (see parse)"""
+    with open(path, 'rb') as f:
+        start, end = audio_span(f)
+        f.seek(start)
+        return parse(f.read(min(end - start, SEARCH_BYTES)))
+
+
+class GaplessDB:
+    """Parsed headers keyed by audio key; safe to share between processes"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('''CREATE TABLE IF NOT EXISTS gapless (
+            audio_key TEXT PRIMARY KEY,
+            delay INTEGER,
+            padding INTEGER,
+            samples INTEGER,
+            sample_rate INTEGER,
+            parsed_at INTEGER NOT NULL
+        )''')
+        return conn
+
+    def record(self, results):
+        """Store {audio key: info or None}; None records a file without a LAME tag"""
+        now = int(time.time() * 1000)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO gapless VALUES (?, ?, ?, ?, ?, ?)', [
+                    (key, *(info and info[field] for field in FIELDS), now) for key, info in results.items()])
+        finally:
+            conn.close()
+
+    def known_keys(self):
+        conn = self._connect()
+        try:
+            return {row[0] for row in conn.execute('SELECT audio_key FROM gapless')}
+        finally:
+            conn.close()
+
+    def results(self, keys):
+        """audio key -> info for the keys that have a LAME tag"""
+        if not os.path.exists(self.path):
+            return {}
+        conn = self._connect()
+        try:
+            rows = []
+            keys = list(keys)
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows += conn.execute(f"""SELECT audio_key, {', '.join(FIELDS)} FROM gapless
+                    WHERE samples IS NOT NULL AND audio_key IN ({','.join('?' * len(chunk))})""", chunk).fetchall()
+        finally:
+            conn.close()
+        return {row[0]: dict(zip(FIELDS, row[1:])) for row in rows}
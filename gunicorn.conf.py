@@ -0,0 +1,45 @@
+# gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+import gc
+import os
+import shutil
+
+# Workers write metric samples here and /metrics merges them (see metrics.py).
+# Must be set before the app (and prometheus_client) is imported, and emptied
+# so samples from a previous run are not merged into the new counters.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/music-api-metrics')
+shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+bind = '0.0.0.0:5600'
+workers = 4
+# Threaded workers: a request waiting on password hashing (passwords.py), an
+# upstream call or a slow audio client holds one thread, not a whole process.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Import the app once in the master so the library index is built (or mapped
+# from cache/library.snapshot) before forking; workers inherit it and start
+# serving without their own warm-up scan.
+preload_app = True
+
+
+def on_starting(server):
+    import app  # already imported by preload_app
+    app.warm_library()
+    # Move everything allocated so far out of the GC's reach, so collections in
+    # the workers do not write to (and un-share) the inherited pages.
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    # Write play events still buffered in this worker (see play_events.py)
+    import app
+    app.flush_events()
+    # ...and the log records still queued, including any written by that flush
+    from logging_config import flush_logging
+    flush_logging()
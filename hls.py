@@ -0,0 +1,163 @@
+"""HLS packed-audio delivery for local MP3 files.
+
+A track is cut at MPEG frame boundaries into segments of about
+SEGMENT_SECONDS, without re-encoding. Each segment is the run of frames
+prefixed with the ID3 timestamp tag HLS requires for packed audio, so it
+plays on its own and a seek needs only the segment holding the target time.
+
+The frame index (byte offset, length and sample count of every segment) is
+computed once per file and kept next to the segments; segments are written
+the first time they are requested.
+"""
+import json
+import math
+import os
+import struct
+import threading
+
+from dedupe import audio_span
+
+SEGMENT_SECONDS = 6
+
+# kbps by bitrate index 1-14, keyed by (MPEG-1?, layer)
+_BITRATES = {
+    (True, 1): (32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+_TIMESTAMP_OWNER = b'com.apple.streaming.transportStreamTimestamp\x00'
+_INDEX_VERSION = 1
+
+
+class UnsupportedFormat(Exception):
+    """The file has no MPEG audio frames to segment"""
+
+
+def parse_frame(data, pos):
+    """(length, samples, sample_rate) of the MPEG audio frame at pos, or None"""
+    if pos + 4 > len(data) or data[pos] != 0xff or data[pos + 1] & 0xe0 != 0xe0:
+        return None
+    version = (data[pos + 1] >> 3) & 3  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer = 4 - ((data[pos + 1] >> 1) & 3)
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = (data[pos + 2] >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index - 1] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (data[pos + 2] >> 1) & 1
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    samples = 1152 if mpeg1 or layer == 2 else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+def build_index(path, segment_seconds=SEGMENT_SECONDS):
+    """Segment boundaries of an MP3 file: {'sample_rate', 'segments': [[offset, length, samples], ...]}"""
+    with open(path, 'rb') as f:
+        start, end = audio_span(f)
+        f.seek(start)
+        data = f.read(end - start)
+
+    segments = []
+    sample_rate = None
+    seg_start = seg_samples = None
+    pos = 0
+    while pos < len(data):
+        frame = parse_frame(data, pos)
+        # A frame only counts if another one (or the end of the data) follows
+        # it, which skips sync-like bytes in junk between frames
+        if frame is not None and pos + frame[0] + 4 <= len(data) and parse_frame(data, pos + frame[0]) is None:
+            frame = None
+        if frame is None:
+            pos += 1  # resync; skipped bytes stay in the segment, decoders ignore them
+            continue
+        length, samples, rate = frame
+        if sample_rate is None:
+            sample_rate = rate
+        if seg_start is None or seg_samples >= segment_seconds * sample_rate:
+            if seg_start is not None:
+                segments.append([start + seg_start, pos - seg_start, seg_samples])
+            seg_start, seg_samples = pos, 0
+        seg_samples += samples
+        pos += length
+    if seg_start is None:
+        raise UnsupportedFormat(path)
+    last = [start + seg_start, min(pos, len(data)) - seg_start, seg_samples]
+    if segments and seg_samples < segment_seconds * sample_rate / 2:
+        # Fold a short tail into the previous segment rather than fetch it separately
+        segments[-1][1] += last[1]
+        segments[-1][2] += last[2]
+    else:
+        segments.append(last)
+    return {'version': _INDEX_VERSION, 'sample_rate': sample_rate, 'segments': segments}
+
+
+def load_index(directory, source, segment_seconds=SEGMENT_SECONDS):
+    """The index for source, from directory or built (and saved) now"""
+    index_path = os.path.join(directory, 'index.json')
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get('version') == _INDEX_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    index = build_index(source, segment_seconds)
+    os.makedirs(directory, exist_ok=True)
+    _write(index_path, json.dumps(index).encode('utf-8'))
+    return index
+
+
+def playlist(index, segment_uri):
+    """VOD media playlist; segment_uri(n) gives the URI of segment n"""
+    rate = index['sample_rate']
+    durations = [samples / rate for _, _, samples in index['segments']]
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f"#EXT-X-TARGETDURATION:{math.ceil(max(durations))}",
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+    ]
+    for n, duration in enumerate(durations):
+        lines.append(f"#EXTINF:{duration:.5f},")
+        lines.append(segment_uri(n))
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+
+def _syncsafe(n):
+    return bytes(((n >> 21) & 0x7f, (n >> 14) & 0x7f, (n >> 7) & 0x7f, n & 0x7f))
+
+
+def _timestamp_tag(pts):
+    """ID3v2.4 tag with the PRIV frame giving a segment's 90 kHz start time"""
+    body = _TIMESTAMP_OWNER + struct.pack('>Q', pts & 0x1ffffffff)
+    frame = b'PRIV' + _syncsafe(len(body)) + b'\x00\x00' + body
+    return b'ID3\x04\x00\x00' + _syncsafe(len(frame)) + frame
+
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def segment_path(directory, source, index, n):
+    """Path of segment n, written from source if it is not on disk yet"""
+    path = os.path.join(directory, f"{n}.mp3")
+    if not os.path.exists(path):
+        offset, length, _ = index['segments'][n]
+        start_samples = sum(samples for _, _, samples in index['segments'][:n])
+        with open(source, 'rb') as f:
+            f.seek(offset)
+            frames = f.read(length)
+        _write(path, _timestamp_tag(start_samples * 90000 // index['sample_rate']) + frames)
+    return path
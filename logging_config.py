@@ -0,0 +1,178 @@
+"""Structured, non-blocking logging for the music API.
+
+Records are formatted as JSON (or key=value text) and handed to a bounded
+in-memory queue; a background thread does the actual write to stdout, so a log
+call on a request path never blocks on I/O. High-volume messages can be
+sampled, and every record carries the id of the request that produced it.
+
+Configuration (environment):
+    LOG_LEVEL        DEBUG/INFO/WARNING/... (default INFO)
+    LOG_FORMAT       json or text (default json)
+    LOG_SAMPLE_RATE  fraction of `sampled` records kept, 0..1 (default 1.0)
+    LOG_QUEUE_SIZE   records buffered before new ones are dropped (default 10000;
+                     drops are counted in log_records_dropped_total)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+LOGGER_NAME = 'music_api'
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Pass as extra to mark a record as high-volume (subject to LOG_SAMPLE_RATE)
+SAMPLED = {'sampled': True}
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items()
+            if k not in _STANDARD_ATTRS and k != 'sampled'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+                  + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.getMessage()}"
+        fields = _fields(record)
+        if fields:
+            line += ' ' + ' '.join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records logged with extra=SAMPLED"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, 'sampled', False) and self.rate < 1.0:
+            return random.random() < self.rate
+        return True
+
+
+class ContextFilter(logging.Filter):
+    """Attach the current request id (runs in the logging thread's caller)"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            try:
+                from flask import g, has_request_context
+                record.request_id = g.get('request_id') if has_request_context() else None
+            except ImportError:
+                record.request_id = None
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full, calling
+    on_drop() for each (e.g. to count them in a metric)"""
+
+    def __init__(self, log_queue, on_drop=None):
+        super().__init__(log_queue)
+        self.on_drop = on_drop
+
+    def prepare(self, record):
+        # Resolve the message and traceback here, so the record is safe to
+        # hand to another thread, but leave the formatting to the listener.
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.on_drop is not None:
+                self.on_drop()
+
+
+_state = {'listener': None, 'handler': None, 'output': None}
+_state_lock = threading.Lock()
+
+
+def _start_listener():
+    log_queue = queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+    _state['handler'].queue = log_queue
+    listener = logging.handlers.QueueListener(log_queue, _state['output'], respect_handler_level=True)
+    listener.start()
+    _state['listener'] = listener
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork (gunicorn preload), so each
+    # worker starts its own on a fresh queue.
+    if _state['handler'] is not None:
+        _start_listener()
+
+
+def _stop_listener():
+    listener = _state['listener']
+    if listener is not None and listener._thread is not None:
+        listener.stop()
+
+
+def setup_logging(on_drop=None):
+    """Configure the app logger once per process and return it; on_drop is
+    called for every record dropped because the queue was full"""
+    logger = logging.getLogger(LOGGER_NAME)
+    with _state_lock:
+        if _state['handler'] is not None:
+            return logger
+
+        output = logging.StreamHandler(sys.stdout)
+        if os.environ.get('LOG_FORMAT', 'json').lower() == 'text':
+            output.setFormatter(TextFormatter())
+        else:
+            output.setFormatter(JsonFormatter())
+
+        handler = DroppingQueueHandler(None, on_drop=on_drop)
+        handler.addFilter(SamplingFilter(float(os.environ.get('LOG_SAMPLE_RATE', 1.0))))
+        handler.addFilter(ContextFilter())
+
+        _state['output'] = output
+        _state['handler'] = handler
+        _start_listener()
+        os.register_at_fork(after_in_child=_restart_after_fork)
+        atexit.register(_stop_listener)
+
+        logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+        logger.addHandler(handler)
+        logger.propagate = False
+    return logger
+
+
+def flush_logging():
+    """Drain the queue (e.g. before exit); logging resumes afterwards"""
+    if _state['listener'] is not None:
+        _stop_listener()
+        _start_listener()
@@ -0,0 +1,118 @@
+"""Loudness analysis with ReplayGain-style gain values.
+
+ffmpeg's ebur128 filter measures a track's integrated loudness (EBU R128 /
+ITU BS.1770, in LUFS) and its true peak. The gain that brings the track to
+REFERENCE_LUFS is what the player applies; the peak lets it lower that gain
+where applying it in full would clip.
+
+Results live in a small SQLite database next to the other analysis output,
+one row per track written as soon as the track is measured, so an
+interrupted pass resumes where it stopped and never measures a track twice.
+"""
+import os
+import re
+import sqlite3
+import subprocess
+import time
+
+from waveform import DecoderUnavailable, ffmpeg_path
+
+REFERENCE_LUFS = -18.0  # ReplayGain 2.0 reference level
+
+_INTEGRATED = re.compile(r'Integrated loudness:\s+I:\s+(-?[\d.]+|-inf) LUFS')
+_TRUE_PEAK = re.compile(r'True peak:\s+Peak:\s+(-?[\d.]+|-inf) dBFS')
+
+
+def _number(match):
+    if not match or match.group(1) == '-inf':
+        return None
+    return float(match.group(1))
+
+
+def measure(path):
+    """(integrated loudness in LUFS, true peak in dBFS) of an audio file"""
+    ffmpeg = ffmpeg_path()
+    if not ffmpeg:
+        raise DecoderUnavailable()
+    command = [ffmpeg, '-nostdin', '-hide_banner', '-nostats', '-i', path,
+               '-af', 'ebur128=peak=true:framelog=quiet', '-f', 'null', '-']
+    result = subprocess.run(command, capture_output=True,
+                            preexec_fn=(lambda: os.nice(10)) if os.name == 'posix' else None)
+    output = result.stderr.decode(errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({result.returncode}): {output[-200:]}")
+    summary = output[output.rfind('Summary:'):]
+    return _number(_INTEGRATED.search(summary)), _number(_TRUE_PEAK.search(summary))
+
+
+def gain_values(integrated_lufs, true_peak_db):
+    """(gain in dB, peak as linear amplitude) for song metadata; None if unknown"""
+    if integrated_lufs is None or integrated_lufs <= -70:
+        return None, None  # silence: nothing sensible to normalize to
+    gain = round(REFERENCE_LUFS - integrated_lufs, 2)
+    peak = round(10 ** (true_peak_db / 20), 4) if true_peak_db is not None else None
+    return gain, peak
+
+
+class LoudnessDB:
+    """Measured tracks keyed by audio key; safe to share between processes"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('''CREATE TABLE IF NOT EXISTS loudness (
+            audio_key TEXT PRIMARY KEY,
+            integrated_lufs REAL,
+            true_peak_db REAL,
+            analyzed_at INTEGER NOT NULL
+        )''')
+        return conn
+
+    def record(self, audio_key, integrated_lufs, true_peak_db):
+        """Store a measurement (None values record a track that failed)"""
+        conn = self._connect()
+        try:
+            conn.execute('INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?)',
+                         (audio_key, integrated_lufs, true_peak_db, int(time.time() * 1000)))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def known_keys(self):
+        conn = self._connect()
+        try:
+            return {row[0] for row in conn.execute('SELECT audio_key FROM loudness')}
+        finally:
+            conn.close()
+
+    def latest(self):
+        """Stamp of the newest measurement (0 if none); changes when results arrive"""
+        if not os.path.exists(self.path):
+            return 0
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT MAX(analyzed_at) FROM loudness').fetchone()[0] or 0
+        finally:
+            conn.close()
+
+    def results(self, keys=None, since=None):
+        """audio key -> (gain_db, peak, analyzed_at) for the given keys and/or
+        everything measured after `since`"""
+        if not os.path.exists(self.path):
+            return {}
+        conn = self._connect()
+        try:
+            rows = []
+            if since is not None:
+                rows += conn.execute('SELECT * FROM loudness WHERE analyzed_at > ?', (since,)).fetchall()
+            keys = list(keys or [])
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows += conn.execute(f"SELECT * FROM loudness WHERE audio_key IN ({','.join('?' * len(chunk))})",
+                                     chunk).fetchall()
+        finally:
+            conn.close()
+        return {key: gain_values(lufs, peak) + (analyzed_at,) for key, lufs, peak, analyzed_at in rows}
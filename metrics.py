@@ -0,0 +1,160 @@
+"""Prometheus metrics for the music API.
+
+Under gunicorn every worker is a separate process, so metrics use
+prometheus_client's multiprocess mode when PROMETHEUS_MULTIPROC_DIR is set
+(gunicorn.conf.py does this): each worker writes its samples to files in that
+directory and /metrics merges them, whichever worker serves the scrape.
+"""
+from contextlib import contextmanager
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+    REGISTRY, generate_latest,
+)
+from prometheus_client import multiprocess
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response (first byte for streams)',
+    ['route', 'method', 'status'], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests currently being handled',
+    ['route'], multiprocess_mode='livesum')
+
+UPSTREAM_LATENCY = Histogram(
+    'upstream_request_duration_seconds', 'Latency of calls to JioSaavn and audio CDNs',
+    ['upstream', 'operation'], buckets=LATENCY_BUCKETS)
+UPSTREAM_ERRORS = Counter(
+    'upstream_errors_total', 'Failed upstream calls (exceptions and non-2xx statuses)',
+    ['upstream', 'operation', 'reason'])
+PROXY_BYTES = Counter(
+    'proxy_audio_bytes_total', 'Audio bytes streamed through /proxy/audio')
+PROXY_STREAMS = Gauge(
+    'proxy_audio_streams', 'Proxied audio streams currently open',
+    multiprocess_mode='livesum')
+
+REJECTED_REQUESTS = Counter(
+    'rejected_requests_total', 'Requests turned away by rate limits or load shedding',
+    ['route_class', 'reason'])  # rate_limited, overloaded, stream_limit
+
+PLAY_EVENTS = Counter(
+    'play_events_total', 'Play/skip events posted to /api/events',
+    ['outcome'])  # accepted, rejected, written, dropped
+
+LOG_RECORDS_DROPPED = Counter(
+    'log_records_dropped_total', 'Log records dropped because the logging queue was full')
+
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by result; hit ratio = hit / (hit + miss)',
+    ['cache', 'result'])
+
+SQLITE_LATENCY = Histogram(
+    'sqlite_query_duration_seconds', 'SQLite statement execution time',
+    ['query'], buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1))
+
+
+# Per-request timing spans, collected only while a request is being profiled
+_spans = threading.local()
+
+
+def begin_spans():
+    _spans.items = []
+
+
+def end_spans():
+    """Spans recorded since begin_spans() as (kind, label, seconds) tuples"""
+    items = getattr(_spans, 'items', None) or []
+    _spans.items = None
+    return items
+
+
+def _record_span(kind, label, seconds):
+    items = getattr(_spans, 'items', None)
+    if items is not None:
+        items.append((kind, label, seconds))
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+@contextmanager
+def track_upstream(upstream, operation):
+    """Time an upstream call; exceptions are counted as errors and re-raised"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(upstream, operation, type(e).__name__).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        UPSTREAM_LATENCY.labels(upstream, operation).observe(elapsed)
+        _record_span('upstream', f"{upstream} {operation}", elapsed)
+
+
+def upstream_status_error(upstream, operation, status_code):
+    UPSTREAM_ERRORS.labels(upstream, operation, f"http_{status_code}").inc()
+
+
+_QUERY_LABEL = re.compile(r'^\s*(\w+)\b.*?\b(?:FROM|INTO|UPDATE|TABLE(?: IF NOT EXISTS)?)\s+(\w+)',
+                          re.IGNORECASE | re.DOTALL)
+
+
+def query_label(sql):
+    """Low-cardinality label for a statement, e.g. 'SELECT playlistsong'"""
+    match = _QUERY_LABEL.match(sql)
+    if match:
+        return f"{match.group(1).upper()} {match.group(2)}"
+    return sql.split(None, 1)[0].upper() if sql.strip() else 'unknown'
+
+
+def _observe_query(sql, elapsed):
+    label = query_label(sql)
+    SQLITE_LATENCY.labels(label).observe(elapsed)
+    _record_span('sql', label, elapsed)
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            _observe_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            _observe_query(sql, time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors record statement timings"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+def render():
+    """(body, content type) of the Prometheus text exposition"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
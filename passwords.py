@@ -0,0 +1,61 @@
+"""Password hashing off the request threads.
+
+Hashing is deliberately slow (hundreds of ms of CPU), so it runs on a small
+dedicated thread pool: at most `workers` hashes run at once per process and at
+most `queue_size` more wait, beyond which callers get PasswordHasherBusy right
+away instead of piling up behind each other. hashlib releases the GIL while
+hashing, so the request threads keep serving streams and searches meanwhile.
+
+Stored hashes record the method they were made with (werkzeug format), which
+lets verify() tell the caller when a hash should be upgraded to the currently
+configured method.
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import threading
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full or a hash waited longer than the
+    timeout; the caller should retry later"""
+
+
+class PasswordHasher:
+    def __init__(self, method, workers=2, queue_size=16, timeout=30):
+        self.method = method
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # no-op if it already started; its slot frees when it ends
+            raise PasswordHasherBusy() from None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != self.method
+
+    def verify(self, stored_hash, password):
+        """(matches, upgraded hash or None) for a login attempt"""
+        if not self._run(check_password_hash, stored_hash, password):
+            return False, None
+        if self.needs_rehash(stored_hash):
+            try:
+                return True, self._run(generate_password_hash, password, self.method)
+            except PasswordHasherBusy:
+                pass  # upgrade on a later login rather than fail this one
+        return True, None
@@ -0,0 +1,115 @@
+"""Write-behind buffer for play/skip events.
+
+Clients post events in batches; they are appended to an in-memory buffer and
+written to SQLite in one transaction per flush (every few seconds, or as soon
+as enough events are waiting), together with per-track and per-day rollups,
+so a burst of plays costs a handful of transactions rather than one each.
+A crash loses at most the events of one flush interval. If a batch fails
+for any reason other than the database being unavailable, its events are
+retried one at a time and the ones that cannot be stored are dropped, so a
+single bad event never holds up the rest.
+"""
+from collections import defaultdict
+import sqlite3
+import threading
+
+EVENT_TYPES = ('play', 'skip')
+DAY_MS = 24 * 3600 * 1000
+
+
+class DroppedEvents(Exception):
+    """A flush failed and the buffer was over max_pending; args[0] events were lost"""
+
+
+class EventBuffer:
+    """Pending events of this process. Events are (user_id, song_id, event,
+    position_ms, played_at_ms) tuples; connect() returns a SQLite connection."""
+
+    def __init__(self, connect, flush_size=1000, max_pending=50000):
+        self._connect = connect
+        self.flush_size = flush_size
+        self.max_pending = max_pending  # kept while the database is unavailable
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, events):
+        """Queue events; True if flush_size are waiting and it is time to flush"""
+        with self._lock:
+            self._pending.extend(events)
+            return len(self._pending) >= self.flush_size
+
+    def flush(self):
+        """Write everything pending in one transaction.
+
+        Returns (written, dropped), dropped being events that could not be
+        stored. If the database is unavailable the events go back in the
+        buffer (the oldest beyond max_pending are dropped) and the error is
+        raised.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0, 0
+            try:
+                self._write(batch)
+            except sqlite3.OperationalError:
+                self._requeue(batch)
+                raise
+            except Exception:
+                return self._write_each(batch)
+            return len(batch), 0
+
+    def _requeue(self, batch):
+        with self._lock:
+            self._pending[:0] = batch
+            dropped = max(0, len(self._pending) - self.max_pending)
+            del self._pending[:dropped]
+        if dropped:
+            raise DroppedEvents(dropped)
+
+    def _write_each(self, batch):
+        written = dropped = 0
+        for i, event in enumerate(batch):
+            try:
+                self._write([event])
+            except sqlite3.OperationalError:
+                self._requeue(batch[i:])
+                raise
+            except Exception:
+                dropped += 1
+            else:
+                written += 1
+        return written, dropped
+
+    def _write(self, batch):
+        totals = defaultdict(lambda: [0, 0, 0])  # song_id -> plays, skips, last played
+        daily = defaultdict(lambda: [0, 0])      # (song_id, day) -> plays, skips
+        for _, song_id, event, _, played_at in batch:
+            column = 0 if event == 'play' else 1
+            totals[song_id][column] += 1
+            totals[song_id][2] = max(totals[song_id][2], played_at)
+            daily[(song_id, played_at // DAY_MS)][column] += 1
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany('''INSERT INTO play_event (user_id, song_id, event, position_ms, played_at)
+                    VALUES (?, ?, ?, ?, ?)''', batch)
+                conn.executemany('''INSERT INTO track_stats (song_id, plays, skips, last_played) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(song_id) DO UPDATE SET
+                        plays = plays + excluded.plays,
+                        skips = skips + excluded.skips,
+                        last_played = MAX(last_played, excluded.last_played)''',
+                    [(song_id, *counts) for song_id, counts in totals.items()])
+                conn.executemany('''INSERT INTO track_daily (song_id, day, plays, skips) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(song_id, day) DO UPDATE SET
+                        plays = plays + excluded.plays,
+                        skips = skips + excluded.skips''',
+                    [(song_id, day, *counts) for (song_id, day), counts in daily.items()])
+        finally:
+            conn.close()
@@ -0,0 +1,59 @@
+"""Popular-song rankings from playback history and playlist additions.
+
+Each window scores songs from the cheapest table that covers it:
+  day   play_event rows of the last 24 hours, decayed by the hour
+  week  track_daily rollups of the last 7 days, decayed by the day
+  all   track_stats totals and every playlist addition, without decay
+
+A play counts 1, a skip -SKIP_WEIGHT and a playlist addition
+PLAYLIST_ADD_WEIGHT. Decay halves a bucket's weight every half-life; the
+weights go into a temporary table, so scoring is a single grouped query.
+"""
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# window -> (horizon, bucket size, half-life), all in ms
+WINDOWS = {
+    'day': (DAY_MS, HOUR_MS, 6 * HOUR_MS),
+    'week': (7 * DAY_MS, DAY_MS, 2 * DAY_MS),
+    'all': None,
+}
+SKIP_WEIGHT = 0.5
+PLAYLIST_ADD_WEIGHT = 3.0
+
+_DAY_SCORES = '''
+    SELECT song_id, CASE event WHEN 'play' THEN 1.0 ELSE -:skip END * weight AS score
+    FROM play_event JOIN decay ON decay.bucket = played_at / :bucket_ms
+    WHERE played_at >= :since'''
+_WEEK_SCORES = '''
+    SELECT song_id, (plays - :skip * skips) * weight AS score
+    FROM track_daily JOIN decay ON decay.bucket = day
+    WHERE day >= :since / :bucket_ms'''
+_RECENT_ADDITIONS = '''
+    SELECT song_id, :playlist * weight AS score
+    FROM playlistsong JOIN decay ON decay.bucket = added_at / :bucket_ms
+    WHERE added_at >= :since'''
+_ALL_TIME_SCORES = '''
+    SELECT song_id, plays - :skip * skips AS score FROM track_stats
+    UNION ALL
+    SELECT song_id, :playlist AS score FROM playlistsong'''
+
+
+def rank(conn, window, now_ms, limit):
+    """[(song_id, score)] for a window, best first (positive scores only)"""
+    params = {'skip': SKIP_WEIGHT, 'playlist': PLAYLIST_ADD_WEIGHT, 'limit': limit}
+    if WINDOWS[window] is None:
+        scores = _ALL_TIME_SCORES
+    else:
+        horizon, bucket_ms, half_life = WINDOWS[window]
+        now_bucket = now_ms // bucket_ms
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS decay (bucket INTEGER PRIMARY KEY, weight REAL NOT NULL)')
+        conn.execute('DELETE FROM decay')
+        conn.executemany('INSERT INTO decay VALUES (?, ?)', [
+            (bucket, 0.5 ** ((now_ms - bucket * bucket_ms) / half_life))
+            for bucket in range(now_bucket - horizon // bucket_ms, now_bucket + 1)])
+        params.update(bucket_ms=bucket_ms, since=now_ms - horizon)
+        scores = (_DAY_SCORES if window == 'day' else _WEEK_SCORES) + '\n    UNION ALL' + _RECENT_ADDITIONS
+    rows = conn.execute(f'''SELECT song_id, SUM(score) AS total FROM ({scores})
+        GROUP BY song_id HAVING total > 0 ORDER BY total DESC, song_id LIMIT :limit''', params).fetchall()
+    return [(row[0], row[1]) for row in rows]
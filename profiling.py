@@ -0,0 +1,128 @@
+"""On-demand request profiling.
+
+A profiled request runs under cProfile while metrics.py collects its SQL and
+upstream timing spans. The result is stored on disk as a .pstats file (open it
+with `python -m pstats` or snakeviz) next to a JSON summary, and only the most
+recent profiles are kept. Files on disk make profiles from every gunicorn
+worker visible to whichever worker serves the admin endpoint.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+
+PROFILE_ID = re.compile(r'^[0-9a-f]{32}$')
+TOP_FUNCTIONS = 25
+
+
+def start():
+    """A running profiler, or None if another profiler is already active"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+
+def _breakdown(spans, kind):
+    by_label = {}
+    for span_kind, label, seconds in spans:
+        if span_kind != kind:
+            continue
+        entry = by_label.setdefault(label, {'count': 0, 'total_ms': 0.0})
+        entry['count'] += 1
+        entry['total_ms'] += seconds * 1000
+    return {
+        'count': sum(e['count'] for e in by_label.values()),
+        'total_ms': round(sum(e['total_ms'] for e in by_label.values()), 3),
+        'by_label': {k: {'count': v['count'], 'total_ms': round(v['total_ms'], 3)}
+                     for k, v in sorted(by_label.items(), key=lambda kv: -kv[1]['total_ms'])},
+    }
+
+
+def _top_functions(stats):
+    rows = []
+    for (filename, line, func), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            'function': f"{os.path.basename(filename)}:{line}({func})",
+            'calls': ncalls,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3),
+        })
+    rows.sort(key=lambda r: -r['cumtime_ms'])
+    return rows[:TOP_FUNCTIONS]
+
+
+def save(profile_dir, keep, profiler, spans, info):
+    """Store a finished profile with its summary; returns the profile id"""
+    profile_id = uuid.uuid4().hex
+    os.makedirs(profile_dir, exist_ok=True)
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    stats.dump_stats(os.path.join(profile_dir, f"{profile_id}.pstats"))
+
+    summary = dict(info)
+    summary.update({
+        'id': profile_id,
+        'created_at': time.time(),
+        'sql': _breakdown(spans, 'sql'),
+        'upstream': _breakdown(spans, 'upstream'),
+        'top_functions': _top_functions(stats),
+    })
+    tmp_path = os.path.join(profile_dir, f"{profile_id}.json.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f)
+    os.replace(tmp_path, os.path.join(profile_dir, f"{profile_id}.json"))
+    _prune(profile_dir, keep)
+    return profile_id
+
+
+def _prune(profile_dir, keep):
+    summaries = sorted(
+        (e for e in os.scandir(profile_dir) if e.name.endswith('.json')),
+        key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in summaries[keep:]:
+        profile_id = entry.name[:-len('.json')]
+        for suffix in ('.json', '.pstats'):
+            try:
+                os.remove(os.path.join(profile_dir, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_summaries(profile_dir):
+    """Stored summaries, newest first (without the per-function tables)"""
+    if not os.path.isdir(profile_dir):
+        return []
+    summaries = []
+    for entry in os.scandir(profile_dir):
+        if not entry.name.endswith('.json'):
+            continue
+        summary = load_summary(profile_dir, entry.name[:-len('.json')])
+        if summary:
+            summary.pop('top_functions', None)
+            summaries.append(summary)
+    summaries.sort(key=lambda s: -s['created_at'])
+    return summaries
+
+
+def load_summary(profile_dir, profile_id):
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(profile_dir, f"{profile_id}.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def stats_path(profile_dir, profile_id):
+    """Path of the .pstats file for a profile id, or None"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(profile_dir, f"{profile_id}.pstats")
+    return path if os.path.exists(path) else None
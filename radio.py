@@ -0,0 +1,144 @@
+"""Song-to-song recommendations from playlist co-occurrence.
+
+Two songs are related when the same playlists contain them. The score of a
+pair is the number of playlists holding both, normalized by how many
+playlists hold each song (cosine similarity), so songs that are merely in
+every playlist do not crowd out everything else. Each song keeps its TOP_K
+best neighbors in memory; a radio request is a dict lookup.
+
+The full matrix is computed in one vectorized pass with numpy (pure Python
+without it). After that, refreshes are incremental: only playlists whose
+contents changed are re-read, and only the songs in them get new neighbor
+lists. Scores of songs outside those playlists drift slightly until the next
+full rebuild, which happens every REBUILD_EVERY refreshes.
+"""
+from collections import Counter, defaultdict
+import math
+
+try:
+    import numpy as np
+except ImportError:  # optional, the batch build falls back to pure Python
+    np = None
+
+TOP_K = 50
+MAX_PLAYLIST_SONGS = 500  # most recent songs of larger playlists (pairs grow quadratically)
+REBUILD_EVERY = 60
+
+
+class CooccurrenceIndex:
+    def __init__(self, top_k=TOP_K, max_playlist_songs=MAX_PLAYLIST_SONGS):
+        self.top_k = top_k
+        self.max_playlist_songs = max_playlist_songs
+        self._signatures = {}   # playlist id -> (songs, max row id, sum of row ids)
+        self._playlists = {}    # playlist id -> song ids
+        self._song_playlists = defaultdict(set)
+        self._neighbors = {}    # song id -> [(song id, score)], best first
+        self._refreshes = 0
+
+    def neighbors(self, song_id, limit=None):
+        return self._neighbors.get(song_id, [])[:limit]
+
+    def __len__(self):
+        return len(self._neighbors)
+
+    # --- Loading ---
+    def _read_signatures(self, conn):
+        return {row[0]: tuple(row[1:]) for row in conn.execute(
+            'SELECT playlist_id, COUNT(*), MAX(id), SUM(id) FROM playlistsong GROUP BY playlist_id')}
+
+    def _read_playlists(self, conn, playlist_ids=None):
+        query = 'SELECT playlist_id, song_id FROM playlistsong'
+        params = []
+        if playlist_ids is not None:
+            query += f" WHERE playlist_id IN ({','.join('?' * len(playlist_ids))})"
+            params = list(playlist_ids)
+        playlists = defaultdict(list)
+        for playlist_id, song_id in conn.execute(query + ' ORDER BY id DESC', params):
+            playlists[playlist_id].append(song_id)
+        return {playlist_id: list(dict.fromkeys(songs))[:self.max_playlist_songs]
+                for playlist_id, songs in playlists.items()}
+
+    def refresh(self, conn):
+        """Bring the index up to date; returns the number of songs recomputed"""
+        signatures = self._read_signatures(conn)
+        self._refreshes += 1
+        if not self._signatures or self._refreshes % REBUILD_EVERY == 0:
+            return self._rebuild(conn, signatures)
+        changed = [pid for pid in signatures.keys() | self._signatures.keys()
+                   if signatures.get(pid) != self._signatures.get(pid)]
+        if not changed:
+            return 0
+        touched = set()
+        for playlist_id in changed:
+            for song_id in self._playlists.pop(playlist_id, ()):
+                self._song_playlists[song_id].discard(playlist_id)
+                touched.add(song_id)
+        for playlist_id, songs in self._read_playlists(conn, changed).items():
+            self._playlists[playlist_id] = songs
+            for song_id in songs:
+                self._song_playlists[song_id].add(playlist_id)
+                touched.add(song_id)
+        for song_id in touched:
+            if self._song_playlists.get(song_id):
+                self._neighbors[song_id] = self._neighbors_of(song_id)
+            else:
+                self._song_playlists.pop(song_id, None)
+                self._neighbors.pop(song_id, None)
+        self._signatures = signatures
+        return len(touched)
+
+    def _neighbors_of(self, song_id):
+        counts = Counter()
+        for playlist_id in self._song_playlists[song_id]:
+            counts.update(self._playlists[playlist_id])
+        del counts[song_id]
+        degree = len(self._song_playlists[song_id])
+        scored = [(other, count / math.sqrt(degree * len(self._song_playlists[other])))
+                  for other, count in counts.items()]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return [(other, round(score, 4)) for other, score in scored[:self.top_k]]
+
+    def _rebuild(self, conn, signatures):
+        playlists = self._read_playlists(conn)
+        song_playlists = defaultdict(set)
+        for playlist_id, songs in playlists.items():
+            for song_id in songs:
+                song_playlists[song_id].add(playlist_id)
+        self._playlists, self._song_playlists, self._signatures = playlists, song_playlists, signatures
+        if np is None:
+            neighbors = {song_id: self._neighbors_of(song_id) for song_id in song_playlists}
+        else:
+            neighbors = self._rebuild_vectorized(playlists)
+        self._neighbors = neighbors
+        return len(neighbors)
+
+    def _rebuild_vectorized(self, playlists):
+        songs = sorted(self._song_playlists)
+        song_index = {song_id: i for i, song_id in enumerate(songs)}
+        n = len(songs)
+        members = [np.array([song_index[s] for s in p], dtype=np.int64) for p in playlists.values() if len(p) > 1]
+        if not members:
+            return {}
+        # Every ordered pair (a, b), a != b, of songs sharing a playlist
+        sizes = np.array([len(m) for m in members], dtype=np.int64)
+        flat = np.concatenate(members)
+        starts = np.repeat(np.cumsum(sizes) - sizes, sizes)  # playlist start, per member
+        repeat = np.repeat(sizes, sizes)                      # playlist size, per member
+        left = np.repeat(flat, repeat)
+        pair_start = np.repeat(np.cumsum(repeat) - repeat, repeat)
+        right = flat[np.repeat(starts, repeat) + np.arange(len(left)) - pair_start]
+        keep = left != right
+        keys, counts = np.unique(left[keep] * n + right[keep], return_counts=True)
+
+        degree = np.array([len(self._song_playlists[s]) for s in songs], dtype=np.float64)
+        a, b = keys // n, keys % n
+        scores = counts / np.sqrt(degree[a] * degree[b])
+        # Best first within each song, then the first top_k of each run
+        order = np.lexsort((b, -scores, a))
+        a, b, scores = a[order], b[order], scores[order]
+        first = np.searchsorted(a, a)
+        keep = np.arange(len(a)) - first < self.top_k
+        neighbors = defaultdict(list)
+        for i, j, score in zip(a[keep].tolist(), b[keep].tolist(), scores[keep].tolist()):
+            neighbors[songs[i]].append((songs[j], round(score, 4)))
+        return dict(neighbors)
@@ -0,0 +1,517 @@
+"""Compact columnar storage for the local song library.
+
+A list of per-song dicts costs several hundred bytes per track. SongStore keeps
+each field in a column instead: numbers in typed arrays, titles and filenames
+packed into one UTF-8 buffer each, and artists/albums dictionary-encoded as
+integer codes. Rows are turned back into the usual song dicts only when served.
+
+A store can be saved to a snapshot file and loaded back with mmap, so several
+processes (gunicorn workers) share one copy of the columns in the page cache.
+
+Searches scan the packed lowercase titles with the regex engine and turn match
+positions into rows with one vectorized lookup (numpy), so their cost grows
+with the number of bytes scanned rather than with Python work per song.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+import json
+import mmap
+import os
+import re
+import struct
+import urllib.parse
+
+try:
+    import numpy as np
+except ImportError:  # optional, searches fall back to pure Python
+    np = None
+
+import dedupe
+
+ID_PREFIX = 'static-'
+SNAPSHOT_MAGIC = b'SONGSTO1'
+_SEP = b'\x00'
+_HEADER = struct.Struct('<8sQ')  # magic, JSON header length
+
+# name -> typecode of every numeric column, all aligned with row order
+NUMERIC_COLUMNS = {
+    'ids': 'I',            # numeric part of "static-N"
+    'sorted_ids': 'I',     # ids in ascending order...
+    'sorted_rows': 'I',    # ...and the row each one lives at
+    'years': 'H',          # 0 = unknown
+    'durations': 'i',      # -1 = unknown
+    'bitrates': 'I',       # 0 = unknown
+    'sample_rates': 'I',   # 0 = unknown
+    'file_sizes': 'Q',
+    'mtimes': 'd',         # file mtime when indexed
+    'versions': 'q',       # catalog change stamp of the row
+    'created': 'q',        # change stamp when the file was first indexed
+    'gains': 'f',          # ReplayGain-style track gain in dB, NaN = not analysed
+    'peaks': 'f',          # true peak as linear amplitude, NaN = unknown
+    'fingerprints': 'Q',   # dedupe.audio_fingerprint, 0 = unknown
+    'tag_hashes': 'Q',     # dedupe.tag_hash, 0 = no usable title and artist
+    'canonical_rows': 'I', # row of the copy that represents this song (itself if unique)
+    'total_samples': 'Q',  # exact decoded length from the LAME tag, 0 = unknown (see gapless.py)
+    'encoder_delays': 'H',
+    'encoder_paddings': 'H',
+    'artist_codes': 'I',
+    'artist_rows': 'I',    # rows grouped by artist code (inverted index)
+    'artist_row_offsets': 'I',
+    'album_codes': 'I',
+    'album_rows': 'I',
+    'album_row_offsets': 'I',
+}
+# Fill values for columns added after snapshots already existed
+COLUMN_DEFAULTS = {'gains': float('nan'), 'peaks': float('nan'), 'fingerprints': 0, 'tag_hashes': 0,
+                   'total_samples': 0, 'encoder_delays': 0, 'encoder_paddings': 0}
+TEXT_COLUMNS = ('titles', 'search_titles', 'filenames', 'artist_values', 'album_values')
+
+
+class _TextColumn:
+    """Many strings packed into one UTF-8 buffer, addressed by byte offsets.
+
+    The buffer is bytes when built in memory, or a shared mmap (with the
+    column starting at `base`) when loaded from a snapshot.
+    """
+
+    def __init__(self, buf, offsets, base=0):
+        self.buf = buf
+        self.offsets = offsets
+        self.base = base
+
+    @classmethod
+    def build(cls, values):
+        offsets = array('I')
+        parts = []
+        pos = 0
+        for value in values:
+            data = value.encode('utf-8')
+            offsets.append(pos)
+            parts.append(data)
+            pos += len(data) + 1
+        offsets.append(pos)
+        return cls(_SEP.join(parts) + _SEP if parts else b'', offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start = self.base + self.offsets[i]
+        end = self.base + self.offsets[i + 1] - 1
+        return self.buf[start:end].decode('utf-8')
+
+    def data(self):
+        return self.buf[self.base:self.base + self.offsets[-1]]
+
+    def find_rows(self, needle):
+        """Rows whose value contains needle, ascending (a C-level scan of the packed buffer)"""
+        data = needle.encode('utf-8')
+        rows = []
+        if not data or _SEP in data:
+            return rows
+        buf, base, offsets = self.buf, self.base, self.offsets
+        end = base + offsets[-1]
+        if np is not None:
+            positions = np.fromiter((m.start() for m in re.compile(re.escape(data)).finditer(buf, base, end)),
+                                    dtype=np.int64)
+            rows = np.searchsorted(np.asarray(offsets), positions - base, side='right') - 1
+            return np.unique(rows).tolist()
+        pos = buf.find(data, base, end)
+        while pos != -1:
+            row = bisect_right(offsets, pos - base) - 1
+            rows.append(row)
+            # Skip to the next value so each row is reported once
+            pos = buf.find(data, base + offsets[row + 1], end)
+        return rows
+
+
+def _encode(values):
+    """Dictionary-encode strings: (codes, unique values, inverted rows, offsets)"""
+    index = {}
+    unique = []
+    codes = array('I')
+    for value in values:
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(unique)
+            unique.append(value)
+        codes.append(code)
+    counts = [0] * len(unique)
+    for code in codes:
+        counts[code] += 1
+    offsets = array('I', [0])
+    for count in counts:
+        offsets.append(offsets[-1] + count)
+    rows = array('I', bytes(4 * len(codes)))
+    fill = list(offsets[:-1])
+    for row, code in enumerate(codes):
+        rows[fill[code]] = row
+        fill[code] += 1
+    return codes, unique, rows, offsets
+
+
+def _float_or_nan(value):
+    return float('nan') if value is None else value
+
+
+def _nan_to_none(value, digits):
+    return None if value != value else round(value, digits)
+
+
+class SongStore(Sequence):
+    """Read-only columnar song list that behaves like a list of song dicts.
+
+    Build it from song dicts as produced by the library scan (optionally with
+    bitrate/sample_rate/file_size and mtime/version/created bookkeeping keys);
+    indexing and iteration yield fresh dicts, so callers may modify them.
+    """
+
+    def __init__(self, songs=()):
+        cols = {name: array(code) for name, code in NUMERIC_COLUMNS.items()}
+        titles = []
+        filenames = []
+        artists = []
+        albums = []
+        thumbnails = {}
+        duplicates = {}  # row -> id number of its canonical copy
+        for row, song in enumerate(songs):
+            cols['ids'].append(int(song['id'][len(ID_PREFIX):]))
+            titles.append(song['title'])
+            filenames.append(song.get('filename') or '')
+            artists.append(song.get('artist') or 'Unknown Artist')
+            albums.append(song.get('album') or 'Unknown Album')
+            cols['years'].append(song.get('year') or 0)
+            duration = song.get('duration')
+            cols['durations'].append(-1 if duration is None else duration)
+            cols['bitrates'].append(song.get('bitrate') or 0)
+            cols['sample_rates'].append(song.get('sample_rate') or 0)
+            cols['file_sizes'].append(song.get('file_size') or 0)
+            cols['mtimes'].append(song.get('mtime') or 0.0)
+            cols['versions'].append(song.get('version') or 0)
+            cols['created'].append(song.get('created') or 0)
+            cols['gains'].append(_float_or_nan(song.get('gain_db')))
+            cols['peaks'].append(_float_or_nan(song.get('peak')))
+            cols['fingerprints'].append(song.get('fingerprint') or 0)
+            gapless = song.get('gapless') or {}
+            cols['total_samples'].append(gapless.get('samples') or 0)
+            cols['encoder_delays'].append(gapless.get('delay') or 0)
+            cols['encoder_paddings'].append(gapless.get('padding') or 0)
+            tags = song.get('tag_hash')
+            cols['tag_hashes'].append(dedupe.tag_hash(song['title'], song.get('artist')) if tags is None else tags)
+            duplicate_of = song.get('duplicate_of')
+            if duplicate_of:
+                duplicates[row] = int(duplicate_of[len(ID_PREFIX):])
+            if song.get('thumbnail'):
+                thumbnails[row] = song['thumbnail']
+
+        order = sorted(range(len(cols['ids'])), key=cols['ids'].__getitem__)
+        cols['sorted_rows'] = array('I', order)
+        cols['sorted_ids'] = array('I', (cols['ids'][r] for r in order))
+        row_of_id = dict(zip(cols['sorted_ids'], order))
+        cols['canonical_rows'] = array('I', (row_of_id.get(duplicates[r], r) if r in duplicates else r
+                                             for r in range(len(cols['ids']))))
+        (cols['artist_codes'], artist_values,
+         cols['artist_rows'], cols['artist_row_offsets']) = _encode(artists)
+        (cols['album_codes'], album_values,
+         cols['album_rows'], cols['album_row_offsets']) = _encode(albums)
+
+        texts = {
+            'titles': _TextColumn.build(titles),
+            'search_titles': _TextColumn.build(title.lower() for title in titles),
+            'filenames': _TextColumn.build(filenames),
+            'artist_values': _TextColumn.build(artist_values),
+            'album_values': _TextColumn.build(album_values),
+        }
+        self._attach(cols, texts, thumbnails, None)
+
+    def _attach(self, cols, texts, thumbnails, mapped):
+        self._cols = cols
+        self._texts = texts
+        self._thumbnails = thumbnails
+        self._mmap = mapped  # keeps a loaded snapshot mapped for our lifetime
+        canonical = cols['canonical_rows']
+        self._canonical = array('I', (i for i in range(len(canonical)) if canonical[i] == i))
+        self._artist_lower = None
+        self._album_lower = None
+        self._tag_rows = None
+
+    # --- Snapshots ---
+    def save(self, path, meta=None):
+        """Write the store (plus a JSON-able meta dict) to path atomically"""
+        blobs = []
+        layout = {'numeric': {}, 'text': {}}
+        pos = 0
+
+        def add(data):
+            nonlocal pos
+            start = pos
+            blobs.append(data)
+            pos += len(data)
+            pad = -pos % 8
+            if pad:
+                blobs.append(b'\0' * pad)
+                pos += pad
+            return start
+
+        for name, code in NUMERIC_COLUMNS.items():
+            data = self._cols[name].tobytes()
+            layout['numeric'][name] = [code, add(data), len(data)]
+        for name in TEXT_COLUMNS:
+            column = self._texts[name]
+            offsets = column.offsets.tobytes()
+            data = bytes(column.data())
+            layout['text'][name] = [add(offsets), len(offsets), add(data), len(data)]
+
+        header = json.dumps({
+            'layout': layout,
+            'thumbnails': {str(k): v for k, v in self._thumbnails.items()},
+            'meta': meta or {},
+        }).encode('utf-8')
+        header += b' ' * (-(len(header) + _HEADER.size) % 8)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(SNAPSHOT_MAGIC, len(header)))
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Map a snapshot read-only. Returns (store, meta)."""
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_len = _HEADER.unpack_from(mapped, 0)
+        if magic != SNAPSHOT_MAGIC:
+            mapped.close()
+            raise ValueError(f"{path} is not a song store snapshot")
+        header = json.loads(mapped[_HEADER.size:_HEADER.size + header_len])
+        data_start = _HEADER.size + header_len
+        view = memoryview(mapped)
+
+        cols = {}
+        for name, (code, start, length) in header['layout']['numeric'].items():
+            start += data_start
+            cols[name] = view[start:start + length].cast(code)
+        for name, default in COLUMN_DEFAULTS.items():
+            if name not in cols:
+                cols[name] = array(NUMERIC_COLUMNS[name], [default]) * len(cols['ids'])
+        if 'canonical_rows' not in cols:
+            cols['canonical_rows'] = array('I', range(len(cols['ids'])))
+        texts = {}
+        for name, (off_start, off_len, start, _) in header['layout']['text'].items():
+            off_start += data_start
+            offsets = view[off_start:off_start + off_len].cast('I')
+            texts[name] = _TextColumn(mapped, offsets, base=data_start + start)
+
+        store = cls.__new__(cls)
+        thumbnails = {int(k): v for k, v in header['thumbnails'].items()}
+        store._attach(cols, texts, thumbnails, mapped)
+        return store, header['meta']
+
+    # --- Sequence protocol ---
+    def __len__(self):
+        return len(self._cols['ids'])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.row(r) for r in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('song index out of range')
+        return self.row(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    # --- Row access ---
+    def song_id(self, row):
+        return f"{ID_PREFIX}{self._cols['ids'][row]}"
+
+    def row_of(self, song_id):
+        """Row number for a song id, or None"""
+        if not isinstance(song_id, str) or not song_id.startswith(ID_PREFIX):
+            return None
+        try:
+            number = int(song_id[len(ID_PREFIX):])
+        except ValueError:
+            return None
+        sorted_ids = self._cols['sorted_ids']
+        i = bisect_left(sorted_ids, number)
+        if i < len(sorted_ids) and sorted_ids[i] == number:
+            return self._cols['sorted_rows'][i]
+        return None
+
+    def artist(self, row):
+        return self._texts['artist_values'][self._cols['artist_codes'][row]]
+
+    def album(self, row):
+        return self._texts['album_values'][self._cols['album_codes'][row]]
+
+    def filename(self, row):
+        return self._texts['filenames'][row]
+
+    def row(self, i):
+        """The song dict for row i (same shape as the library scan produces)"""
+        cols = self._cols
+        filename = self._texts['filenames'][i]
+        duration = cols['durations'][i]
+        return {
+            "id": self.song_id(i),
+            "title": self._texts['titles'][i],
+            "artist": self.artist(i),
+            "album": self.album(i),
+            "year": cols['years'][i] or None,
+            "duration": None if duration < 0 else duration,
+            "url": f"/songs/{urllib.parse.quote(filename)}",
+            "source": "static",
+            "filename": filename,
+            "thumbnail": self._thumbnails.get(i),
+            "gain_db": _nan_to_none(cols['gains'][i], 2),
+            "peak": _nan_to_none(cols['peaks'][i], 4),
+            "duplicate_of": self.duplicate_of(i),
+            "gapless": self.gapless(i),
+        }
+
+    def gapless(self, i):
+        """Encoder delay/padding and exact length in samples, or None if unknown"""
+        cols = self._cols
+        if not cols['total_samples'][i] or not cols['sample_rates'][i]:
+            return None
+        return {'delay': cols['encoder_delays'][i], 'padding': cols['encoder_paddings'][i],
+                'samples': cols['total_samples'][i], 'sample_rate': cols['sample_rates'][i]}
+
+    def tech(self, i):
+        """Technical metadata captured at index time"""
+        cols = self._cols
+        return {
+            'bitrate': cols['bitrates'][i] or None,
+            'sample_rate': cols['sample_rates'][i] or None,
+            'file_size': cols['file_sizes'][i],
+        }
+
+    def full_row(self, i):
+        song = self.row(i)
+        song.update(self.tech(i))
+        return song
+
+    def record(self, i):
+        """Everything needed to rebuild row i in a new store (includes bookkeeping)"""
+        song = self.full_row(i)
+        song.update(self.stat(i))
+        song.update(fingerprint=self._cols['fingerprints'][i], tag_hash=self._cols['tag_hashes'][i])
+        return song
+
+    def stat(self, i):
+        cols = self._cols
+        return {'mtime': cols['mtimes'][i], 'version': cols['versions'][i], 'created': cols['created'][i]}
+
+    def rows(self, rows):
+        return [self.row(r) for r in rows]
+
+    def duplicate_of(self, row):
+        """Id of the song row is a copy of, or None"""
+        canonical = self._cols['canonical_rows'][row]
+        return None if canonical == row else self.song_id(canonical)
+
+    def dedupe_entry(self, row):
+        """The row as a dedupe.find_duplicates entry"""
+        cols = self._cols
+        duration = cols['durations'][row]
+        return (self.song_id(row), cols['tag_hashes'][row], None if duration < 0 else duration,
+                cols['fingerprints'][row], cols['bitrates'][row], cols['file_sizes'][row])
+
+    def filename_rows(self):
+        """filename -> row, for incremental rescans"""
+        filenames = self._texts['filenames']
+        return {filenames[i]: i for i in range(len(self))}
+
+    # --- Queries ---
+    def _artist_codes_matching(self, needle_lower):
+        if self._artist_lower is None:
+            values = self._texts['artist_values']
+            self._artist_lower = [values[c].lower() for c in range(len(values))]
+        return [code for code, value in enumerate(self._artist_lower) if needle_lower in value]
+
+    def _artist_rows(self, code):
+        cols = self._cols
+        offsets = cols['artist_row_offsets']
+        return cols['artist_rows'][offsets[code]:offsets[code + 1]]
+
+    def search(self, query):
+        """Rows whose title or artist contains query (case-insensitive), in row order"""
+        needle = query.lower()
+        title_rows = self._texts['search_titles'].find_rows(needle)
+        codes = self._artist_codes_matching(needle)
+        if np is not None:
+            matches = np.isin(np.asarray(self._cols['artist_codes']), codes)
+            matches[title_rows] = True
+            return np.flatnonzero(matches).tolist()
+        matches = set(title_rows)
+        for code in codes:
+            matches.update(self._artist_rows(code))
+        return sorted(matches)
+
+    def rows_by_artist(self, query):
+        """Rows whose artist contains query (case-insensitive)"""
+        matches = set()
+        for code in self._artist_codes_matching(query.lower()):
+            matches.update(self._artist_rows(code))
+        return sorted(matches)
+
+    def collapse(self, rows):
+        """Map rows to their canonical copies, dropping repeats (order kept)"""
+        canonical = self._cols['canonical_rows']
+        return list(dict.fromkeys(canonical[r] for r in rows))
+
+    def canonical(self):
+        """Rows that are not a copy of another song (computed once; do not modify)"""
+        return self._canonical
+
+    def duplicate_groups(self):
+        """canonical row -> rows of its copies, for songs that have any"""
+        canonical = self._cols['canonical_rows']
+        groups = {}
+        for i in range(len(self)):
+            if canonical[i] != i:
+                groups.setdefault(canonical[i], []).append(i)
+        return groups
+
+    def rows_matching_tags(self, tag_hash, duration=None):
+        """Canonical rows with the given dedupe.tag_hash and a compatible duration"""
+        if self._tag_rows is None:
+            tag_rows = {}
+            hashes, canonical = self._cols['tag_hashes'], self._cols['canonical_rows']
+            for i in range(len(self)):
+                if hashes[i] and canonical[i] == i:
+                    tag_rows.setdefault(hashes[i], []).append(i)
+            self._tag_rows = tag_rows
+        durations = self._cols['durations']
+        return [i for i in self._tag_rows.get(tag_hash, ())
+                if dedupe.same_duration(duration, None if durations[i] < 0 else durations[i])]
+
+    def changed_since(self, version):
+        """Rows whose change stamp is newer than version"""
+        versions = self._cols['versions']
+        return [i for i in range(len(self)) if versions[i] > version]
+
+    def total_duration(self):
+        return sum(d for d in self._cols['durations'] if d > 0)
+
+    def total_file_size(self):
+        return sum(self._cols['file_sizes'])
+
+    def years(self):
+        return [y for y in self._cols['years'] if y]
+
+    def album_names(self):
+        values = self._texts['album_values']
+        return [values[c] for c in range(len(values))]
+
+    def artist_names(self):
+        values = self._texts['artist_values']
+        return [values[c] for c in range(len(values))]
@@ -102,13 +102,15 @@ class MusicPlayer {
     async loadSongs() {
         try {
             this.showLoading();
-            const response = await fetch('/api/songs');
+            // The service worker answers this from its offline copy and syncs deltas
+            const response = await fetch('/api/catalog');
             
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             
-            this.songs = await response.json();
+            const catalog = await response.json();
+            this.songs = catalog.songs;
             this.renderSongList();
             this.setupSearch(); 
             this.hideLoading();
@@ -0,0 +1,133 @@
+"""Waveform peaks for seek-bar rendering.
+
+Audio is decoded once with ffmpeg (mono, 8 kHz is plenty for drawing) into
+min/max pairs, which are stored at a few fixed resolutions so any bar width
+can be drawn from the nearest one without touching the audio again.
+
+Stored file:   magic b'PEAKS', u8 version, u16 levels, u32 duration_ms,
+               then per level: u32 buckets + buckets * (int8 min, int8 max)
+Served level:  magic b'PEAK', u16 version, u16 reserved, u32 buckets,
+               u32 duration_ms (16 bytes), then buckets * (int8 min, int8 max)
+
+All integers are little-endian; min/max are scaled to -127..127, so a client
+can draw straight from `new Int8Array(buffer, 16)`.
+"""
+from array import array
+import os
+import shutil
+import struct
+import subprocess
+import sys
+
+LEVELS = (256, 1024, 4096)  # buckets per track
+DECODE_RATE = 8000  # Hz
+BASE_BLOCK = 80  # samples per base min/max pair (10 ms at 8 kHz)
+
+_FILE_HEADER = struct.Struct('<5sBHI')
+_LEVEL_HEADER = struct.Struct('<I')
+_RESPONSE_HEADER = struct.Struct('<4sHHII')
+_VERSION = 1
+
+
+class DecoderUnavailable(Exception):
+    """ffmpeg is not installed (or FFMPEG points nowhere)"""
+
+
+def ffmpeg_path():
+    return shutil.which(os.environ.get('FFMPEG', 'ffmpeg'))
+
+
+def _decode(path, ffmpeg):
+    """Yield mono signed 16-bit sample arrays of the decoded file"""
+    command = [ffmpeg, '-v', 'error', '-nostdin', '-i', path,
+               '-ac', '1', '-ar', str(DECODE_RATE), '-f', 's16le', '-']
+    # Analysis is background work; let request handling have the CPU first
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               preexec_fn=(lambda: os.nice(10)) if os.name == 'posix' else None)
+    try:
+        leftover = b''
+        while True:
+            chunk = process.stdout.read(BASE_BLOCK * 2 * 1000)
+            if not chunk:
+                break
+            chunk = leftover + chunk
+            usable = len(chunk) - len(chunk) % 2
+            samples = array('h')
+            samples.frombytes(chunk[:usable])
+            if sys.byteorder == 'big':
+                samples.byteswap()
+            leftover = chunk[usable:]
+            yield samples
+        stderr = process.stderr.read()
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed ({returncode}): {stderr.decode(errors='replace')[:200]}")
+
+
+def compute(path):
+    """(duration_ms, {buckets: array of interleaved int8 min/max}) for an audio file"""
+    ffmpeg = ffmpeg_path()
+    if not ffmpeg:
+        raise DecoderUnavailable()
+    mins, maxs = array('h'), array('h')
+    pending = array('h')
+    total = 0
+    for samples in _decode(path, ffmpeg):
+        total += len(samples)
+        pending.extend(samples)
+        usable = len(pending) - len(pending) % BASE_BLOCK
+        for start in range(0, usable, BASE_BLOCK):
+            block = pending[start:start + BASE_BLOCK]
+            mins.append(min(block))
+            maxs.append(max(block))
+        del pending[:usable]
+    if pending:
+        mins.append(min(pending))
+        maxs.append(max(pending))
+
+    levels = {}
+    for buckets in LEVELS:
+        peaks = array('b')
+        n = len(mins)
+        for i in range(buckets if n else 0):
+            start, end = i * n // buckets, max((i + 1) * n // buckets, i * n // buckets + 1)
+            peaks.append(min(mins[start:end]) * 127 // 32768)
+            peaks.append(max(maxs[start:end]) * 127 // 32767)
+        levels[buckets] = peaks
+    return total * 1000 // DECODE_RATE, levels
+
+
+def save(path, duration_ms, levels):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_FILE_HEADER.pack(b'PEAKS', _VERSION, len(levels), duration_ms))
+        for buckets, peaks in sorted(levels.items()):
+            f.write(_LEVEL_HEADER.pack(len(peaks) // 2))
+            f.write(peaks.tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_level(path, buckets):
+    """Response body for the stored level closest to `buckets` (at least it, if
+    stored), or None if there is no waveform at path"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    magic, version, count, duration_ms = _FILE_HEADER.unpack_from(data, 0)
+    if magic != b'PEAKS' or version != _VERSION:
+        return None
+    offset = _FILE_HEADER.size
+    stored = []
+    for _ in range(count):
+        (n,) = _LEVEL_HEADER.unpack_from(data, offset)
+        offset += _LEVEL_HEADER.size
+        stored.append((n, data[offset:offset + 2 * n]))
+        offset += 2 * n
+    candidates = [level for level in stored if level[0] >= buckets]
+    n, peaks = min(candidates) if candidates else max(stored)
+    return _RESPONSE_HEADER.pack(b'PEAK', _VERSION, 0, n, duration_ms) + peaks